@@ -3,7 +3,7 @@ from __future__ import print_function
 import os
 import cherrypy
 import sys
-from pytextarchive.parse_message_file import services_to_html_from_file, to_json_from_file, to_yaml_from_file
+from pytextarchive.parse_message_file import services_to_html_from_file, to_json_from_file, to_yaml_from_file, enable_parse_cache
 
 HTML_START = '''<!DOCTYPE html>
 <html lang="en">
@@ -93,4 +93,5 @@ config = {
 }
 
 if __name__ == "__main__":
+    enable_parse_cache()
     cherrypy.quickstart(ArchiveBrowser(), '/', config)
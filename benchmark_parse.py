@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals, generators, with_statement, nested_scopes
+import argparse
+import os
+import timeit
+import sys
+from pytextarchive.parse_message_file import (
+    open_compressed_file, parse_lines, services_to_string
+)
+
+# The original if/elif cascade parser, kept as a test fixture.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests'))
+from cascade_parser import parse_lines as parse_lines_cascade, without_post_ids
+
+def build_synthetic_services(num_services, num_users, num_threads, posts_per_thread, body_lines):
+    """ Build a message board style services list for benchmarking. """
+    services = []
+    for entry in range(1, num_services + 1):
+        users = {}
+        for user_id in range(1, num_users + 1):
+            users[user_id] = {
+                'Name': "User {0}".format(user_id),
+                'Handle': "@user{0}".format(user_id),
+                'Location': "Earth",
+                'Joined': "Jan 1, 2024",
+                'Birthday': "Jan 1, 1990",
+                'ExtraFields': "",
+                'Bio': "Bio line for user {0}.".format(user_id),
+                'Signature': "",
+            }
+        threads = []
+        for thread_id in range(1, num_threads + 1):
+            messages = []
+            for post_id in range(1, posts_per_thread + 1):
+                messages.append({
+                    'Author': "@user{0}".format(post_id % num_users + 1),
+                    'AuthorID': post_id % num_users + 1,
+                    'Time': "10:00 AM",
+                    'Date': "Jan 15, 2024",
+                    'EditAuthorID': 0,
+                    'SubType': "Post" if post_id == 1 else "Reply",
+                    'SubTitle': "Thread {0}".format(thread_id),
+                    'Post': post_id,
+                    'PinnedID': 0,
+                    'Nested': 0 if post_id == 1 else post_id - 1,
+                    'Message': "\n".join("Body line {0} of post {1}.".format(i, post_id) for i in range(body_lines)),
+                })
+            threads.append({
+                'Thread': thread_id,
+                'Title': "Thread {0}".format(thread_id),
+                'Type': "Topic",
+                'State': "Active",
+                'Category': ["General"],
+                'Forum': ["General Discussion"],
+                'Messages': messages,
+            })
+        services.append({
+            'Entry': entry,
+            'Service': "Benchmark Board {0}".format(entry),
+            'ServiceType': "Message Board",
+            'ServiceLocation': "https://example.com/",
+            'TimeZone': "UTC",
+            'Info': "Synthetic archive for parser benchmarks.",
+            'Interactions': ["Topic", "Post", "Reply"],
+            'Status': ["Active"],
+            'Categorization': {'Categories': ["General"], 'Forums': ["General Discussion"]},
+            'Categories': [
+                {'Type': "Categories", 'Level': "Main Category", 'ID': 1, 'InSub': 0, 'Headline': "General", 'Description': "General"},
+                {'Type': "Forums", 'Level': "Main Forum", 'ID': 2, 'InSub': 0, 'Headline': "General Discussion", 'Description': "General"},
+            ],
+            'Users': users,
+            'MessageThreads': threads,
+        })
+    return services
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the table driven parser with the original if/elif cascade.")
+    parser.add_argument("filename", nargs="?", help="Archive to parse (a synthetic archive is generated when omitted)")
+    parser.add_argument("--services", type=int, default=2, help="Synthetic services")
+    parser.add_argument("--users", type=int, default=50, help="Synthetic users per service")
+    parser.add_argument("--threads", type=int, default=200, help="Synthetic threads per service")
+    parser.add_argument("--posts", type=int, default=20, help="Synthetic posts per thread")
+    parser.add_argument("--body-lines", type=int, default=3, help="Synthetic lines per message body")
+    parser.add_argument("--repeat", "-r", type=int, default=3, help="Timing runs per parser (best is reported)")
+    args = parser.parse_args()
+
+    if args.filename:
+        with open_compressed_file(args.filename) as file:
+            lines = file.readlines()
+    else:
+        services = build_synthetic_services(args.services, args.users, args.threads, args.posts, args.body_lines)
+        lines = services_to_string(services).splitlines(True)
+
+    if parse_lines(lines) != without_post_ids(parse_lines_cascade(lines)):
+        print("Parsers disagree on the parsed services.", file=sys.stderr)
+        sys.exit(1)
+
+    print("Lines: {0}".format(len(lines)))
+    results = []
+    for name, func in (("cascade", parse_lines_cascade), ("table", parse_lines)):
+        best = min(timeit.repeat(lambda: func(lines), number=1, repeat=args.repeat))
+        results.append(best)
+        print("{0:>8}: {1:.3f}s ({2:,.0f} lines/s)".format(name, best, len(lines) / best))
+    print(" speedup: {0:.2f}x".format(results[0] / results[1]))
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,8 @@ import sys
 from pytextarchive.parse_message_file import (
     parse_file, display_services, to_json, from_json, load_from_json_file, save_to_json_file,
     services_to_string, save_services_to_file, services_to_html, save_services_to_html_file,
-    to_yaml, from_yaml, load_from_yaml_file, save_to_yaml_file
+    to_yaml, from_yaml, load_from_yaml_file, save_to_yaml_file, to_jsonl, from_jsonl, ParseStats, set_include_workers,
+    enable_parse_cache, save_to_sqlite, load_from_sqlite, write_html_site
 )
 
 def main():
@@ -17,15 +18,35 @@ def main():
     parser.add_argument("--verbose", "-V", action="store_true", help="Enable verbose mode")
     parser.add_argument("--debug", "-d", action="store_true", help="Enable debug mode")
     parser.add_argument("--to-json", "-j", help="Convert the parsed data to JSON and save to a file")
+    parser.add_argument("--compact-json", action="store_true", help="Write --to-json output without indentation")
     parser.add_argument("--from-json", "-J", help="Load the services data structure from a JSON file")
     parser.add_argument("--json-string", "-s", type=str, help="JSON string to parse if --from-json is specified")
+    parser.add_argument("--to-jsonl", help="Stream the parsed posts as JSON Lines to a file")
+    parser.add_argument("--from-jsonl", help="Load the services data structure from a JSON Lines file")
+    parser.add_argument("--to-sqlite", help="Stream the parsed services into an SQLite database")
+    parser.add_argument("--from-sqlite", help="Load the services data structure from an SQLite database")
     parser.add_argument("--to-yaml", "-y", help="Convert the parsed data to YAML and save to a file")
     parser.add_argument("--from-yaml", "-Y", help="Load the services data structure from a YAML file")
     parser.add_argument("--yaml-string", "-S", type=str, help="YAML string to parse if --from-json is specified")
     parser.add_argument("--to-html", "-H", help="Convert the parsed data to HTML and save to a file")
+    parser.add_argument("--to-html-site", help="Write the parsed data as a paginated multi-page HTML site into a directory")
+    parser.add_argument("--posts-per-page", type=int, default=50, help="Posts per thread page of --to-html-site")
+    parser.add_argument("--users-per-page", type=int, default=100, help="Users per user list page of --to-html-site")
+    parser.add_argument("--incremental", action="store_true", help="With --to-html-site, only rewrite the pages whose content changed since the last build")
     parser.add_argument("--to-original", "-o", help="Convert the parsed data back to the original format and save to a file")
     parser.add_argument("--line-ending", "-l", choices=["lf", "cr", "crlf"], default="lf", help="Specify the line ending format for the output file")
+    parser.add_argument("--mmap", "-m", action="store_true", help="Parse uncompressed files through a memory map")
+    parser.add_argument("--processes", "-p", type=int, help="Parse the services of an uncompressed file on this many processes (0 for one per CPU)")
+    parser.add_argument("--include-workers", type=int, help="Parse included files on at most this many processes (default 1 parses them inline, 0 uses every CPU)")
+    parser.add_argument("--cache", action="store_true", help="Load an unchanged archive from its cached snapshot instead of parsing it (not with --mmap, --processes or --stats)")
+    parser.add_argument("--cache-dir", help="Directory of the parse cache (default ~/.cache/pytextarchive)")
+    parser.add_argument("--stats", help="Save parser statistics (section counts and timings) as JSON to a file")
     args = parser.parse_args()
+    stats = ParseStats() if args.stats else None
+    if args.include_workers is not None:
+        set_include_workers(args.include_workers)
+    if args.cache:
+        enable_parse_cache(args.cache_dir)
 
     try:
         if args.from_json:
@@ -34,20 +55,34 @@ def main():
             else:
                 services = load_from_json_file(args.from_json)
             display_services(services)
+        elif args.from_jsonl:
+            display_services(from_jsonl(args.from_jsonl))
+        elif args.from_sqlite:
+            display_services(load_from_sqlite(args.from_sqlite))
+        elif args.to_sqlite:
+            save_to_sqlite(args.filename, args.to_sqlite)
+            print("Saved SQLite database to {0}".format(args.to_sqlite))
+        elif args.to_html_site:
+            index = write_html_site(args.filename, args.to_html_site, args.posts_per_page, args.users_per_page,
+                                    incremental=args.incremental)
+            print("Saved HTML site to {0}".format(index))
+        elif args.to_jsonl:
+            to_jsonl(args.filename, args.to_jsonl)
+            print("Saved JSON Lines to {0}".format(args.to_jsonl))
         else:
             if args.validate_only:
-                is_valid, error_message, error_line = parse_file(args.filename, validate_only=True, verbose=args.verbose)
+                is_valid, error_message, error_line = parse_file(args.filename, validate_only=True, verbose=args.verbose, use_mmap=args.mmap, hooks=stats, processes=args.processes)
                 if is_valid:
                     print("The file '{0}' is valid.".format(args.filename))
                 else:
                     print("Validation Error: {0}".format(error_message))
                     print("Line: {0}".format(error_line.strip()))
             else:
-                services = parse_file(args.filename, verbose=args.verbose)
+                services = parse_file(args.filename, verbose=args.verbose, use_mmap=args.mmap, hooks=stats, processes=args.processes)
                 if args.debug:
                     import pdb; pdb.set_trace()
                 if args.to_json:
-                    save_to_json_file(services, args.to_json)
+                    save_to_json_file(services, args.to_json, indent=None if args.compact_json else 2)
                     print("Saved JSON to {0}".format(args.to_json))
                 elif args.to_yaml:
                     save_to_yaml_file(services, args.to_yaml)
@@ -60,6 +95,9 @@ def main():
                     print("Saved original format to {0}".format(args.to_original))
                 else:
                     display_services(services)
+            if stats is not None:
+                stats.save_json(args.stats)
+                print("Saved parser statistics to {0}".format(args.stats))
     except Exception as e:
         print("An error occurred: {0}".format(e), file=sys.stderr)
         sys.exit(1)
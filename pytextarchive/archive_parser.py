@@ -8,6 +8,7 @@ import io
 import gzip
 import os
 import sys
+from pytextarchive.bytelines import read_archive_bytes, strip_bytes
 
 try:
     import yaml
@@ -15,12 +16,6 @@ try:
 except ImportError:
     HAS_YAML = False
 
-def open_text_file(filepath):
-    if filepath.endswith(".gz"):
-        return gzip.open(filepath, 'rt')
-    else:
-        return io.open(filepath, 'r', encoding='utf-8')
-
 __program_name__ = "PyTextArchive"
 __project__ = __program_name__
 __project_url__ = "https://github.com/GameMaker2k/PyTextArchive"
@@ -78,8 +73,8 @@ def add_message_post(thread, message_dict):
 def parse_txt_archive(filepath):
     service = init_empty_service("default-entry", "MessageBoard", "MessageBoard", "", "UTC", "")
 
-    with open_text_file(filepath) as f:
-        lines = f.readlines()
+    # Lines stay bytes; only the values that are kept get decoded.
+    lines = read_archive_bytes(filepath).splitlines()
 
     current_section = None
     user = {}
@@ -88,114 +83,115 @@ def parse_txt_archive(filepath):
     message = {}
 
     for line in lines:
-        line = line.strip()
-
-        if line.startswith("--- Start Info Body ---"):
-            current_section = "info"
-            continue
-        elif line.startswith("--- End Info Body ---"):
-            current_section = None
-            continue
-        elif line.startswith("--- Start User Info ---"):
-            user = {}
-            current_section = "user"
-            continue
-        elif line.startswith("--- End User Info ---"):
-            add_user(service, user.get("ID", "unknown_{}".format(len(service["Users"]))), user)
-            user = {}
-            current_section = None
-            continue
-        elif line.startswith("--- Start ExtraFields Body ---"):
-            current_section = "user_extrafields"
-            user["ExtraFields"] = ""
-            continue
-        elif line.startswith("--- End ExtraFields Body ---"):
-            current_section = "user"
-            continue
-        elif line.startswith("--- Start Bio Body ---"):
-            current_section = "user_bio"
-            user["Bio"] = ""
-            continue
-        elif line.startswith("--- End Bio Body ---"):
-            current_section = "user"
-            continue
-        elif line.startswith("--- Start Signature Body ---"):
-            current_section = "user_signature"
-            user["Signature"] = ""
-            continue
-        elif line.startswith("--- End Signature Body ---"):
-            current_section = "user"
-            continue
-        elif line.startswith("--- Start Category List ---"):
-            category = {}
-            current_section = "category"
-            continue
-        elif line.startswith("--- End Category List ---"):
-            add_category(service, category)
-            category = {}
-            current_section = None
-            continue
-        elif line.startswith("--- Start Description Body ---"):
-            current_section = "category_desc"
-            category["Description"] = ""
-            continue
-        elif line.startswith("--- End Description Body ---"):
-            current_section = "category"
-            continue
-        elif line.startswith("--- Start Message Thread ---"):
-            thread = {"Messages": []}
-            current_section = "thread"
-            continue
-        elif line.startswith("--- End Message Thread ---"):
-            add_message_thread(service, thread)
-            thread = {}
-            current_section = None
-            continue
-        elif line.startswith("--- Start Message Post ---"):
-            message = {}
-            current_section = "message"
-            continue
-        elif line.startswith("--- End Message Post ---"):
-            add_message_post(thread, message)
-            message = {}
-            current_section = "thread"
-            continue
-        elif line.startswith("--- Start Message Body ---"):
-            current_section = "message_body"
-            message["Message"] = ""
-            continue
-        elif line.startswith("--- End Message Body ---"):
-            current_section = "message"
-            continue
+        line = strip_bytes(line)
+
+        if line[:4] == b"--- ":
+            if line.startswith(b"--- Start Info Body ---"):
+                current_section = "info"
+                continue
+            elif line.startswith(b"--- End Info Body ---"):
+                current_section = None
+                continue
+            elif line.startswith(b"--- Start User Info ---"):
+                user = {}
+                current_section = "user"
+                continue
+            elif line.startswith(b"--- End User Info ---"):
+                add_user(service, user.get("ID", "unknown_{}".format(len(service["Users"]))), user)
+                user = {}
+                current_section = None
+                continue
+            elif line.startswith(b"--- Start ExtraFields Body ---"):
+                current_section = "user_extrafields"
+                user["ExtraFields"] = ""
+                continue
+            elif line.startswith(b"--- End ExtraFields Body ---"):
+                current_section = "user"
+                continue
+            elif line.startswith(b"--- Start Bio Body ---"):
+                current_section = "user_bio"
+                user["Bio"] = ""
+                continue
+            elif line.startswith(b"--- End Bio Body ---"):
+                current_section = "user"
+                continue
+            elif line.startswith(b"--- Start Signature Body ---"):
+                current_section = "user_signature"
+                user["Signature"] = ""
+                continue
+            elif line.startswith(b"--- End Signature Body ---"):
+                current_section = "user"
+                continue
+            elif line.startswith(b"--- Start Category List ---"):
+                category = {}
+                current_section = "category"
+                continue
+            elif line.startswith(b"--- End Category List ---"):
+                add_category(service, category)
+                category = {}
+                current_section = None
+                continue
+            elif line.startswith(b"--- Start Description Body ---"):
+                current_section = "category_desc"
+                category["Description"] = ""
+                continue
+            elif line.startswith(b"--- End Description Body ---"):
+                current_section = "category"
+                continue
+            elif line.startswith(b"--- Start Message Thread ---"):
+                thread = {"Messages": []}
+                current_section = "thread"
+                continue
+            elif line.startswith(b"--- End Message Thread ---"):
+                add_message_thread(service, thread)
+                thread = {}
+                current_section = None
+                continue
+            elif line.startswith(b"--- Start Message Post ---"):
+                message = {}
+                current_section = "message"
+                continue
+            elif line.startswith(b"--- End Message Post ---"):
+                add_message_post(thread, message)
+                message = {}
+                current_section = "thread"
+                continue
+            elif line.startswith(b"--- Start Message Body ---"):
+                current_section = "message_body"
+                message["Message"] = ""
+                continue
+            elif line.startswith(b"--- End Message Body ---"):
+                current_section = "message"
+                continue
 
         if current_section == "info":
-            service["Info"] += line + "\n"
+            service["Info"] += line.decode("utf-8") + "\n"
         elif current_section == "user":
-            if ":" in line:
-                k, v = line.split(":", 1)
-                user[k.strip()] = v.strip()
+            if b":" in line:
+                k, v = line.split(b":", 1)
+                user[k.decode("utf-8").strip()] = v.decode("utf-8").strip()
         elif current_section == "user_extrafields":
-            user["ExtraFields"] += line + "\n"
+            user["ExtraFields"] += line.decode("utf-8") + "\n"
         elif current_section == "user_bio":
-            user["Bio"] += line + "\n"
+            user["Bio"] += line.decode("utf-8") + "\n"
         elif current_section == "user_signature":
-            user["Signature"] += line + "\n"
+            user["Signature"] += line.decode("utf-8") + "\n"
         elif current_section == "category":
-            if ":" in line:
-                k, v = line.split(":", 1)
-                category[k.strip()] = v.strip()
+            if b":" in line:
+                k, v = line.split(b":", 1)
+                category[k.decode("utf-8").strip()] = v.decode("utf-8").strip()
         elif current_section == "category_desc":
-            category["Description"] += line + "\n"
+            category["Description"] += line.decode("utf-8") + "\n"
         elif current_section == "thread":
-            if ":" in line:
-                k, v = line.split(":", 1)
-                thread[k.strip()] = v.strip()
+            if b":" in line:
+                k, v = line.split(b":", 1)
+                thread[k.decode("utf-8").strip()] = v.decode("utf-8").strip()
         elif current_section == "message":
-            if ":" in line:
-                k, v = line.split(":", 1)
-                message[k.strip()] = v.strip()
+            if b":" in line:
+                k, v = line.split(b":", 1)
+                message[k.decode("utf-8").strip()] = v.decode("utf-8").strip()
         elif current_section == "message_body":
-            message["Message"] += line + "\n"
+            message["Message"] += line.decode("utf-8") + "\n"
 
     return service
 
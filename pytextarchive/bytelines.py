@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals, generators, with_statement, nested_scopes
+import codecs
+import bz2
+import gzip
+import io
+import re
+import sys
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+    try:
+        import pyzstd.zstdfile
+    except ImportError:
+        pass
+
+try:
+    import lzo
+except ImportError:
+    lzo = None
+
+# Byte level line tokenizer and archive reader shared by parse_message_file,
+# mini_parser and archive_parser.  It only needs the standard library (and
+# the compression modules the parsers support when they are installed), so
+# the smaller parsers can use it without importing parse_message_file.
+
+# Byte order marks of the Unicode archives get_file_encoding recognizes,
+# UTF-32 first since its little endian BOM starts with the UTF-16 one.
+_BOMS = ((codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+         (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+def utf8_archive_bytes(data):
+    """
+    The bytes of an archive as UTF-8.  UTF-16 and UTF-32 archives are
+    decoded by their BOM and re-encoded; everything else is returned
+    undecoded.
+    """
+    for bom, codec in _BOMS:
+        if data.startswith(bom):
+            return data.decode(codec).encode('utf-8')
+    return data
+
+# Magic bytes of the zlib streams ZlibFile writes and of LzopFile files.
+_ZLIB_HEADERS = (b'\x78\x01', b'\x78\x5E', b'\x78\x9C', b'\x78\xDA')
+_LZOP_MAGIC = b'\x89LZO\x0D\x0A\x1A\n'
+
+def open_archive_input(filename):
+    """
+    Open a (possibly compressed) archive for binary reading, picking the
+    codec by extension like open_compressed_file.  zlib and LZO archives
+    are decompressed into memory, as ZlibFile and LzopFile do.
+    """
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rb')
+    elif filename.endswith('.bz2'):
+        return bz2.open(filename, 'rb')
+    elif filename.endswith('.xz') or filename.endswith('.lzma'):
+        if lzma:
+            return lzma.open(filename, 'rb')
+        else:
+            raise ImportError("lzma module is not available")
+    elif filename.endswith('.zl') or filename.endswith('.zz'):
+        with io.open(filename, 'rb') as file:
+            data = file.read()
+        if not data.startswith(_ZLIB_HEADERS):
+            raise ValueError("Invalid zlib file header")
+        return io.BytesIO(zlib.decompress(data))
+    elif filename.endswith('.lzo') and lzo is not None:
+        with io.open(filename, 'rb') as file:
+            data = file.read()
+        if not data.startswith(_LZOP_MAGIC):
+            raise ValueError("Invalid LZOP file header (magic bytes missing)")
+        try:
+            return io.BytesIO(lzo.decompress(data[len(_LZOP_MAGIC):]))
+        except lzo.error as e:
+            raise ValueError("LZO decompression failed: {0}".format(e))
+    elif filename.endswith('.zst') and zstandard is not None:
+        return zstandard.open(filename, 'rb')
+    elif filename.endswith('.zst') and 'pyzstd.zstdfile' in sys.modules:
+        return pyzstd.zstdfile.ZstdFile(filename, mode='rb')
+    else:
+        return io.open(filename, 'rb')
+
+def read_archive_bytes(filename):
+    """
+    Read a (possibly compressed) archive as UTF-8 bytes for the byte level
+    tokenizer shared by the parsers.  UTF-16 and UTF-32 archives are decoded
+    by their BOM and re-encoded, so callers only ever see UTF-8; everything
+    else is returned undecoded.
+    """
+    with open_archive_input(filename) as file:
+        return utf8_archive_bytes(file.read())
+
+# Bytes that bytes.strip() and str.strip() agree never to strip.
+_PLAIN_BYTES = frozenset(range(0x21, 0x80))
+
+def strip_bytes(line):
+    """
+    line.strip() for a line of UTF-8 bytes.  Only lines that start or end
+    with a byte bytes.strip() may treat differently from str.strip() (non
+    ASCII, or control characters) are decoded to be stripped.
+    """
+    stripped = line.strip()
+    if stripped and (stripped[0] not in _PLAIN_BYTES or stripped[-1] not in _PLAIN_BYTES):
+        stripped = line.decode('utf-8').strip().encode('utf-8')
+    return stripped
+
+def rstrip_bytes(line):
+    """ line.rstrip() for a line of UTF-8 bytes, see strip_bytes. """
+    stripped = line.rstrip()
+    if stripped and stripped[-1] not in _PLAIN_BYTES:
+        stripped = line.decode('utf-8').rstrip().encode('utf-8')
+    return stripped
+
+_MARKER_BYTES = re.compile(br'--- (Start|End) (.*) ---\Z')
+
+def split_marker_bytes(line):
+    """
+    Split a '--- Start Name ---' or '--- End Name ---' line given as bytes
+    into (b'Start' or b'End', name bytes); None for any other line.
+    """
+    if line[:4] != b'--- ':
+        return None
+    match = _MARKER_BYTES.match(line)
+    return match.groups() if match else None
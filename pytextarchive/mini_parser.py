@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import absolute_import, division, print_function, unicode_literals, generators, with_statement, nested_scopes
-import re
 import sys
 import json
 from collections import OrderedDict
@@ -14,6 +13,7 @@ import marshal
 import pickle
 import ast
 import binascii
+from pytextarchive.bytelines import read_archive_bytes, strip_bytes, rstrip_bytes, split_marker_bytes
 
 # StringIO and BytesIO
 try:
@@ -868,6 +868,14 @@ def save_compressed_file(data, filename):
 
 def parse_archive(content):
     """Properly parse the archive format maintaining all hierarchical data"""
+    return parse_archive_lines(content.encode('utf-8').split(b'\n'))
+
+def parse_archive_lines(lines):
+    """
+    parse_archive over the lines of a UTF-8 archive given as bytes.  Markers
+    and key separators are found on the bytes; only section names, keys and
+    values that are kept get decoded, and each body once as a whole.
+    """
     data = OrderedDict()
     stack = []
     current = data
@@ -877,17 +885,14 @@ def parse_archive(content):
     body_content = []
     body_name = None
     
-    lines = content.split('\n')
-    
     for line in lines:
-        line = line.rstrip()
+        line = rstrip_bytes(line)
         
         # Check for section markers
-        start_match = re.match(r'^--- Start (.*) ---$', line)
-        end_match = re.match(r'^--- End (.*) ---$', line)
+        marker = split_marker_bytes(line)
         
-        if start_match:
-            section_name = start_match.group(1)
+        if marker is not None and marker[0] == b'Start':
+            section_name = marker[1].decode('utf-8')
             
             # Handle body sections
             if 'Body' in section_name:
@@ -915,17 +920,17 @@ def parse_archive(content):
             current_section = None
             continue
             
-        if end_match:
-            section_name = end_match.group(1)
+        if marker is not None:
+            section_name = marker[1].decode('utf-8')
             
             # Handle body sections
             if 'Body' in section_name:
                 body_mode = False
                 if body_name and body_content:
                     # Remove trailing empty lines
-                    while body_content and not body_content[-1].strip():
+                    while body_content and not strip_bytes(body_content[-1]):
                         body_content.pop()
-                    current[body_name] = '\n'.join(body_content)
+                    current[body_name] = b'\n'.join(body_content).decode('utf-8')
                 body_name = None
                 body_content = []
                 continue
@@ -941,28 +946,27 @@ def parse_archive(content):
             continue
             
         # Handle key-value pairs
-        if ': ' in line:
-            key, value = line.split(': ', 1)
+        separator = line.find(b': ')
+        if separator >= 0:
+            key, value = line[:separator].decode('utf-8'), line[separator + 2:].decode('utf-8')
             current_key = key
             current_section = None
             current[key] = value
-        elif line.endswith(':'):
-            current_key = line[:-1]
+        elif line.endswith(b':'):
+            current_key = line[:-1].decode('utf-8')
             current_section = None
             current[current_key] = ''
-        elif current_key and line.strip():
+        elif current_key and strip_bytes(line):
             # Append to previous value
-            current[current_key] += '\n' + line
-        elif line.strip():
+            current[current_key] += '\n' + line.decode('utf-8')
+        elif strip_bytes(line):
             # Potential section name without key-value pair
-            current_section = line.strip()
+            current_section = strip_bytes(line).decode('utf-8')
     
     return data
 
 def parse_file(filename, validate_only=False, verbose=False):
-    with open_compressed_file(filename) as file:
-        lines = file.read()
-    return parse_archive(lines)
+    return parse_archive_lines(read_archive_bytes(filename).splitlines())
 
 def parse_string(data, validate_only=False, verbose=False):
     lines = StringIO(data).read()
@@ -3,12 +3,21 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals, generators, with_statement, nested_scopes
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
 import platform
 import binascii
 import logging
 import marshal
 import pickle
+import struct
+import atexit
+import codecs
+from collections import OrderedDict
+import hashlib
+import heapq
+import mmap
+import multiprocessing
+import threading
+import time
 import json
 import zlib
 import sys
@@ -16,6 +25,7 @@ import ast
 import os
 import io
 import re
+from pytextarchive.bytelines import open_archive_input, read_archive_bytes, strip_bytes
 
 try:
     from html.parser import HTMLParser
@@ -28,6 +38,18 @@ try:
 except ImportError:
     HAS_YAML = False
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import sqlite3
+    HAS_SQLITE = True
+except ImportError:
+    HAS_SQLITE = False
+
 try:
     from html.parser import HTMLParser
 except ImportError:
@@ -43,6 +65,7 @@ except ImportError:
 
 # Python 2/3 compatibility helpers
 PY2 = sys.version_info[0] == 2
+_perf_counter = getattr(time, 'perf_counter', time.time)
 try:
     basestring  # py2
 except NameError:  # py3
@@ -125,6 +148,12 @@ except ImportError:
         from StringIO import StringIO
         from StringIO import StringIO as BytesIO
 
+# Mapping ABCs
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    from collections import Mapping, MutableMapping
+
 
 __use_pysftp__ = False
 if(not havepysftp):
@@ -942,14 +971,15 @@ def _is_type(value, expected):
     if expected == "int":
         return isinstance(value, integer_types)
     if expected == "string":
-        return isinstance(value, basestring)
+        return isinstance(value, (basestring, MappedText))
     if expected == "list":
-        return isinstance(value, list)
+        return isinstance(value, (list, tuple))
     if expected == "dict":
-        return isinstance(value, dict)
+        return isinstance(value, Mapping)
     if expected == "multiline":
         # In your parsed structure multiline fields end up as strings
-        return isinstance(value, basestring)
+        # (or MappedText/LazyText bodies from the mmap and lazy parses)
+        return isinstance(value, (basestring, MappedText))
     # Unknown => accept (or return False to be stricter)
     return True
 
@@ -1132,6 +1162,9 @@ def validate_services_from_file(filename, schema_or_path):
 
     return validate_services(services, schema)
 
+# Suffixes open_compressed_file() decompresses.
+_COMPRESSED_SUFFIXES = ('.gz', '.bz2', '.xz', '.lzma', '.zl', '.zz', '.lzo', '.zst')
+
 def open_compressed_file(filename):
     """ Open a file, trying various compression methods if available. """
     if filename.endswith('.gz'):
@@ -1202,6 +1235,75 @@ def save_compressed_file(data, filename):
         with io.open(filename, 'w', encoding='utf-8') as file:
             file.write(data)
 
+def _open_compressed_output(filename, path=None):
+    """
+    Open a binary file for writing, compressed by the extension of filename
+    like save_compressed_file.  The file is created at path when given, so a
+    temporary name can be written with the codec of its final name.
+    """
+    path = filename if path is None else path
+    if filename.endswith('.gz'):
+        return gzip.open(path, 'wb')
+    elif filename.endswith('.bz2'):
+        return bz2.open(path, 'wb')
+    elif filename.endswith('.xz') or filename.endswith('.lzma'):
+        if lzma:
+            return lzma.open(path, 'wb')
+        else:
+            raise ImportError("lzma module is not available")
+    elif filename.endswith('.zl') or filename.endswith('.zz'):
+        return ZlibFile(file_path=path, mode='wb')
+    elif filename.endswith('.lzo') and "lzop" in compressionsupport:
+        return LzopFile(file_path=path, mode='wb')
+    elif filename.endswith('.zst') and "zstandard" in compressionsupport:
+        if 'zstandard' in sys.modules:
+            return zstandard.open(path, 'wb')
+        else:
+            return pyzstd.zstdfile.ZstdFile(path, mode='wb')
+    else:
+        return io.open(path, 'wb')
+
+_replace_file = getattr(os, 'replace', os.rename)
+
+class _ReplacingOutput(object):
+    """
+    Context manager for _open_compressed_output(filename) that writes to a
+    temporary file in the same directory and renames it over filename only
+    once the with block finished, so a failed export never leaves a partial
+    file behind and an archive can be saved over the file it was read from.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.temporary = '{0}.{1}.tmp'.format(filename, os.getpid())
+        self.file = None
+
+    def __enter__(self):
+        self.file = _open_compressed_output(self.filename, self.temporary)
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.file.close()
+            if exc_type is None:
+                _replace_file(self.temporary, self.filename)
+        finally:
+            if os.path.exists(self.temporary):
+                os.remove(self.temporary)
+        return False
+
+# Codecs of the Unicode archives get_file_encoding recognizes by their BOM.
+_BOM_CODECS = {'UTF-16LE': 'utf-16', 'UTF-16BE': 'utf-16', 'UTF-32LE': 'utf-32', 'UTF-32BE': 'utf-32'}
+
+def _bom_codec(filename):
+    """ The codec of a UTF-16 or UTF-32 archive, None for anything else. """
+    return _BOM_CODECS.get(get_file_encoding(filename))
+
+def _read_archive_lines(filename):
+    # Through read_archive_bytes, so UTF-16 and UTF-32 archives are re-encoded
+    # and every parser decompresses the same way.
+    return io.StringIO(read_archive_bytes(filename).decode('utf-8'), newline=None).readlines()
+
 def parse_line(line):
     """ Parse a line in the format 'var: value' and return the key and value. """
     parts = line.split(":", 1)
@@ -1220,792 +1322,3169 @@ def validate_non_negative_integer(value, key, line_number):
         raise ValueError("Invalid integer '{0}' for key '{1}' on line {2}".format(value, key, line_number))
 
 
-def parse_file(filename, validate_only=False, verbose=False):
-    with open_compressed_file(filename) as file:
-        lines = file.readlines()
-    return parse_lines(lines, validate_only, verbose)
+def parse_file(filename, validate_only=False, verbose=False, use_mmap=False, hooks=None, processes=None,
+               lazy_bodies=False, records=False, interner=None):
+    """
+    Parse an archive file.  With use_mmap uncompressed archives are parsed by
+    parse_file_mmap instead, with lazy_bodies by parse_file_lazy and with
+    processes (0 for one per CPU) by parse_file_parallel; compressed ones
+    are always read as text.  validate_only without verbose streams the
+    file through validate_file and builds nothing.  hooks is an optional ParseStats.  With records
+    users, categories, threads, posts and polls come back as compact Record
+    objects instead of dicts, and interner (True, or a ValueInterner to share
+    between parses) dedupes repeated field values.  When a ParseCache is
+    enabled (see enable_parse_cache) plain parses of an unchanged archive
+    are loaded from its snapshot instead; parses with use_mmap, processes,
+    hooks, interner, lazy_bodies, verbose or validate_only always read the
+    archive.
+    """
+    if (validate_only or verbose or use_mmap or hooks is not None or processes is not None or lazy_bodies
+            or interner is not None):
+        cache = None
+    else:
+        cache = _parse_cache
+    if cache is None:
+        return _parse_file(filename, validate_only, verbose, use_mmap, hooks, processes, lazy_bodies, records, interner)
+    services = cache.load(filename, records)
+    if services is None:
+        services = _parse_file(filename, validate_only, verbose, use_mmap, hooks, processes, lazy_bodies, records, interner)
+        cache.store(filename, records, services)
+    return services
+
+def _parse_file(filename, validate_only, verbose, use_mmap, hooks, processes, lazy_bodies, records, interner):
+    if processes is not None and processes != 1:
+        return parse_file_parallel(filename, validate_only, verbose, processes or None, hooks, records, interner)
+    if validate_only and not verbose:
+        return validate_file(filename, hooks)
+    if lazy_bodies and not filename.endswith(_COMPRESSED_SUFFIXES):
+        return parse_file_lazy(filename, validate_only, verbose, hooks, records=records, interner=interner)
+    if use_mmap and not filename.endswith(_COMPRESSED_SUFFIXES):
+        return parse_file_mmap(filename, validate_only, verbose, hooks, records, interner)
+    if hooks is not None:
+        hooks.begin_phase('read')
+    lines = _read_archive_lines(filename)
+    if hooks is not None:
+        hooks.end_phase('read')
+    return parse_lines(lines, validate_only, verbose, hooks, records, interner)
+
+def iter_file_lines(filename):
+    """
+    Yield the lines of a (possibly compressed) archive one at a time.  Like
+    read_archive_bytes, archives get_file_encoding finds to be UTF-16 or
+    UTF-32 are decoded by their BOM and everything else as UTF-8.
+    """
+    with open_archive_input(filename) as file:
+        encoding = _BOM_CODECS.get(get_file_encoding(io.BytesIO(file.read(4))), 'utf-8')
+    with open_archive_input(filename) as file:
+        for line in io.TextIOWrapper(file, encoding=encoding, newline=None):
+            yield line
+
+def _iter_parsed_records(filename, emit, verbose=False):
+    parser = ServicesTextParser(verbose=verbose, emit=emit)
+    feed = parser.reader.feed
+    pending = parser.pending
+    for line_number, line in enumerate(iter_file_lines(filename), 1):
+        feed(line_number, line)
+        if pending:
+            for record in pending:
+                yield record
+            del pending[:]
+
+def iter_services(filename, verbose=False):
+    """
+    Yield each service of an archive as soon as its '--- End Archive Service ---'
+    marker is read, without keeping earlier services in memory.
+    """
+    return _iter_parsed_records(filename, 'service', verbose)
+
+def iter_threads(filename, verbose=False):
+    """
+    Yield (service, thread) for each message thread as soon as its
+    '--- End Message Thread ---' marker is read.  The service dict carries the
+    service fields, users and categories but its MessageThreads stay empty.
+    """
+    return _iter_parsed_records(filename, 'thread', verbose)
+
+def iter_posts(filename, verbose=False):
+    """
+    Yield (service, thread, post) for each message post as soon as its
+    '--- End Message Post ---' marker is read.  The thread dict carries the
+    thread fields but its Messages stay empty.
+    """
+    return _iter_parsed_records(filename, 'post', verbose)
 
-def parse_string(data, validate_only=False, verbose=False):
+def parse_string(data, validate_only=False, verbose=False, hooks=None, records=False, interner=None):
     lines = StringIO(data).readlines()
-    return parse_lines(lines, validate_only, verbose)
+    return parse_lines(lines, validate_only, verbose, hooks, records, interner)
+
+
+# Section flags tracked by ArchiveEventReader.  Every flag owns one bit of the
+# reader state so the dispatch tables can be built once per combination.
+_SECTION_NAMES = (
+    'user_list', 'message_list', 'message_thread', 'user_info', 'message_post',
+    'extrafields_body', 'bio_body', 'signature_body', 'message_body',
+    'comment_section', 'include_service', 'include_users', 'include_messages',
+    'category_list', 'description_body', 'include_categories',
+    'categorization_list', 'info_body', 'poll_list', 'poll_body',
+)
+_SECTION_BITS = dict((name, 1 << index) for index, name in enumerate(_SECTION_NAMES))
+
+# Line rules in the precedence order of the archive grammar.  Each rule is
+# (required sections, kind, match, reader action, section) where kind is
+# 'line' for an exact marker, 'key' for a 'Key: value' line and 'any' for a
+# rule that takes every line not matched by an earlier rule.  The top level
+# rules apply with or without an open service, the service rules only inside
+# one.
+_TOP_LEVEL_RULES = (
+    ((), 'line', '--- Include Service Start ---', '_start', 'include_service'),
+    ((), 'line', '--- Include Service End ---', '_end', 'include_service'),
+    (('include_service',), 'any', None, '_body', 'include_service'),
+    ((), 'line', '--- Include Users Start ---', '_start', 'include_users'),
+    ((), 'line', '--- Include Users End ---', '_end', 'include_users'),
+    (('include_users',), 'any', None, '_body', 'include_users'),
+    ((), 'line', '--- Include Messages Start ---', '_start', 'include_messages'),
+    ((), 'line', '--- Include Messages End ---', '_end', 'include_messages'),
+    (('include_messages',), 'any', None, '_body', 'include_messages'),
+    ((), 'line', '--- Include Categories Start ---', '_start', 'include_categories'),
+    ((), 'line', '--- Include Categories End ---', '_end', 'include_categories'),
+    (('include_categories',), 'any', None, '_body', 'include_categories'),
+    ((), 'line', '--- Start Archive Service ---', '_start_service', 'archive_service'),
+    ((), 'line', '--- End Archive Service ---', '_end_service', 'archive_service'),
+    ((), 'line', '--- Start Comment Section ---', '_start', 'comment_section'),
+    ((), 'line', '--- End Comment Section ---', '_end', 'comment_section'),
+    (('comment_section',), 'any', None, '_body', 'comment_section'),
+    ((), 'line', '--- Start Category List ---', '_start', 'category_list'),
+    ((), 'line', '--- End Category List ---', '_end', 'category_list'),
+    ((), 'line', '--- Start Categorization List ---', '_start', 'categorization_list'),
+    ((), 'line', '--- End Categorization List ---', '_end', 'categorization_list'),
+    ((), 'line', '--- Start Info Body ---', '_start', 'info_body'),
+    ((), 'line', '--- End Info Body ---', '_end', 'info_body'),
+    (('info_body',), 'any', None, '_body', 'info_body'),
+    ((), 'line', '--- Start Poll List ---', '_start', 'poll_list'),
+    ((), 'line', '--- End Poll List ---', '_end', 'poll_list'),
+    (('poll_list',), 'line', '--- Start Poll Body ---', '_start', 'poll_body'),
+    (('poll_body',), 'line', '--- End Poll Body ---', '_end', 'poll_body'),
+    (('poll_body',), 'any', None, '_poll_field', 'poll_body'),
+)
+
+_USER_SECTIONS = ('user_list', 'user_info')
+_THREAD_SECTIONS = ('message_list', 'message_thread')
+
+_SERVICE_RULES = (
+    ((), 'key', 'Entry', '_field', 'archive_service'),
+    ((), 'key', 'Service', '_field', 'archive_service'),
+    ((), 'key', 'ServiceType', '_field', 'archive_service'),
+    ((), 'key', 'ServiceLocation', '_field', 'archive_service'),
+    ((), 'key', 'TimeZone', '_field', 'archive_service'),
+    ((), 'key', 'Categories', '_field', 'categorization_list'),
+    ((), 'key', 'Forums', '_field', 'categorization_list'),
+    (('category_list',), 'line', '--- Start Description Body ---', '_start', 'description_body'),
+    (('category_list',), 'line', '--- End Description Body ---', '_end', 'description_body'),
+    (('category_list', 'description_body'), 'any', None, '_body', 'description_body'),
+    (('category_list',), 'key', 'Kind', '_field', 'category_list'),
+    (('category_list',), 'key', 'ID', '_field', 'category_list'),
+    (('category_list',), 'key', 'InSub', '_field', 'category_list'),
+    (('category_list',), 'key', 'Headline', '_field', 'category_list'),
+    (('category_list',), 'key', 'Description', '_field', 'category_list'),
+    (('category_list',), 'any', None, '_ignore', None),
+    ((), 'line', '--- Start User List ---', '_start', 'user_list'),
+    ((), 'line', '--- End User List ---', '_end', 'user_list'),
+    ((), 'line', '--- Start User Info ---', '_start', 'user_info'),
+    ((), 'line', '--- End User Info ---', '_end_user', 'user_info'),
+    ((), 'line', '--- Start Message List ---', '_start', 'message_list'),
+    ((), 'line', '--- End Message List ---', '_end', 'message_list'),
+    ((), 'line', '--- Start Message Thread ---', '_start', 'message_thread'),
+    ((), 'line', '--- End Message Thread ---', '_end', 'message_thread'),
+    ((), 'line', '--- Start Message Post ---', '_start_post', 'message_post'),
+    ((), 'line', '--- End Message Post ---', '_end_post', 'message_post'),
+    (('message_list',), 'key', 'Interactions', '_field', 'message_list'),
+    (('message_list',), 'key', 'Status', '_field', 'message_list'),
+    ((), 'key', 'Info', '_start', 'info_body'),
+    (_USER_SECTIONS, 'key', 'User', '_user_field', 'user_info'),
+    (_USER_SECTIONS, 'key', 'Name', '_field', 'user_info'),
+    (_USER_SECTIONS, 'key', 'Handle', '_field', 'user_info'),
+    (_USER_SECTIONS, 'key', 'Email', '_field', 'user_info'),
+    (_USER_SECTIONS, 'key', 'Phone', '_field', 'user_info'),
+    (_USER_SECTIONS, 'key', 'Location', '_field', 'user_info'),
+    (_USER_SECTIONS, 'key', 'Website', '_field', 'user_info'),
+    (_USER_SECTIONS, 'key', 'Avatar', '_field', 'user_info'),
+    (_USER_SECTIONS, 'key', 'Banner', '_field', 'user_info'),
+    (_USER_SECTIONS, 'key', 'Joined', '_field', 'user_info'),
+    (_USER_SECTIONS, 'key', 'Birthday', '_field', 'user_info'),
+    (_USER_SECTIONS, 'key', 'HashTags', '_field', 'user_info'),
+    (_USER_SECTIONS, 'key', 'PinnedMessage', '_field', 'user_info'),
+    (_USER_SECTIONS, 'line', '--- Start ExtraFields Body ---', '_start_user_body', 'extrafields_body'),
+    (_USER_SECTIONS, 'line', '--- End ExtraFields Body ---', '_end_user_body', 'extrafields_body'),
+    (_USER_SECTIONS + ('extrafields_body',), 'any', None, '_body', 'extrafields_body'),
+    (_USER_SECTIONS, 'line', '--- Start Bio Body ---', '_start_user_body', 'bio_body'),
+    (_USER_SECTIONS, 'line', '--- End Bio Body ---', '_end_user_body', 'bio_body'),
+    (_USER_SECTIONS + ('bio_body',), 'any', None, '_body', 'bio_body'),
+    (_USER_SECTIONS, 'line', '--- Start Signature Body ---', '_start_user_body', 'signature_body'),
+    (_USER_SECTIONS, 'line', '--- End Signature Body ---', '_end_user_body', 'signature_body'),
+    (_USER_SECTIONS + ('signature_body',), 'any', None, '_body', 'signature_body'),
+    (_USER_SECTIONS, 'any', None, '_ignore', None),
+    (_THREAD_SECTIONS, 'key', 'Thread', '_field', 'message_thread'),
+    (_THREAD_SECTIONS, 'key', 'Category', '_field', 'message_thread'),
+    (_THREAD_SECTIONS, 'key', 'Forum', '_field', 'message_thread'),
+    (_THREAD_SECTIONS, 'key', 'Title', '_field', 'message_thread'),
+    (_THREAD_SECTIONS, 'key', 'Type', '_field', 'message_thread'),
+    (_THREAD_SECTIONS, 'key', 'State', '_field', 'message_thread'),
+    (_THREAD_SECTIONS, 'key', 'Keywords', '_field', 'message_thread'),
+    (_THREAD_SECTIONS, 'key', 'Author', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'key', 'AuthorID', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'key', 'Time', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'key', 'Date', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'key', 'EditTime', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'key', 'EditDate', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'key', 'EditAuthor', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'key', 'EditAuthorID', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'key', 'SubType', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'key', 'SubTitle', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'key', 'Tags', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'key', 'Post', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'key', 'PinnedID', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'key', 'Nested', '_field', 'message_post'),
+    (_THREAD_SECTIONS, 'line', '--- Start Message Body ---', '_start_message_body', 'message_body'),
+    (_THREAD_SECTIONS, 'line', '--- End Message Body ---', '_end_message_body', 'message_body'),
+    (_THREAD_SECTIONS + ('message_body',), 'any', None, '_message_body_line', 'message_body'),
+)
+
+
+class ArchiveContentHandler(object):
+    """
+    Receives the events of ArchiveEventReader, in the spirit of
+    xml.sax.handler.ContentHandler.  Every method is a no-op, so subclasses
+    only override the events they care about.
+
+    section is one of the section names ('archive_service', 'user_info',
+    'message_thread', 'message_post', 'message_body', ...).  For field events
+    it names the record the field belongs to.  An 'Info:' line opens the info
+    body just like its start marker does.
+    """
 
+    def start_section(self, section, line_number):
+        pass
 
-def parse_lines(lines, validate_only=False, verbose=False):
-    services = []
-    current_service = None
-    in_section = {
-        'user_list': False,
-        'message_list': False,
-        'message_thread': False,
-        'user_info': False,
-        'message_post': False,
-        'extrafields_body': False,
-        'bio_body': False,
-        'signature_body': False,
-        'message_body': False,
-        'comment_section': False,
-        'include_service': False,
-        'include_users': False,
-        'include_messages': False,
-        'category_list': False,
-        'description_body': False,
-        'include_categories': False,
-        'categorization_list': False,
-        'info_body': False,
-        'poll_list': False,
-        'poll_body': False,
-    }
-    include_files = []
-    user_id = None
-    current_bio = None
-    current_message = None
-    current_thread = None
-    current_category = None
-    current_info = None
-    current_poll = None
-    current_polls = []
-    categorization_values = {'Categories': [], 'Forums': []}
-    category_ids = {'Categories': [], 'Forums': []}
-    post_id = 1
-
-    def parse_include_files(file_list):
-        included_services = []
-        for include_file in file_list:
-            included_services.extend(parse_file(include_file, validate_only, verbose))
-        return included_services
+    def end_section(self, section, line_number):
+        pass
 
-    def parse_include_users(file_list):
-        users = {}
-        for include_file in file_list:
-            included_users = parse_file(include_file, validate_only, verbose)
-            for service in included_users:
-                users.update(service['Users'])
-        return users
+    def field(self, section, key, value, line_number):
+        pass
 
-    def parse_include_messages(file_list):
-        messages = []
-        for include_file in file_list:
-            included_messages = parse_file(include_file, validate_only, verbose)
-            for service in included_messages:
-                messages.extend(service['MessageThreads'])
-        return messages
+    def body_chunk(self, section, text, line_number):
+        pass
 
-    def parse_include_categories(file_list):
-        categories = []
-        for include_file in file_list:
-            included_categories = parse_file(include_file, validate_only, verbose)
-            for service in included_categories:
-                categories.extend(service['Categories'])
-        return categories
 
-    try:
-        for line_number, line in enumerate(lines, 1):
-            line = line.strip()
-            if line == "--- Include Service Start ---":
-                in_section['include_service'] = True
-                include_files = []
-                if verbose:
-                    print("Line {0}: {1} (Starting include service section)".format(line_number, line))
-                continue
-            elif line == "--- Include Service End ---":
-                in_section['include_service'] = False
-                if verbose:
-                    print("Line {0}: {1} (Ending include service section)".format(line_number, line))
-                services.extend(parse_include_files(include_files))
-                continue
-            elif in_section['include_service']:
-                include_files.append(line)
-                if verbose:
-                    print("Line {0}: {1} (Including file for service)".format(line_number, line))
-                continue
-            elif line == "--- Include Users Start ---":
-                in_section['include_users'] = True
-                include_files = []
-                if verbose:
-                    print("Line {0}: {1} (Starting include users section)".format(line_number, line))
-                continue
-            elif line == "--- Include Users End ---":
-                in_section['include_users'] = False
-                if verbose:
-                    print("Line {0}: {1} (Ending include users section)".format(line_number, line))
-                if current_service:
-                    current_service['Users'].update(parse_include_users(include_files))
-                continue
-            elif in_section['include_users']:
-                include_files.append(line)
-                if verbose:
-                    print("Line {0}: {1} (Including file for users)".format(line_number, line))
-                continue
-            elif line == "--- Include Messages Start ---":
-                in_section['include_messages'] = True
-                include_files = []
-                if verbose:
-                    print("Line {0}: {1} (Starting include messages section)".format(line_number, line))
-                continue
-            elif line == "--- Include Messages End ---":
-                in_section['include_messages'] = False
-                if verbose:
-                    print("Line {0}: {1} (Ending include messages section)".format(line_number, line))
-                if current_service:
-                    current_service['MessageThreads'].extend(parse_include_messages(include_files))
-                continue
-            elif in_section['include_messages']:
-                include_files.append(line)
-                if verbose:
-                    print("Line {0}: {1} (Including file for messages)".format(line_number, line))
-                continue
-            elif line == "--- Include Categories Start ---":
-                in_section['include_categories'] = True
-                include_files = []
-                if verbose:
-                    print("Line {0}: {1} (Starting include categories section)".format(line_number, line))
-                continue
-            elif line == "--- Include Categories End ---":
-                in_section['include_categories'] = False
-                if verbose:
-                    print("Line {0}: {1} (Ending include categories section)".format(line_number, line))
-                if current_service:
-                    current_service['Categories'].extend(parse_include_categories(include_files))
-                    for category in current_service['Categories']:
-                        kind_split = category.get('Kind', '').split(",")
-                        category['Type'] = kind_split[0].strip() if len(kind_split) > 0 else ""
-                        category['Level'] = kind_split[1].strip() if len(kind_split) > 1 else ""
-                        category_ids[category['Type']].append(category['ID'])
-                continue
-            elif in_section['include_categories']:
-                include_files.append(line)
-                if verbose:
-                    print("Line {0}: {1} (Including file for categories)".format(line_number, line))
-                continue
-            elif line == "--- Start Archive Service ---":
-                current_service = {'Users': {}, 'MessageThreads': [], 'Categories': [], 'Interactions': [], 'Categorization': {}, 'Info': ''}
-                if verbose:
-                    print("Line {0}: {1} (Starting new archive service)".format(line_number, line))
-                continue
-            elif line == "--- End Archive Service ---":
-                services.append(current_service)
-                current_service = None
-                if verbose:
-                    print("Line {0}: {1} (Ending archive service)".format(line_number, line))
-                continue
-            elif line == "--- Start Comment Section ---":
-                in_section['comment_section'] = True
-                if verbose:
-                    print("Line {0}: {1} (Starting comment section)".format(line_number, line))
-                continue
-            elif line == "--- End Comment Section ---":
-                in_section['comment_section'] = False
-                if verbose:
-                    print("Line {0}: {1} (Ending comment section)".format(line_number, line))
-                continue
-            elif in_section['comment_section']:
-                if verbose:
-                    print("Line {0}: {1} (Comment)".format(line_number, line))
-                continue
-            elif line == "--- Start Category List ---":
-                in_section['category_list'] = True
-                current_category = {}
-                if verbose:
-                    print("Line {0}: {1} (Starting category list)".format(line_number, line))
-                continue
-            elif line == "--- End Category List ---":
-                in_section['category_list'] = False
-                if current_category:
-                    kind_split = current_category.get('Kind', '').split(",")
-                    current_category['Type'] = kind_split[0].strip() if len(kind_split) > 0 else ""
-                    current_category['Level'] = kind_split[1].strip() if len(kind_split) > 1 else ""
-                    if current_category['Type'] not in categorization_values:
-                        raise ValueError("Invalid 'Type' value '{0}' on line {1}. Expected one of {2}.".format(current_category['Type'], line_number, categorization_values.keys()))
-                    if current_category['InSub'] != 0 and current_category['InSub'] not in category_ids[current_category['Type']]:
-                        raise ValueError("InSub value '{0}' on line {1} does not match any existing ID values.".format(current_category['InSub'], line_number))
-                    current_service['Categories'].append(current_category)
-                    category_ids[current_category['Type']].append(current_category['ID'])
-                current_category = None
-                if verbose:
-                    print("Line {0}: {1} (Ending category list)".format(line_number, line))
-                continue
-            elif line == "--- Start Categorization List ---":
-                in_section['categorization_list'] = True
-                current_service['Categorization'] = {}
-                if verbose:
-                    print("Line {0}: {1} (Starting categorization list)".format(line_number, line))
-                continue
-            elif line == "--- End Categorization List ---":
-                in_section['categorization_list'] = False
-                if verbose:
-                    print("Line {0}: {1} (Ending categorization list)".format(line_number, line))
-                categorization_values = current_service['Categorization']
-                continue
-            elif line == "--- Start Info Body ---":
-                in_section['info_body'] = True
-                if current_service:
-                    current_info = []
-                    if verbose:
-                        print("Line {0}: {1} (Starting info body)".format(line_number, line))
-                continue
-            elif line == "--- End Info Body ---":
-                in_section['info_body'] = False
-                if current_service and current_info is not None:
-                    current_service['Info'] = "\n".join(current_info)
-                    current_info = None
-                    if verbose:
-                        print("Line {0}: {1} (Ending info body)".format(line_number, line))
-                continue
-            elif in_section['info_body']:
-                if current_service and current_info is not None:
-                    current_info.append(line)
-                if verbose:
-                    print("Line {0}: {1}".format(line_number, line))
-                continue
-            elif line == "--- Start Poll List ---":
-                in_section['poll_list'] = True
-                current_polls = []
-                if verbose:
-                    print("Line {0}: {1} (Starting poll list)".format(line_number, line))
-                continue
-            elif line == "--- End Poll List ---":
-                in_section['poll_list'] = False
-                if current_message:
-                    current_message['Polls'] = current_polls
-                if verbose:
-                    print("Line {0}: {1} (Ending poll list)".format(line_number, line))
-                continue
-            elif in_section['poll_list'] and line == "--- Start Poll Body ---":
-                in_section['poll_body'] = True
-                current_poll = {}
-                if verbose:
-                    print("Line {0}: {1} (Starting poll body)".format(line_number, line))
-                continue
-            elif in_section['poll_body'] and line == "--- End Poll Body ---":
-                in_section['poll_body'] = False
-                if current_poll is not None:
-                    current_polls.append(current_poll)
-                    current_poll = None
-                if verbose:
-                    print("Line {0}: {1} (Ending poll body)".format(line_number, line))
-                continue
-            elif in_section['poll_body']:
-                key, value = parse_line(line)
-                if key and current_poll is not None:
-                    if key in ['Answers', 'Results', 'Percentage']:
-                        current_poll[key] = [item.strip() for item in value.split(',')]
-                    else:
-                        current_poll[key] = value
-                continue
-            elif current_service is not None:
-                key, value = parse_line(line)
-                if key == "Entry":
-                    current_service['Entry'] = validate_non_negative_integer(value, "Entry", line_number)
-                elif key == "Service":
-                    current_service['Service'] = value
-                elif key == "ServiceType":
-                    current_service['ServiceType'] = value
-                elif key == "ServiceLocation":
-                    current_service['ServiceLocation'] = value
-                elif key == "TimeZone":
-                    current_service['TimeZone'] = value
-                elif key == "Categories":
-                    current_service['Categorization']['Categories'] = [category.strip() for category in value.split(",")]
-                    if verbose:
-                        print("Line {0}: Categories set to {1}".format(line_number, current_service['Categorization']['Categories']))
-                elif key == "Forums":
-                    current_service['Categorization']['Forums'] = [forum.strip() for forum in value.split(",")]
-                    if verbose:
-                        print("Line {0}: Forums set to {1}".format(line_number, current_service['Categorization']['Forums']))
-                elif line == "--- Start Description Body ---" and in_section['category_list']:
-                    # Begin capturing multi-line category Description
-                    in_section['description_body'] = True
-                    _desc_lines = []
-                    continue
-                elif line == "--- End Description Body ---" and in_section['category_list']:
-                    # Finish the multi-line description
-                    in_section['description_body'] = False
-                    # Join and store
-                    current_category['Description'] = "\n".join(_desc_lines)
-                    del _desc_lines
-                    continue
-                elif in_section['description_body'] and in_section['category_list']:
-                    # Accumulate each body‑line
-                    _desc_lines.append(line)
-                    continue
-                elif in_section['category_list']:
-                    if key == "Kind":
-                        current_category['Kind'] = value
-                    elif key == "ID":
-                        current_category['ID'] = validate_non_negative_integer(value, "ID", line_number)
-                    elif key == "InSub":
-                        current_category['InSub'] = validate_non_negative_integer(value, "InSub", line_number)
-                    elif key == "Headline":
-                        current_category['Headline'] = value
-                    elif key == "Description":
-                        current_category['Description'] = value
-                elif line == "--- Start User List ---":
-                    in_section['user_list'] = True
-                    if verbose:
-                        print("Line {0}: {1} (Starting user list)".format(line_number, line))
-                    continue
-                elif line == "--- End User List ---":
-                    in_section['user_list'] = False
-                    if verbose:
-                        print("Line {0}: {1} (Ending user list)".format(line_number, line))
-                    continue
-                elif line == "--- Start User Info ---":
-                    in_section['user_info'] = True
-                    if verbose:
-                        print("Line {0}: {1} (Starting user info)".format(line_number, line))
-                    continue
-                elif line == "--- End User Info ---":
-                    in_section['user_info'] = False
-                    user_id = None
-                    if verbose:
-                        print("Line {0}: {1} (Ending user info)".format(line_number, line))
-                    continue
-                elif line == "--- Start Message List ---":
-                    in_section['message_list'] = True
-                    if verbose:
-                        print("Line {0}: {1} (Starting message list)".format(line_number, line))
-                    continue
-                elif line == "--- End Message List ---":
-                    in_section['message_list'] = False
-                    if verbose:
-                        print("Line {0}: {1} (Ending message list)".format(line_number, line))
-                    continue
-                elif line == "--- Start Message Thread ---":
-                    in_section['message_thread'] = True
-                    current_thread = {'Title': '', 'Messages': []}
-                    post_id = 1
-                    if verbose:
-                        print("Line {0}: {1} (Starting message thread)".format(line_number, line))
-                    continue
-                elif line == "--- End Message Thread ---":
-                    in_section['message_thread'] = False
-                    current_service['MessageThreads'].append(current_thread)
-                    current_thread = None
-                    if verbose:
-                        print("Line {0}: {1} (Ending message thread)".format(line_number, line))
-                    continue
-                elif line == "--- Start Message Post ---":
-                    in_section['message_post'] = True
-                    current_message = {}
-                    if verbose:
-                        print("Line {0}: {1} (Starting message post)".format(line_number, line))
-                    continue
-                elif line == "--- End Message Post ---":
-                    in_section['message_post'] = False
-                    if current_message:
-                        current_thread['Messages'].append(current_message)
-                    current_message = None
-                    if verbose:
-                        print("Line {0}: {1} (Ending message post)".format(line_number, line))
-                    continue
-                elif in_section['message_list'] and key == "Interactions":
-                    current_service['Interactions'] = [interaction.strip() for interaction in value.split(",")]
-                    if verbose:
-                        print("Line {0}: Interactions set to {1}".format(line_number, current_service['Interactions']))
-                elif in_section['message_list'] and key == "Status":
-                    current_service['Status'] = [status.strip() for status in value.split(",")]
-                    if verbose:
-                        print("Line {0}: Status set to {1}".format(line_number, current_service['Status']))
-                elif key == "Info":
-                    current_info = []
-                    in_section['info_body'] = True
-                    if verbose:
-                        print("Line {0}: {1} (Starting info body)".format(line_number, line))
-                elif in_section['user_list'] and in_section['user_info']:
-                    if key == "User":
-                        user_id = validate_non_negative_integer(value, "User", line_number)
-                        current_service['Users'][user_id] = {'ExtraFields': "", 'Bio': "", 'Signature': ""}
-                        if verbose:
-                            print("Line {0}: User ID set to {1}".format(line_number, user_id))
-                    elif key == "Name":
-                        if user_id is not None:
-                            current_service['Users'][user_id]['Name'] = value
-                            if verbose:
-                                print("Line {0}: Name set to {1}".format(line_number, value))
-                    elif key == "Handle":
-                        if user_id is not None:
-                            current_service['Users'][user_id]['Handle'] = value
-                            if verbose:
-                                print("Line {0}: Handle set to {1}".format(line_number, value))
-                    elif key == "Email":
-                        if user_id is not None:
-                            current_service['Users'][user_id]['Email'] = value
-                            if verbose:
-                                print("Line {0}: Email set to {1}".format(line_number, value))
-                    elif key == "Phone":
-                        if user_id is not None:
-                            current_service['Users'][user_id]['Phone'] = value
-                            if verbose:
-                                print("Line {0}: Phone set to {1}".format(line_number, value))
-                    elif key == "Location":
-                        if user_id is not None:
-                            current_service['Users'][user_id]['Location'] = value
-                            if verbose:
-                                print("Line {0}: Location set to {1}".format(line_number, value))
-                    elif key == "Website":
-                        if user_id is not None:
-                            current_service['Users'][user_id]['Website'] = value
-                            if verbose:
-                                print("Line {0}: Website set to {1}".format(line_number, value))
-                    elif key == "Avatar":
-                        if user_id is not None:
-                            current_service['Users'][user_id]['Avatar'] = value
-                            if verbose:
-                                print("Line {0}: Avatar set to {1}".format(line_number, value))
-                    elif key == "Banner":
-                        if user_id is not None:
-                            current_service['Users'][user_id]['Banner'] = value
-                            if verbose:
-                                print("Line {0}: Banner set to {1}".format(line_number, value))
-                    elif key == "Joined":
-                        if user_id is not None:
-                            current_service['Users'][user_id]['Joined'] = value
-                            if verbose:
-                                print("Line {0}: Joined date set to {1}".format(line_number, value))
-                    elif key == "Birthday":
-                        if user_id is not None:
-                            current_service['Users'][user_id]['Birthday'] = value
-                            if verbose:
-                                print("Line {0}: Birthday set to {1}".format(line_number, value))
-                    elif key == "HashTags":
-                        if user_id is not None:
-                            current_service['Users'][user_id]['HashTags'] = value
-                            if verbose:
-                                print("Line {0}: HashTags set to {1}".format(line_number, value))
-                    elif key == "PinnedMessage":
-                        current_service['PinnedMessage'] = validate_non_negative_integer(value, "PinnedMessage", line_number)
-                        if verbose:
-                            print("Line {0}: Pinned Message set to {1}".format(line_number, value))
-                    elif line == "--- Start ExtraFields Body ---":
-                        if user_id is not None:
-                            current_extrafields = []
-                            in_section['extrafields_body'] = True
-                            if verbose:
-                                print("Line {0}: Starting extrafields body".format(line_number))
-                    elif line == "--- End ExtraFields Body ---":
-                        if user_id is not None and current_extrafields is not None:
-                            current_service['Users'][user_id]['ExtraFields'] = "\n".join(current_extrafields)
-                            current_extrafields = None
-                            in_section['extrafields_body'] = False
-                            if verbose:
-                                print("Line {0}: Ending extrafields body".format(line_number))
-                    elif in_section['extrafields_body'] and current_extrafields is not None:
-                        current_extrafields.append(line)
-                        if verbose:
-                            print("Line {0}: Adding to extrafields body: {1}".format(line_number, line))
-                    elif line == "--- Start Bio Body ---":
-                        if user_id is not None:
-                            current_bio = []
-                            in_section['bio_body'] = True
-                            if verbose:
-                                print("Line {0}: Starting bio body".format(line_number))
-                    elif line == "--- End Bio Body ---":
-                        if user_id is not None and current_bio is not None:
-                            current_service['Users'][user_id]['Bio'] = "\n".join(current_bio)
-                            current_bio = None
-                            in_section['bio_body'] = False
-                            if verbose:
-                                print("Line {0}: Ending bio body".format(line_number))
-                    elif in_section['bio_body'] and current_bio is not None:
-                        current_bio.append(line)
-                        if verbose:
-                            print("Line {0}: Adding to bio body: {1}".format(line_number, line))
-                    elif line == "--- Start Signature Body ---":
-                        if user_id is not None:
-                            current_signature = []
-                            in_section['signature_body'] = True
-                            if verbose:
-                                print("Line {0}: Starting signature body".format(line_number))
-                    elif line == "--- End Signature Body ---":
-                        if user_id is not None and current_signature is not None:
-                            current_service['Users'][user_id]['Signature'] = "\n".join(current_signature)
-                            current_signature = None
-                            in_section['signature_body'] = False
-                            if verbose:
-                                print("Line {0}: Ending signature body".format(line_number))
-                    elif in_section['signature_body'] and current_signature is not None:
-                        current_signature.append(line)
-                        if verbose:
-                            print("Line {0}: Adding to signature body: {1}".format(line_number, line))
-                elif in_section['message_list'] and in_section['message_thread']:
-                    if key == "Thread":
-                        current_thread['Thread'] = validate_non_negative_integer(value, "Thread", line_number)
-                        if verbose:
-                            print("Line {0}: Thread ID set to {1}".format(line_number, value))
-                    elif key == "Category":
-                        current_thread['Category'] = [category.strip() for category in value.split(",")]
-                        if verbose:
-                            print("Line {0}: Category set to {1}".format(line_number, current_thread['Category']))
-                    elif key == "Forum":
-                        current_thread['Forum'] = [forum.strip() for forum in value.split(",")]
-                        if verbose:
-                            print("Line {0}: Forum set to {1}".format(line_number, current_thread['Forum']))
-                    elif key == "Title":
-                        current_thread['Title'] = value
-                        if verbose:
-                            print("Line {0}: Title set to {1}".format(line_number, value))
-                    elif key == "Type":
-                        current_thread['Type'] = value
-                        if verbose:
-                            print("Line {0}: Type set to {1}".format(line_number, value))
-                    elif key == "State":
-                        current_thread['State'] = value
-                        if verbose:
-                            print("Line {0}: State set to {1}".format(line_number, value))
-                    elif key == "Keywords":
-                        current_thread['Keywords'] = value
-                        if verbose:
-                            print("Line {0}: Keywords set to {1}".format(line_number, value))
-                    elif key == "Author":
-                        current_message['Author'] = value
-                        if verbose:
-                            print("Line {0}: Author set to {1}".format(line_number, value))
-                    elif key == "AuthorID":
-                        current_message['AuthorID'] = validate_non_negative_integer(value, "AuthorID", line_number)
-                        if verbose:
-                            print("Line {0}: Author ID set to {1}".format(line_number, value))
-                    elif key == "Time":
-                        current_message['Time'] = value
-                        if verbose:
-                            print("Line {0}: Time set to {1}".format(line_number, value))
-                    elif key == "Date":
-                        current_message['Date'] = value
-                        if verbose:
-                            print("Line {0}: Date set to {1}".format(line_number, value))
-                    elif key == "EditTime":
-                        current_message['EditTime'] = value
-                        if verbose:
-                            print("Line {0}: Edit Time set to {1}".format(line_number, value))
-                    elif key == "EditDate":
-                        current_message['EditDate'] = value
-                        if verbose:
-                            print("Line {0}: Edit Date set to {1}".format(line_number, value))
-                    elif key == "EditAuthor":
-                        current_message['EditAuthor'] = value
-                        if verbose:
-                            print("Line {0}: Edit Author set to {1}".format(line_number, value))
-                    elif key == "EditAuthorID":
-                        current_message['EditAuthorID'] = validate_non_negative_integer(value, "EditAuthorID", line_number)
-                        if verbose:
-                            print("Line {0}: Edit Author ID set to {1}".format(line_number, value))
-                    elif key == "SubType":
-                        current_message['SubType'] = value
-                        if verbose:
-                            print("Line {0}: SubType set to {1}".format(line_number, value))
-                    elif key == "SubTitle":
-                        current_message['SubTitle'] = value
-                        if verbose:
-                            print("Line {0}: SubTitle set to {1}".format(line_number, value))
-                    elif key == "Tags":
-                        current_message['Tags'] = value
-                        if verbose:
-                            print("Line {0}: Tags set to {1}".format(line_number, value))
-                    elif key == "Post":
-                        post_value = validate_non_negative_integer(value, "Post", line_number)
-                        current_message['Post'] = post_value
-                        if 'post_ids' not in current_thread:
-                            current_thread['post_ids'] = []
-                        if post_value not in current_thread['post_ids']:
-                            current_thread['post_ids'].append(post_value)
-                        if verbose:
-                            print("Line {0}: Post ID set to {1}".format(line_number, post_value))
-                    elif key == "PinnedID":
-                        current_message['PinnedID'] = validate_non_negative_integer(value, "PinnedID", line_number)
-                        if verbose:
-                            print("Line {0}: Pinned ID set to {1}".format(line_number, value))
-                    elif key == "Nested":
-                        nested_value = validate_non_negative_integer(value, "Nested", line_number)
-                        if nested_value != 0 and nested_value not in current_thread.get('post_ids', []):
-                            raise ValueError(
-                                "Nested value '{0}' on line {1} does not match any existing Post values in the current thread. Existing Post IDs: {2}".format(
-                                    nested_value, line_number, list(current_thread.get('post_ids', [])))
-                            )
-                        current_message['Nested'] = nested_value
-                        if verbose:
-                            print("Line {0}: Nested set to {1}".format(line_number, nested_value))
-                    elif line == "--- Start Message Body ---":
-                        if current_message is not None:
-                            current_message['Message'] = []
-                            in_section['message_body'] = True
-                            if verbose:
-                                print("Line {0}: Starting message body".format(line_number))
-                    elif line == "--- End Message Body ---":
-                        if current_message is not None and 'Message' in current_message:
-                            current_message['Message'] = "\n".join(current_message['Message'])
-                            in_section['message_body'] = False
-                            if verbose:
-                                print("Line {0}: Ending message body".format(line_number))
-                    elif in_section['message_body'] and current_message is not None and 'Message' in current_message:
-                        current_message['Message'].append(line)
-                        if verbose:
-                            print("Line {0}: Adding to message body: {1}".format(line_number, line))
+class ArchiveEventReader(object):
+    """
+    Tokenizes the archive text format into start_section, end_section, field
+    and body_chunk events sent to an ArchiveContentHandler.
+
+    The reader keeps the open sections as a bit mask and looks each line up in
+    dispatch tables precomputed for that mask (exact marker lines, keys, and
+    the rule that takes any other line), so every line costs a couple of dict
+    lookups.  Apart from the mask it only tracks whether a service, user and
+    post are open; it never builds the records themselves.
+    """
 
-        if validate_only:
-            return True, "", ""
+    _dispatch_cache = {}
+    _byte_dispatch_cache = {}
+
+    def __init__(self, handler):
+        self.handler = handler
+        self._start_section = handler.start_section
+        self._end_section = handler.end_section
+        self._field_event = handler.field
+        self._body_chunk = handler.body_chunk
+        self.service_open = False
+        self.user_open = False
+        self.post_open = False
+        self.post_has_body = False
+        # Sections besides message_body whose lines feed_bytes hands over as chunks.
+        self.raw_bodies = frozenset()
+        self._state = 0
+        self._tables = self._dispatch_tables(0)
+        self._byte_tables = self._byte_dispatch_tables(0)
+
+    @classmethod
+    def _dispatch_tables(cls, state):
+        """ Return (top lines, top any, service lines, service keys, service any) for a section mask. """
+        tables = cls._dispatch_cache.get(state)
+        if tables is not None:
+            return tables
+        built = []
+        for rules in (_TOP_LEVEL_RULES, _SERVICE_RULES):
+            lines, keys, fallback = {}, {}, None
+            for sections, kind, match, action, section in rules:
+                if not all(state & _SECTION_BITS[name] for name in sections):
+                    continue
+                rule = (getattr(cls, action), section)
+                if kind == 'line':
+                    lines.setdefault(match, rule)
+                elif kind == 'key':
+                    keys.setdefault(match, rule)
+                else:
+                    fallback = rule
+                    break
+            built.append((lines, keys, fallback))
+            if fallback is not None and rules is _TOP_LEVEL_RULES:
+                # Everything below a top level catch-all is unreachable.
+                built.append(({}, {}, None))
+                break
+        (top_lines, _, top_any), (service_lines, service_keys, service_any) = built
+        tables = (top_lines, top_any, service_lines, service_keys, service_any)
+        cls._dispatch_cache[state] = tables
+        return tables
 
-        return services
+    @classmethod
+    def _byte_dispatch_tables(cls, state):
+        """
+        Return (markers, service keys) keyed by UTF-8 bytes for feed_bytes.
+        Marker rules carry a third item telling whether they need an open
+        service; service markers are left out where a top level catch-all
+        takes every other line.
+        """
+        tables = cls._byte_dispatch_cache.get(state)
+        if tables is not None:
+            return tables
+        top_lines, top_any, service_lines, service_keys, service_any = cls._dispatch_tables(state)
+        markers = {}
+        if top_any is None:
+            markers.update((marker.encode('utf-8'), rule + (True,)) for marker, rule in service_lines.items())
+        markers.update((marker.encode('utf-8'), rule + (False,)) for marker, rule in top_lines.items())
+        tables = (markers, dict((key.encode('utf-8'), rule + (key,)) for key, rule in service_keys.items()))
+        cls._byte_dispatch_cache[state] = tables
+        return tables
+
+    def _set_section(self, name, active):
+        bit = _SECTION_BITS[name]
+        state = (self._state | bit) if active else (self._state & ~bit)
+        if state != self._state:
+            self._state = state
+            self._tables = self._dispatch_cache.get(state) or self._dispatch_tables(state)
+            self._byte_tables = self._byte_dispatch_cache.get(state) or self._byte_dispatch_tables(state)
+
+    def _in_section(self, name):
+        return bool(self._state & _SECTION_BITS[name])
+
+    def feed(self, line_number, line):
+        """ Process one raw line of the archive. """
+        line = line.strip()
+        top_lines, top_any, service_lines, service_keys, service_any = self._tables
+        rule = top_lines.get(line) or top_any
+        if rule is None:
+            if not self.service_open:
+                return
+            rule = service_lines.get(line)
+            if rule is None:
+                key, value = parse_line(line)
+                rule = service_keys.get(key, service_any)
+                if rule is None:
+                    return
+                action, section = rule
+                if action is _field_action:
+                    # Plain fields are most of an archive; skip the action call.
+                    self._field_event(section, key, value, line_number)
+                else:
+                    action(self, section, line_number, line, key, value)
+                return
+        rule[0](self, rule[1], line_number, line, None, None)
 
-    except Exception as e:
-        if validate_only:
-            return False, "Error: {0}".format(str(e)), lines[line_number - 1]
+    def feed_bytes(self, line_number, raw, chunk=None):
+        """
+        Process one raw line of a UTF-8 archive given as bytes.  Marker lines
+        are matched without decoding, key lines only decode their value, and
+        message body lines are not decoded at all: the handler gets chunk (raw
+        when not given) as their body_chunk text.  The same goes for the body
+        sections listed in raw_bodies.
+        """
+        stripped = raw.strip()
+        markers, service_keys = self._byte_tables
+        rule = markers.get(stripped)
+        if rule is None and _DASH in stripped:
+            # str.strip() also drops Unicode whitespace around a marker.
+            stripped = strip_bytes(raw)
+            rule = markers.get(stripped)
+        if rule is not None:
+            action, section, needs_service = rule
+            if needs_service and not self.service_open:
+                return
+            return action(self, section, line_number, None, None, None)
+        top_any = self._tables[1]
+        if top_any is not None:
+            if top_any[1] in self.raw_bodies:
+                return top_any[0](self, top_any[1], line_number, raw if chunk is None else chunk, None, None)
+            return top_any[0](self, top_any[1], line_number, stripped.decode('utf-8').strip(), None, None)
+        if not self.service_open:
+            return
+        colon = stripped.find(b':')
+        if colon >= 0:
+            key = stripped[:colon].strip()
+            rule = service_keys.get(key) or service_keys.get(strip_bytes(key))
+            if rule is not None:
+                action, section, key = rule
+                value = stripped[colon + 1:].decode('utf-8').strip()
+                if action is _field_action:
+                    self._field_event(section, key, value, line_number)
+                else:
+                    action(self, section, line_number, stripped.decode('utf-8').strip(), key, value)
+                return
+        rule = self._tables[4]
+        if rule is None or rule[0] is _ignore_action:
+            return
+        action, section = rule
+        if action is _message_body_action or section in self.raw_bodies:
+            action(self, section, line_number, raw if chunk is None else chunk, None, None)
         else:
-            raise
+            action(self, section, line_number, stripped.decode('utf-8').strip(), None, None)
 
-def display_services(services):
-    for service in services:
-        print("Service Entry: {0}".format(service['Entry']))
-        print("Service: {0}".format(service['Service']))
-        print("Service Type: {0}".format(service['ServiceType']))
-        print("Service Location: {0}".format(service['ServiceLocation']))
-        print("TimeZone: {0}".format(service['TimeZone']))
-        
-        if 'Info' in service and service['Info']:
-            print("Info: {0}".format(service['Info'].strip()))
-        
-        print("Interactions: {0}".format(', '.join(service['Interactions'])))
-        print("Status: {0}".format(', '.join(service.get('Status', []))))
-        
-        if 'Categorization' in service and service['Categorization']:
-            for category_type, category_levels in service['Categorization'].items():
-                print("{0}: {0}".format(category_type, ', '.join(category_levels)))
-        
-        print("Category List:")
-        for category in service['Categories']:
-            print("  Type: {0}, Level: {1}".format(category.get('Type', ''), category.get('Level', '')))
-            print("  ID: {0}".format(category['ID']))
-            print("  In SubID: {0}".format(category['InSub']))
-            print("  Headline: {0}".format(category['Headline']))
-            print("  Description: {0}".format(category['Description'].strip()))
-            print("")
-        
-        print("User List:")
-        for user_id, user_info in service['Users'].items():
-            print("  User ID: {0}".format(user_id))
-            print("    Name: {0}".format(user_info['Name']))
-            print("    Handle: {0}".format(user_info['Handle']))
-            print("    Email: {0}".format(user_info.get('Email', '')))
-            print("    Phone: {0}".format(user_info.get('Phone', '')))
-            print("    Location: {0}".format(user_info.get('Location', '')))
-            print("    Website: {0}".format(user_info.get('Website', '')))
-            print("    Avatar: {0}".format(user_info.get('Avatar', '')))
-            print("    Banner: {0}".format(user_info.get('Banner', '')))
-            print("    Joined: {0}".format(user_info.get('Joined', '')))
-            print("    Birthday: {0}".format(user_info.get('Birthday', '')))
-            print("    HashTags: {0}".format(user_info.get('HashTags', '')))
-            print("    ExtraFields:")
-            print("      {0}".format(user_info.get('ExtraFields', '').strip()))
-            print("    Bio:")
-            print("      {0}".format(user_info.get('Bio', '').strip()))
-            print("    Signature:")
-            print("      {0}".format(user_info.get('Signature', '').strip()))
-            print("")
-        
-        print("Message Threads:")
-        for idx, thread in enumerate(service['MessageThreads']):
-            print("  --- Message Thread {0} ---".format(idx + 1))
-            if thread['Title']:
-                print("    Title: {0}".format(thread['Title']))
-            if 'Category' in thread:
-                print("    Category: {0}".format(', '.join(thread['Category'])))
-            if 'Forum' in thread:
-                print("    Forum: {0}".format(', '.join(thread['Forum'])))
-            if 'Type' in thread:
-                print("    Type: {0}".format(thread['Type']))
-            if 'State' in thread:
-                print("    State: {0}".format(thread['State']))
-            if 'Keywords' in thread:
-                print("    Keywords: {0}".format(thread['Keywords']))
-            
-            for message in thread['Messages']:
-                print("    {0} ({1} on {2}): [{3}] Post ID: {4} Nested: {5}".format(
-                    message['Author'], message['Time'], message['Date'],
-                    message.get('SubType', 'Post' if message['Post'] == 1 or message['Nested'] == 0 else 'Reply'),
-                    message['Post'], message['Nested']))
-                
-                # Indent each line of the message body but keep it at the same level
-                print("      {0}".format(message['Message'].strip()))
-                
-                if 'Polls' in message and message['Polls']:
-                    print("      Polls:")
-                    for poll in message['Polls']:
-                        print("        Poll {0}:".format(poll.get('Num', '')))
-                        print("          Question: {0}".format(poll.get('Question', '')))
-                        print("          Answers: {0}".format(", ".join(poll.get('Answers', []))))
-                        print("          Results: {0}".format(", ".join(str(r) for r in poll.get('Results', []))))
-                        print("          Percentage: {0}".format(", ".join("{:.2f}".format(float(p)) for p in poll.get('Percentage', []))))
-                        print("          Votes: {0}".format(poll.get('Votes', '')))
-            print("")
+    # Reader actions, see the rule tables above.
 
-def display_services_from_file(filename):
-    services = parse_file(filename, False, False);
-    return display_services(services)
+    def _start(self, section, line_number, line, key, value):
+        self._set_section(section, True)
+        self._start_section(section, line_number)
 
-def services_to_html(services):
-    """
-    Render the services list as a styled HTML document string.
+    def _end(self, section, line_number, line, key, value):
+        self._set_section(section, False)
+        self._end_section(section, line_number)
 
-    Args:
-        services (list of dict): Parsed services data structure.
+    def _start_service(self, section, line_number, line, key, value):
+        self.service_open = True
+        self._start_section(section, line_number)
 
-    Returns:
-        str: A complete HTML page.
-    """
-    lines = []
-    # Document head
-    lines.append('<!DOCTYPE html>')
-    lines.append('<html lang="en">')
-    lines.append('<head>')
-    lines.append('  <meta charset="UTF-8">')
-    lines.append('  <meta name="viewport" content="width=device-width, initial-scale=1.0">')
-    lines.append('  <title>Services Report</title>')
-    lines.append('  <style>')
-    lines.append('    body { font-family: Arial, sans-serif; margin: 20px; background: #f9f9f9; }')
-    lines.append('    .service-card { background: #fff; border: 1px solid #ddd; border-radius: 8px; padding: 16px; margin-bottom: 20px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }')
-    lines.append('    .service-card h2 { margin-top: 0; color: #333; }')
-    lines.append('    .thread-card { background: #fafafa; border-left: 4px solid #007BFF; padding: 12px; margin: 10px 0; }')
-    lines.append('    .message-list { list-style: none; padding-left: 0; }')
-    lines.append('    .message-list li { margin-bottom: 10px; }')
-    lines.append('    .poll-card { background: #f0f8ff; border: 1px solid #cce; border-radius: 4px; padding: 10px; margin: 10px 0; }')
-    lines.append('  </style>')
-    lines.append('</head>')
-    lines.append('<body>')
-    lines.append('<div class="services-container">')
+    def _end_service(self, section, line_number, line, key, value):
+        self.service_open = False
+        self._end_section(section, line_number)
 
-    # Service cards
-    for svc in services:
-        entry = svc.get('Entry', '')
-        name = svc.get('Service', '')
-        lines.append('<div class="service-card">')
-        lines.append('  <h2>Service Entry: {0} — {1}</h2>'.format(
-            escape(unicode_type(entry)), escape(unicode_type(name))))
+    def _end_user(self, section, line_number, line, key, value):
+        self.user_open = False
+        self._end(section, line_number, line, key, value)
 
-        # Info
-        info = svc.get('Info', '').strip()
-        if info:
-            lines.append('  <p><strong>Info:</strong> <blockquote style="white-space: pre-wrap;">{0}</blockquote></p>'.format(
-                escape(unicode_type(info))))
-
-        # Interactions & Status
-        interactions = svc.get('Interactions', [])
-        if interactions:
-            items = ', '.join(escape(unicode_type(i)) for i in interactions)
-            lines.append('  <p><strong>Interactions:</strong> {0}</p>'.format(items))
-        status = svc.get('Status', [])
-        if status:
-            items = ', '.join(escape(unicode_type(s)) for s in status)
-            lines.append('  <p><strong>Status:</strong> {0}</p>'.format(items))
-
-        # Categories
-        cats = svc.get('Categories', [])
-        if cats:
-            lines.append('  <h3>Categories</h3>')
-            lines.append('  <ul>')
-            for cat in cats:
-                headline = cat.get('Headline', '')
-                level = cat.get('Level', '')
-                lines.append('    <li>{0} (<em>{1}</em>)</li>'.format(
-                    escape(unicode_type(headline)), escape(unicode_type(level))))
-            lines.append('  </ul>')
+    def _start_post(self, section, line_number, line, key, value):
+        self.post_open = True
+        self.post_has_body = False
+        self._start(section, line_number, line, key, value)
+
+    def _end_post(self, section, line_number, line, key, value):
+        self.post_open = False
+        self._end(section, line_number, line, key, value)
+
+    def _start_user_body(self, section, line_number, line, key, value):
+        if self.user_open:
+            self._start(section, line_number, line, key, value)
+
+    def _end_user_body(self, section, line_number, line, key, value):
+        if self.user_open and self._in_section(section):
+            self._end(section, line_number, line, key, value)
+
+    def _start_message_body(self, section, line_number, line, key, value):
+        if self.post_open:
+            self.post_has_body = True
+            self._start(section, line_number, line, key, value)
+
+    def _end_message_body(self, section, line_number, line, key, value):
+        if self.post_open and self.post_has_body:
+            self._end(section, line_number, line, key, value)
+
+    def _message_body_line(self, section, line_number, line, key, value):
+        if self.post_open and self.post_has_body:
+            self._body_chunk(section, line, line_number)
+
+    def _field(self, section, line_number, line, key, value):
+        self._field_event(section, key, value, line_number)
+
+    def _user_field(self, section, line_number, line, key, value):
+        self.user_open = True
+        self._field_event(section, key, value, line_number)
+
+    def _poll_field(self, section, line_number, line, key, value):
+        key, value = parse_line(line)
+        if key:
+            self._field_event(section, key, value, line_number)
+
+    def _body(self, section, line_number, line, key, value):
+        self._body_chunk(section, line, line_number)
+
+    def _ignore(self, section, line_number, line, key, value):
+        pass
+
+
+_field_action = getattr(ArchiveEventReader, '_field')
+_DASH = b'-'[0]
+_ignore_action = getattr(ArchiveEventReader, '_ignore')
+_message_body_action = getattr(ArchiveEventReader, '_message_body_line')
+
+
+class _ArchiveEventQueue(ArchiveContentHandler):
+    """ Collects events as (event, line_number, section, key, value) tuples. """
+
+    def __init__(self):
+        self.events = []
+
+    def start_section(self, section, line_number):
+        self.events.append(('start_section', line_number, section, None, None))
+
+    def end_section(self, section, line_number):
+        self.events.append(('end_section', line_number, section, None, None))
+
+    def field(self, section, key, value, line_number):
+        self.events.append(('field', line_number, section, key, value))
+
+    def body_chunk(self, section, text, line_number):
+        self.events.append(('body_chunk', line_number, section, None, text))
+
+
+def parse_events(lines, handler):
+    """
+    Push the events of an archive into handler (an ArchiveContentHandler)
+    without building any services.  Returns the handler.
+    """
+    reader = ArchiveEventReader(handler)
+    for line_number, line in enumerate(lines, 1):
+        reader.feed(line_number, line)
+    return handler
+
+def parse_events_from_file(filename, handler):
+    return parse_events(iter_file_lines(filename), handler)
+
+def iter_archive_events(lines):
+    """
+    Pull parser over the archive text format, similar to ET.iterparse.
+    Yields (event, line_number, section, key, value) tuples where event is
+    'start_section', 'end_section', 'field' or 'body_chunk'; body chunks carry
+    the line text as value.
+    """
+    queue = _ArchiveEventQueue()
+    reader = ArchiveEventReader(queue)
+    events = queue.events
+    for line_number, line in enumerate(lines, 1):
+        reader.feed(line_number, line)
+        if events:
+            for event in events:
+                yield event
+            del events[:]
+
+def iter_archive_events_from_file(filename):
+    return iter_archive_events(iter_file_lines(filename))
+
+
+class ParseStats(ArchiveContentHandler):
+    """
+    Parser instrumentation.  Pass an instance as hooks= to parse_lines,
+    parse_file, parse_string or parse_file_mmap and it collects, per section,
+    how often it was opened, its fields and body lines and the time spent in
+    it; the time of each parse phase ('read', 'parse'); the lines and bytes
+    processed; the slowest section instances; and, when values are interned,
+    how many were shared and the bytes that saved.  Without hooks the parser
+    runs exactly as before and pays nothing.
+
+    Subclass it (or ArchiveContentHandler plus begin_phase, end_phase,
+    add_input and add_interned) to feed other monitoring; every call comes
+    from the parser driving the reader.
+    """
+
+    def __init__(self, slowest=10, clock=None):
+        self.clock = clock or _perf_counter
+        self.slowest_limit = slowest
+        self.lines = 0
+        self.bytes = 0
+        self.phases = {}
+        self.sections = {}
+        self.interning = {'values': 0, 'hits': 0, 'saved_bytes': 0}
+        self._slowest = []
+        self._open_sections = {}
+        self._open_phases = {}
+        self._sequence = 0
+
+    def _section(self, section):
+        stats = self.sections.get(section)
+        if stats is None:
+            stats = self.sections[section] = {'count': 0, 'fields': 0, 'body_lines': 0, 'seconds': 0.0}
+        return stats
+
+    def begin_phase(self, phase):
+        self._open_phases[phase] = self.clock()
+
+    def end_phase(self, phase):
+        started = self._open_phases.pop(phase, None)
+        if started is not None:
+            self.phases[phase] = self.phases.get(phase, 0.0) + (self.clock() - started)
+
+    def add_input(self, lines, size):
+        """ Count lines and bytes handed to the parser. """
+        self.lines += lines
+        self.bytes += size
+
+    def add_interned(self, values, hits, saved_bytes):
+        """ Count values shared by a ValueInterner and the bytes that saved. """
+        self.interning['values'] = values
+        self.interning['hits'] += hits
+        self.interning['saved_bytes'] += saved_bytes
+
+    def start_section(self, section, line_number):
+        self._section(section)['count'] += 1
+        self._open_sections.setdefault(section, []).append((self.clock(), line_number))
+
+    def end_section(self, section, line_number):
+        opened = self._open_sections.get(section)
+        if not opened:
+            return
+        started, start_line = opened.pop()
+        seconds = self.clock() - started
+        self._section(section)['seconds'] += seconds
+        if self.slowest_limit:
+            self._sequence += 1
+            entry = (seconds, self._sequence, section, start_line, line_number)
+            if len(self._slowest) < self.slowest_limit:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+
+    def field(self, section, key, value, line_number):
+        self._section(section)['fields'] += 1
+
+    def body_chunk(self, section, text, line_number):
+        self._section(section)['body_lines'] += 1
+
+    def slowest_sections(self):
+        """ Return the slowest section instances, slowest first. """
+        return [{'section': section, 'start_line': start_line, 'end_line': end_line, 'seconds': seconds}
+                for seconds, _, section, start_line, end_line in sorted(self._slowest, reverse=True)]
+
+    def to_dict(self):
+        return {
+            'lines': self.lines,
+            'bytes': self.bytes,
+            'phases': dict(self.phases),
+            'sections': dict((section, dict(stats)) for section, stats in self.sections.items()),
+            'interning': dict(self.interning),
+            'slowest': self.slowest_sections(),
+        }
+
+    def log(self, logger=None, level=logging.INFO):
+        """ Write the statistics to a logger (the 'pytextarchive' logger by default). """
+        logger = logger or logging.getLogger("pytextarchive")
+        logger.log(level, "Parsed %d lines (%d bytes)", self.lines, self.bytes)
+        for phase, seconds in sorted(self.phases.items()):
+            logger.log(level, "Phase %s: %.6fs", phase, seconds)
+        if self.interning['hits']:
+            logger.log(level, "Interned %d values: %d shared, %d bytes saved", self.interning['values'],
+                       self.interning['hits'], self.interning['saved_bytes'])
+        for section, stats in sorted(self.sections.items(), key=lambda item: -item[1]['seconds']):
+            logger.log(level, "Section %s: %d opened, %d fields, %d body lines, %.6fs",
+                       section, stats['count'], stats['fields'], stats['body_lines'], stats['seconds'])
+        for entry in self.slowest_sections():
+            logger.log(level, "Slow section %s on lines %d-%d: %.6fs",
+                       entry['section'], entry['start_line'], entry['end_line'], entry['seconds'])
+
+    def save_json(self, filename):
+        """ Save the statistics as JSON, compressed by file extension like save_to_json_file. """
+        save_compressed_file(json.dumps(self.to_dict(), indent=2), filename)
+
+
+class _InstrumentedHandler(ArchiveContentHandler):
+    """ Passes reader events to the parser and to its hooks, timing around the parser's work. """
+
+    def __init__(self, handler, hooks):
+        self.handler = handler
+        self.hooks = hooks
+
+    def start_section(self, section, line_number):
+        self.hooks.start_section(section, line_number)
+        self.handler.start_section(section, line_number)
+
+    def end_section(self, section, line_number):
+        self.handler.end_section(section, line_number)
+        self.hooks.end_section(section, line_number)
+
+    def field(self, section, key, value, line_number):
+        self.handler.field(section, key, value, line_number)
+        self.hooks.field(section, key, value, line_number)
+
+    def body_chunk(self, section, text, line_number):
+        self.handler.body_chunk(section, text, line_number)
+        self.hooks.body_chunk(section, text, line_number)
+
+
+def _file_stamp(filename):
+    # (absolute path, modification time, size) of a file, None if it cannot be read.
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (os.path.abspath(filename), stat.st_mtime, stat.st_size)
+
+
+class _CachedInclude(object):
+    """ An include served from the cache. """
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def get(self):
+        return pickle.loads(self.data)
+
+
+class _InlineInclude(object):
+    """ An include parsed in this process when its result is asked for. """
+
+    __slots__ = ('resolver', 'key', 'args')
+
+    def __init__(self, resolver, key, args):
+        self.resolver = resolver
+        self.key = key
+        self.args = args
+
+    def get(self):
+        entry = self.resolver._lookup(self.key)
+        if entry is not None:
+            result = pickle.loads(entry[0])
+        else:
+            result, stamps = self.resolver._parse(*self.args)
+            entry = (pickle.dumps(result, pickle.HIGHEST_PROTOCOL), stamps)
+            self.resolver._store(self.key, entry)
+        self.resolver._depend(self.key, entry[1])
+        return result
+
+
+class _PooledInclude(object):
+    """ An include submitted to the worker pool; get() waits for it. """
+
+    __slots__ = ('resolver', 'key', 'result')
+
+    def __init__(self, resolver, key, result):
+        self.resolver = resolver
+        self.key = key
+        self.result = result
+
+    def get(self):
+        try:
+            entry = self.result.get()
+        finally:
+            with self.resolver._lock:
+                self.resolver._running.pop(self.key, None)
+        self.resolver._store(self.key, entry)
+        self.resolver._depend(self.key, entry[1])
+        return pickle.loads(entry[0])
+
+
+def _parse_include(args):
+    """ Pool worker for IncludeResolver; the result comes back pickled with its include stamps, ready for the cache. """
+    result, stamps = get_include_resolver()._parse(*args)
+    return pickle.dumps(result, pickle.HIGHEST_PROTOCOL), stamps
+
+
+class IncludeResolver(object):
+    """
+    Parses the files named in include sections.  Each file is submitted as
+    soon as its line is read, so with max_workers above one the included
+    files are parsed on a pool of that many worker processes while the
+    parent archive is still being read; the results are handed back in
+    declaration order when the section ends, and the first failing file in
+    that order raises its error.  max_workers defaults to one, which parses
+    includes in this process without starting a pool; None or 0 uses every
+    CPU.  Verbose parses and parses inside a worker process also resolve
+    includes in this process.
+
+    Results are cached, pickled, by absolute path, modification time and
+    size, so a file shared by several sections or services is parsed once;
+    every caller gets its own copy.  A cached result also records the
+    modification time and size of every file it included in turn, and is
+    parsed again once any of them changed.  The least recently used results
+    are dropped once the cache holds more than cache_bytes of pickled data
+    (0 disables it).  hits and misses count cache lookups.  An include that
+    is already being parsed further up the include chain of the same thread
+    raises ValueError.  A resolver may be shared by parses in several threads.
+    """
+
+    def __init__(self, max_workers=1, cache_bytes=64 * 1024 * 1024):
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.cache_bytes = cache_bytes
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._running = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _key(self, filename, validate_only, records):
+        stamp = _file_stamp(filename)
+        if stamp is None:
+            return None
+        return stamp + (bool(validate_only), bool(records))
+
+    def _lookup(self, key):
+        # The cached (pickled result, include stamps) of key, if every included file is unchanged.
+        with self._lock:
+            entry = self._cache.pop(key, None) if key is not None else None
+            if entry is not None and all(_file_stamp(stamp[0]) == stamp for stamp in entry[1]):
+                self._cache[key] = entry
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self._cached_bytes -= len(entry[0])
+            self.misses += 1
+            return None
+
+    def _store(self, key, entry):
+        if key is None or len(entry[0]) > self.cache_bytes:
+            return
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self._cached_bytes -= len(old[0])
+            self._cache[key] = entry
+            self._cached_bytes += len(entry[0])
+            self._evict()
+
+    def _evict(self):
+        # Callers hold self._lock.
+        while self._cached_bytes > self.cache_bytes:
+            self._cached_bytes -= len(self._cache.popitem(last=False)[1][0])
+
+    def _frames(self):
+        # [path, stamps] of the includes this thread is parsing, outermost first.
+        frames = getattr(self._local, 'frames', None)
+        if frames is None:
+            frames = self._local.frames = []
+        return frames
+
+    def _depend(self, key, stamps):
+        # Record an include resolved while parsing the innermost include of this thread.
+        frames = self._frames()
+        if frames and key is not None:
+            frames[-1][1].append(key[:3])
+            frames[-1][1].extend(stamps)
+
+    def _parse(self, filename, validate_only=False, verbose=False, records=False):
+        # parse_file result and the stamps of the files it included, at any depth.
+        path = os.path.abspath(filename)
+        frames = self._frames()
+        active = [frame[0] for frame in frames]
+        if path in active:
+            chain = active[active.index(path):] + [path]
+            raise ValueError("Include cycle: {0}".format(" -> ".join(chain)))
+        frames.append([path, []])
+        try:
+            result = parse_file(filename, validate_only, verbose, records=records)
+        finally:
+            stamps = frames.pop()[1]
+        return result, stamps
+
+    def parse(self, filename, validate_only=False, verbose=False, records=False):
+        """ parse_file an included file in this thread, refusing include cycles. """
+        return self._parse(filename, validate_only, verbose, records)[0]
+
+    def submit(self, filename, validate_only=False, verbose=False, records=False):
+        """ Start parsing an included file; returns an object whose get() gives the parse_file result. """
+        args = (filename, validate_only, verbose, records)
+        key = None if verbose else self._key(filename, validate_only, records)
+        if verbose or self.max_workers < 2 or multiprocessing.current_process().daemon:
+            return _InlineInclude(self, key, args)
+        with self._lock:
+            result = self._running.get(key) if key is not None else None
+            if result is not None:
+                self.hits += 1
+                return _PooledInclude(self, key, result)
+        entry = self._lookup(key)
+        if entry is not None:
+            self._depend(key, entry[1])
+            return _CachedInclude(entry[0])
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.max_workers, _reset_include_resolver)
+            result = self._pool.apply_async(_parse_include, (args,))
+            if key is not None:
+                self._running[key] = result
+        return _PooledInclude(self, key, result)
+
+    def parse_all(self, file_list, validate_only=False, verbose=False, records=False):
+        """ parse_file results for file_list, in order. """
+        pending = [self.submit(filename, validate_only, verbose, records) for filename in file_list]
+        return [include.get() for include in pending]
+
+    def cache_info(self):
+        """ Cache counters: hits, misses, entries, bytes and the byte budget. """
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._cache),
+                'bytes': self._cached_bytes, 'cache_bytes': self.cache_bytes}
+
+    def clear_cache(self):
+        """ Drop every cached result and reset the counters. """
+        with self._lock:
+            self._cache.clear()
+            self._cached_bytes = 0
+            self.hits = self.misses = 0
+
+    def close(self):
+        """ Shut down the worker pool, if one was started. """
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._running.clear()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+_include_resolver = None
+
+
+def get_include_resolver():
+    """ The IncludeResolver shared by every parse in this process. """
+    global _include_resolver
+    if _include_resolver is None:
+        _include_resolver = IncludeResolver()
+        atexit.register(_close_include_resolver)
+    return _include_resolver
+
+
+def set_include_workers(max_workers):
+    """ Limit include resolution to max_workers processes (1 parses includes inline, None uses every CPU). """
+    get_include_resolver().close()
+    get_include_resolver().max_workers = max_workers or multiprocessing.cpu_count()
+
+
+def set_include_cache_size(cache_bytes):
+    """ Set the byte budget of the include cache; 0 disables it. """
+    resolver = get_include_resolver()
+    with resolver._lock:
+        resolver.cache_bytes = cache_bytes
+        resolver._evict()
+
+
+def _reset_include_resolver():
+    # Pool initializer: a forked worker starts its own resolver, whose lock no other thread holds.
+    global _include_resolver
+    _include_resolver = None
+
+
+def _close_include_resolver():
+    if _include_resolver is not None:
+        _include_resolver.close()
+
+
+def _content_digest(filename):
+    """ SHA-1 of a (possibly compressed) archive's content and whether it has include sections. """
+    digest = hashlib.sha1()
+    includes = False
+    tail = b''
+    with open_archive_input(filename) as file:
+        while True:
+            block = file.read(_UTF8_CHECK_BLOCK)
+            if not block:
+                break
+            digest.update(block)
+            if not includes:
+                includes = b'--- Include ' in tail + block[:16] or b'--- Include ' in block
+                tail = block[-16:]
+    return digest.digest(), includes
+
+
+def default_cache_directory():
+    """ Where ParseCache keeps its snapshots unless told otherwise. """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pytextarchive')
+
+
+class ParseCache(object):
+    """
+    Compiled snapshots of parse_file results on disk, so an unchanged
+    archive is loaded instead of parsed again.  Each snapshot is a header
+    (format version, records flag, source size, modification time and a
+    SHA-1 of the archive content) followed by the pickled services, in one
+    file per archive and records flag under directory.
+
+    A snapshot is used when the size and modification time still match, or
+    when only the time changed and the content hash still matches.  The
+    least recently used snapshots are deleted once they take more than
+    max_bytes together; a result bigger than that is not stored.  Archives
+    with include sections are never stored, as their results also depend on
+    the included files.  hits and misses count lookups.
+    """
+
+    MAGIC = b'PTAC'
+    FORMAT_VERSION = 1
+    _HEADER = struct.Struct(str('<4sHBQQ20s'))
+
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024):
+        self.directory = directory or default_cache_directory()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, filename, records):
+        key = '{0}\0{1:d}'.format(os.path.abspath(filename), bool(records))
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.cache')
+
+    @staticmethod
+    def _stat(filename):
+        stat = os.stat(filename)
+        return stat.st_size, getattr(stat, 'st_mtime_ns', None) or int(stat.st_mtime * 1e9)
+
+    def load(self, filename, records=False):
+        """ The cached services of filename, or None when there is no usable snapshot. """
+        entry = self._entry(filename, records)
+        try:
+            size, mtime = self._stat(filename)
+            with io.open(entry, 'rb') as file:
+                header = self._HEADER.unpack(file.read(self._HEADER.size))
+                magic, version, cached_records, cached_size, cached_mtime, digest = header
+                if magic != self.MAGIC or version != self.FORMAT_VERSION or cached_size != size:
+                    header = None
+                elif cached_mtime != mtime and _content_digest(filename)[0] != digest:
+                    header = None
+                if header is not None:
+                    services = pickle.load(file)
+        except (IOError, OSError):
+            header = None
+        except Exception:
+            # Truncated or written by an incompatible version
+            self._remove(entry)
+            header = None
+        if header is None:
+            self.misses += 1
+            return None
+        if cached_mtime != mtime:
+            # Touched but unchanged, skip the hash next time
+            try:
+                with io.open(entry, 'r+b') as file:
+                    file.write(self._HEADER.pack(self.MAGIC, self.FORMAT_VERSION, bool(records), size, mtime, digest))
+            except (IOError, OSError):
+                pass
+        try:
+            os.utime(entry, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return services
+
+    def store(self, filename, records, services):
+        """ Save a snapshot of services, the parse_file result for filename. """
+        try:
+            size, mtime = self._stat(filename)
+            digest, includes = _content_digest(filename)
+            if includes or self._stat(filename) != (size, mtime):
+                return False
+            data = pickle.dumps(services, pickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError, pickle.PicklingError, TypeError):
+            return False
+        if self._HEADER.size + len(data) > self.max_bytes:
+            return False
+        entry = self._entry(filename, records)
+        temporary = '{0}.{1}.tmp'.format(entry, os.getpid())
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with io.open(temporary, 'wb') as file:
+                file.write(self._HEADER.pack(self.MAGIC, self.FORMAT_VERSION, bool(records), size, mtime, digest))
+                file.write(data)
+            _replace_file(temporary, entry)
+        except (IOError, OSError):
+            self._remove(temporary)
+            return False
+        self._evict()
+        return True
+
+    def _entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if name.endswith('.cache'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def cache_info(self):
+        """ Cache counters: hits, misses, entries, bytes and the byte budget. """
+        entries = self._entries()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries), 'max_bytes': self.max_bytes}
+
+    def clear_cache(self):
+        """ Delete every snapshot and reset the counters. """
+        for _, _, path in self._entries():
+            self._remove(path)
+        self.hits = self.misses = 0
+
+
+_parse_cache = None
+
+
+def get_parse_cache():
+    """ The ParseCache parse_file consults, or None when caching is off (the default). """
+    return _parse_cache
+
+
+def enable_parse_cache(directory=None, max_bytes=256 * 1024 * 1024):
+    """ Have parse_file keep snapshots in directory (see ParseCache) and use them; returns the cache. """
+    global _parse_cache
+    _parse_cache = ParseCache(directory, max_bytes)
+    return _parse_cache
+
+
+def disable_parse_cache():
+    """ Stop parse_file from using snapshots; those on disk are kept. """
+    global _parse_cache
+    _parse_cache = None
+
+
+# Wording used by verbose mode where it differs from the plain key name.
+_VERBOSE_LABELS = {
+    'Joined': 'Joined date',
+    'Thread': 'Thread ID',
+    'AuthorID': 'Author ID',
+    'EditTime': 'Edit Time',
+    'EditDate': 'Edit Date',
+    'EditAuthor': 'Edit Author',
+    'EditAuthorID': 'Edit Author ID',
+    'PinnedID': 'Pinned ID',
+}
+
+
+class ValueInterner(object):
+    """
+    Hands out one shared object for equal field values, so the thousands of
+    posts repeating the same author, date or type keep a single string.  At
+    most max_entries distinct values are kept; past that new values pass
+    through unshared.  hits counts values that were replaced by a shared one
+    and saved_bytes the size of the objects that could be dropped.  Give the
+    same interner to several parses to share values between archives.
+    """
+
+    def __init__(self, max_entries=65536):
+        self.max_entries = max_entries
+        self.values = {}
+        self.hits = 0
+        self.saved_bytes = 0
+
+    def intern(self, value):
+        shared = self.values.get(value)
+        if shared is None:
+            if len(self.values) < self.max_entries:
+                self.values[value] = value
+            return value
+        if shared is not value:
+            self.hits += 1
+            self.saved_bytes += sys.getsizeof(value)
+        return shared
+
+    def intern_items(self, value):
+        """ Split a comma separated value into a shared tuple of its stripped items. """
+        items = tuple(item.strip() for item in value.split(","))
+        shared = self.values.get(items)
+        if shared is None:
+            items = tuple(self.intern(item) for item in items)
+            if len(self.values) < self.max_entries:
+                self.values[items] = items
+            return items
+        self.hits += 1
+        # The list parse_lines would have built, and its fresh items.
+        self.saved_bytes += sys.getsizeof(list(items)) + sum(sys.getsizeof(item) for item in items)
+        return shared
+
+
+_MISSING = object()
+
+
+class Record(MutableMapping):
+    """
+    Base of the compact records parse_file(records=True) returns for users,
+    categories, threads, posts and polls.  The usual keys of a record are
+    __slots__, any other key goes into a small dict, and the whole thing
+    behaves like a dict with its keys in archive order, at a fraction of
+    the memory.  Unset keys are simply missing, as with a dict.
+    """
+
+    __slots__ = ('_extra',)
+    _fields = ()
+    _field_set = frozenset()
+
+    def __init__(self, *args, **kwargs):
+        self._extra = None
+        if args or kwargs:
+            self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self._field_set:
+            setattr(self, key, value)
+        elif self._extra is None:
+            self._extra = {key: value}
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._field_set:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        elif self._extra is None:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def __iter__(self):
+        for name in self._fields:
+            if getattr(self, name, _MISSING) is not _MISSING:
+                yield name
+        if self._extra is not None:
+            for key in self._extra:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        if key in self._field_set:
+            return getattr(self, key, _MISSING) is not _MISSING
+        return self._extra is not None and key in self._extra
+
+    def get(self, key, default=None):
+        if key in self._field_set:
+            return getattr(self, key, default)
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
+
+    def copy(self):
+        return type(self)(self)
+
+    def __repr__(self):
+        return "{0}({1!r})".format(type(self).__name__, dict(self.items()))
+
+    def __reduce__(self):
+        return (type(self), (), None, None, iter(list(self.items())))
+
+
+class UserRecord(Record):
+    """ A user of a service, see Record. """
+
+    __slots__ = _fields = (
+        'ExtraFields', 'Bio', 'Signature', 'Name', 'Handle', 'Email', 'Phone', 'Location', 'Website', 'Avatar',
+        'Banner', 'Joined', 'Birthday', 'HashTags')
+    _field_set = frozenset(_fields)
+
+
+class CategoryRecord(Record):
+    """ A category or forum, see Record. """
+
+    __slots__ = _fields = ('Kind', 'ID', 'InSub', 'Headline', 'Description', 'Type', 'Level')
+    _field_set = frozenset(_fields)
+
+
+class ThreadRecord(Record):
+    """ A message thread, see Record. """
+
+    __slots__ = _fields = ('Title', 'Messages', 'Thread', 'Type', 'State', 'Keywords', 'Category', 'Forum')
+    _field_set = frozenset(_fields)
+
+
+class PostRecord(Record):
+    """ A message post, see Record. """
+
+    __slots__ = _fields = (
+        'Author', 'AuthorID', 'Time', 'Date', 'EditTime', 'EditDate', 'EditAuthor', 'EditAuthorID', 'SubType',
+        'SubTitle', 'Tags', 'Post', 'PinnedID', 'Nested', 'Message', 'Polls')
+    _field_set = frozenset(_fields)
+
+
+class PollRecord(Record):
+    """ A poll of a post, see Record. """
+
+    __slots__ = _fields = ('Num', 'Question', 'Answers', 'Results', 'Percentage', 'Votes')
+    _field_set = frozenset(_fields)
+
+
+class ServicesTextParser(ArchiveContentHandler):
+    """
+    Builds the services structure from ArchiveEventReader events.  This is
+    the handler behind parse_lines; feed it lines with feed() or attach it to
+    a reader yourself.  The finished services are collected in self.services.
+
+    With emit set to 'service', 'thread' or 'post' finished records are not
+    attached to their parent but queued in self.pending instead, as a service,
+    a (service, thread) or a (service, thread, post) tuple, so streaming
+    callers only ever hold one record at a time.
+
+    hooks (a ParseStats or similar) also receives every reader event.  With
+    records users, categories, threads, posts and polls are built as the
+    compact Record types instead of dicts.  interner (True for one per
+    parse, or a ValueInterner) shares repeated values of the low-cardinality
+    fields and turns Category and Forum lists into shared tuples.
+    """
+
+    def __init__(self, validate_only=False, verbose=False, emit=None, hooks=None, records=False, interner=None):
+        if emit not in (None, 'service', 'thread', 'post'):
+            raise ValueError("Invalid emit value '{0}'. Expected 'service', 'thread' or 'post'.".format(emit))
+        self.validate_only = validate_only
+        self.verbose = verbose
+        self.records = records
+        self._user_record = UserRecord if records else dict
+        self._category_record = CategoryRecord if records else dict
+        self._thread_record = ThreadRecord if records else dict
+        self._post_record = PostRecord if records else dict
+        self._poll_record = PollRecord if records else dict
+        self.interner = ValueInterner() if interner is True else interner
+        if self.interner is not None:
+            self._field_handlers = _interning_field_handlers(type(self))
+            self._interned_from = (self.interner.hits, self.interner.saved_bytes)
+        self.emit = emit
+        self.pending = []
+        self.services = []
+        self.current_service = None
+        self.include_files = []
+        self.include_pending = []
+        self.user_id = None
+        self.current_extrafields = None
+        self.current_bio = None
+        self.current_signature = None
+        self.current_description = None
+        self.current_message = None
+        self.current_thread = None
+        # Post IDs seen in the current thread, for checking Nested.
+        self.thread_post_ids = []
+        self.thread_post_id_set = set()
+        self.current_category = None
+        self.current_info = None
+        self.current_poll = None
+        self.current_polls = []
+        self.categorization_values = {'Categories': [], 'Forums': []}
+        self.category_ids = {'Categories': [], 'Forums': []}
+        self.hooks = hooks
+        self.reader = ArchiveEventReader(self if hooks is None else _InstrumentedHandler(self, hooks))
+
+    def feed(self, line_number, line):
+        """ Process one raw line of the archive. """
+        self.reader.feed(line_number, line)
+
+    def is_clean(self):
+        """ Whether no service or section is open, as in a fresh parser. """
+        reader = self.reader
+        if reader._state or reader.service_open or reader.user_open or reader.post_open:
+            return False
+        return all(getattr(self, name) is None for name in (
+            'current_service', 'user_id', 'current_extrafields', 'current_bio', 'current_signature',
+            'current_description', 'current_message', 'current_thread', 'current_category',
+            'current_info', 'current_poll'))
+
+    def _log(self, message, *args):
+        # Callers check self.verbose first, so quiet parses skip the call.
+        print(message.format(*args))
+
+    # ArchiveContentHandler events
+
+    def start_section(self, section, line_number):
+        self._start_handlers[section](self, line_number)
+
+    def end_section(self, section, line_number):
+        self._end_handlers[section](self, line_number)
+
+    def field(self, section, key, value, line_number):
+        handler = self._field_handlers[section]
+        if isinstance(handler, dict):
+            handler = handler[key]
+        handler(self, line_number, key, value)
+
+    def body_chunk(self, section, text, line_number):
+        self._body_handlers[section](self, line_number, text)
+
+    # Finished records
+
+    def _add_service(self, service):
+        if self.emit is None:
+            self.services.append(service)
+        elif self.emit == 'service':
+            self.pending.append(service)
+
+    def _add_thread(self, service, thread):
+        if self.emit is None or self.emit == 'service':
+            service['MessageThreads'].append(thread)
+        elif self.emit == 'thread':
+            self.pending.append((service, thread))
+
+    def _add_post(self, service, thread, post):
+        if self.emit == 'post':
+            self.pending.append((service, thread, post))
+        else:
+            thread['Messages'].append(post)
+
+    def _add_included_threads(self, service, threads):
+        if self.emit is None or self.emit == 'service':
+            service['MessageThreads'].extend(threads)
+        elif self.emit == 'thread':
+            self.pending.extend((service, thread) for thread in threads)
+        else:
+            for thread in threads:
+                self.pending.extend((service, thread, post) for post in thread['Messages'])
+
+    # Include sections
+
+    def _start_include(self):
+        self.include_files = []
+        self.include_pending = []
+
+    def _add_include(self, text):
+        self.include_files.append(text)
+        self.include_pending.append(get_include_resolver().submit(text, self.validate_only, self.verbose, self.records))
+
+    def _included(self):
+        # parse_file results of the section's files, in declaration order.
+        pending, self.include_pending = self.include_pending, []
+        return [include.get() for include in pending]
+
+    def _parse_include_files(self):
+        included_services = []
+        for included in self._included():
+            included_services.extend(included)
+        return included_services
+
+    def _parse_include_users(self):
+        users = {}
+        for included in self._included():
+            for service in included:
+                users.update(service['Users'])
+        return users
+
+    def _parse_include_messages(self):
+        messages = []
+        for included in self._included():
+            for service in included:
+                messages.extend(service['MessageThreads'])
+        return messages
+
+    def _parse_include_categories(self):
+        categories = []
+        for included in self._included():
+            for service in included:
+                categories.extend(service['Categories'])
+        return categories
+
+    def _start_include_service(self, line_number):
+        self._start_include()
+        if self.verbose:
+            self._log("Line {0}: --- Include Service Start --- (Starting include service section)", line_number)
+
+    def _end_include_service(self, line_number):
+        if self.verbose:
+            self._log("Line {0}: --- Include Service End --- (Ending include service section)", line_number)
+        for service in self._parse_include_files():
+            if self.emit is None or self.emit == 'service':
+                self._add_service(service)
+            else:
+                self._add_included_threads(service, service['MessageThreads'])
+
+    def _include_service_line(self, line_number, text):
+        self._add_include(text)
+        if self.verbose:
+            self._log("Line {0}: {1} (Including file for service)", line_number, text)
+
+    def _start_include_users(self, line_number):
+        self._start_include()
+        if self.verbose:
+            self._log("Line {0}: --- Include Users Start --- (Starting include users section)", line_number)
+
+    def _end_include_users(self, line_number):
+        if self.verbose:
+            self._log("Line {0}: --- Include Users End --- (Ending include users section)", line_number)
+        if self.current_service:
+            self.current_service['Users'].update(self._parse_include_users())
+
+    def _include_users_line(self, line_number, text):
+        self._add_include(text)
+        if self.verbose:
+            self._log("Line {0}: {1} (Including file for users)", line_number, text)
+
+    def _start_include_messages(self, line_number):
+        self._start_include()
+        if self.verbose:
+            self._log("Line {0}: --- Include Messages Start --- (Starting include messages section)", line_number)
+
+    def _end_include_messages(self, line_number):
+        if self.verbose:
+            self._log("Line {0}: --- Include Messages End --- (Ending include messages section)", line_number)
+        if self.current_service:
+            self._add_included_threads(self.current_service, self._parse_include_messages())
+
+    def _include_messages_line(self, line_number, text):
+        self._add_include(text)
+        if self.verbose:
+            self._log("Line {0}: {1} (Including file for messages)", line_number, text)
+
+    def _start_include_categories(self, line_number):
+        self._start_include()
+        if self.verbose:
+            self._log("Line {0}: --- Include Categories Start --- (Starting include categories section)", line_number)
+
+    def _end_include_categories(self, line_number):
+        if self.verbose:
+            self._log("Line {0}: --- Include Categories End --- (Ending include categories section)", line_number)
+        if self.current_service:
+            self.current_service['Categories'].extend(self._parse_include_categories())
+            for category in self.current_service['Categories']:
+                kind_split = category.get('Kind', '').split(",")
+                category['Type'] = kind_split[0].strip() if len(kind_split) > 0 else ""
+                category['Level'] = kind_split[1].strip() if len(kind_split) > 1 else ""
+                self.category_ids[category['Type']].append(category['ID'])
+
+    def _include_categories_line(self, line_number, text):
+        self._add_include(text)
+        if self.verbose:
+            self._log("Line {0}: {1} (Including file for categories)", line_number, text)
+
+    # Service, comment, category and info sections
+
+    def _start_archive_service(self, line_number):
+        self.current_service = {'Users': {}, 'MessageThreads': [], 'Categories': [], 'Interactions': [], 'Categorization': {}, 'Info': ''}
+        if self.verbose:
+            self._log("Line {0}: --- Start Archive Service --- (Starting new archive service)", line_number)
+
+    def _end_archive_service(self, line_number):
+        self._add_service(self.current_service)
+        self.current_service = None
+        if self.verbose:
+            self._log("Line {0}: --- End Archive Service --- (Ending archive service)", line_number)
+
+    def _set_service_entry(self, line_number, key, value):
+        self.current_service['Entry'] = validate_non_negative_integer(value, "Entry", line_number)
+
+    def _set_service_field(self, line_number, key, value):
+        self.current_service[key] = value
+
+    def _set_service_list(self, line_number, key, value):
+        self.current_service[key] = [item.strip() for item in value.split(",")]
+        if self.verbose:
+            self._log("Line {0}: {1} set to {2}", line_number, key, self.current_service[key])
+
+    def _start_comment_section(self, line_number):
+        if self.verbose:
+            self._log("Line {0}: --- Start Comment Section --- (Starting comment section)", line_number)
+
+    def _end_comment_section(self, line_number):
+        if self.verbose:
+            self._log("Line {0}: --- End Comment Section --- (Ending comment section)", line_number)
+
+    def _comment_section_line(self, line_number, text):
+        if self.verbose:
+            self._log("Line {0}: {1} (Comment)", line_number, text)
+
+    def _start_categorization_list(self, line_number):
+        self.current_service['Categorization'] = {}
+        if self.verbose:
+            self._log("Line {0}: --- Start Categorization List --- (Starting categorization list)", line_number)
+
+    def _end_categorization_list(self, line_number):
+        if self.verbose:
+            self._log("Line {0}: --- End Categorization List --- (Ending categorization list)", line_number)
+        self.categorization_values = self.current_service['Categorization']
+
+    def _set_categorization_field(self, line_number, key, value):
+        self.current_service['Categorization'][key] = [item.strip() for item in value.split(",")]
+        if self.verbose:
+            self._log("Line {0}: {1} set to {2}", line_number, key, self.current_service['Categorization'][key])
+
+    def _start_category_list(self, line_number):
+        self.current_category = self._category_record()
+        if self.verbose:
+            self._log("Line {0}: --- Start Category List --- (Starting category list)", line_number)
+
+    def _end_category_list(self, line_number):
+        current_category = self.current_category
+        if current_category:
+            kind_split = current_category.get('Kind', '').split(",")
+            current_category['Type'] = kind_split[0].strip() if len(kind_split) > 0 else ""
+            current_category['Level'] = kind_split[1].strip() if len(kind_split) > 1 else ""
+            if current_category['Type'] not in self.categorization_values:
+                raise ValueError("Invalid 'Type' value '{0}' on line {1}. Expected one of {2}.".format(current_category['Type'], line_number, self.categorization_values.keys()))
+            if current_category['InSub'] != 0 and current_category['InSub'] not in self.category_ids[current_category['Type']]:
+                raise ValueError("InSub value '{0}' on line {1} does not match any existing ID values.".format(current_category['InSub'], line_number))
+            self.current_service['Categories'].append(current_category)
+            self.category_ids[current_category['Type']].append(current_category['ID'])
+        self.current_category = None
+        if self.verbose:
+            self._log("Line {0}: --- End Category List --- (Ending category list)", line_number)
+
+    def _set_category_field(self, line_number, key, value):
+        self.current_category[key] = value
+
+    def _set_category_integer(self, line_number, key, value):
+        self.current_category[key] = validate_non_negative_integer(value, key, line_number)
+
+    def _start_description_body(self, line_number):
+        self.current_description = []
+
+    def _end_description_body(self, line_number):
+        if self.current_description is None:
+            raise ValueError("End Description Body on line {0} has no matching Start Description Body.".format(line_number))
+        self.current_category['Description'] = "\n".join(self.current_description)
+        self.current_description = None
+
+    def _description_body_line(self, line_number, text):
+        self.current_description.append(text)
+
+    def _start_info_body(self, line_number):
+        if self.current_service:
+            self.current_info = []
+            if self.verbose:
+                self._log("Line {0}: --- Start Info Body --- (Starting info body)", line_number)
+
+    def _end_info_body(self, line_number):
+        if self.current_service and self.current_info is not None:
+            self.current_service['Info'] = "\n".join(self.current_info)
+            self.current_info = None
+            if self.verbose:
+                self._log("Line {0}: --- End Info Body --- (Ending info body)", line_number)
+
+    def _info_body_line(self, line_number, text):
+        if self.current_service and self.current_info is not None:
+            self.current_info.append(text)
+        if self.verbose:
+            self._log("Line {0}: {1}", line_number, text)
+
+    # Polls
+
+    def _start_poll_list(self, line_number):
+        self.current_polls = []
+        if self.verbose:
+            self._log("Line {0}: --- Start Poll List --- (Starting poll list)", line_number)
+
+    def _end_poll_list(self, line_number):
+        if self.current_message:
+            self.current_message['Polls'] = self.current_polls
+        if self.verbose:
+            self._log("Line {0}: --- End Poll List --- (Ending poll list)", line_number)
+
+    def _start_poll_body(self, line_number):
+        self.current_poll = self._poll_record()
+        if self.verbose:
+            self._log("Line {0}: --- Start Poll Body --- (Starting poll body)", line_number)
+
+    def _end_poll_body(self, line_number):
+        if self.current_poll is not None:
+            self.current_polls.append(self.current_poll)
+            self.current_poll = None
+        if self.verbose:
+            self._log("Line {0}: --- End Poll Body --- (Ending poll body)", line_number)
+
+    def _set_poll_field(self, line_number, key, value):
+        if self.current_poll is not None:
+            if key in ('Answers', 'Results', 'Percentage'):
+                self.current_poll[key] = [item.strip() for item in value.split(',')]
+            else:
+                self.current_poll[key] = value
+
+    # User list
+
+    def _start_user_list(self, line_number):
+        if self.verbose:
+            self._log("Line {0}: --- Start User List --- (Starting user list)", line_number)
+
+    def _end_user_list(self, line_number):
+        if self.verbose:
+            self._log("Line {0}: --- End User List --- (Ending user list)", line_number)
+
+    def _start_user_info(self, line_number):
+        if self.verbose:
+            self._log("Line {0}: --- Start User Info --- (Starting user info)", line_number)
+
+    def _end_user_info(self, line_number):
+        self.user_id = None
+        if self.verbose:
+            self._log("Line {0}: --- End User Info --- (Ending user info)", line_number)
+
+    def _set_user_id(self, line_number, key, value):
+        self.user_id = validate_non_negative_integer(value, "User", line_number)
+        self.current_service['Users'][self.user_id] = self._user_record(ExtraFields="", Bio="", Signature="")
+        if self.verbose:
+            self._log("Line {0}: User ID set to {1}", line_number, self.user_id)
+
+    def _set_user_field(self, line_number, key, value):
+        if self.user_id is not None:
+            self.current_service['Users'][self.user_id][key] = value
+            if self.verbose:
+                self._log("Line {0}: {1} set to {2}", line_number, _VERBOSE_LABELS.get(key, key), value)
+
+    def _set_pinned_message(self, line_number, key, value):
+        self.current_service['PinnedMessage'] = validate_non_negative_integer(value, "PinnedMessage", line_number)
+        if self.verbose:
+            self._log("Line {0}: Pinned Message set to {1}", line_number, value)
+
+    def _start_extrafields_body(self, line_number):
+        self.current_extrafields = []
+        if self.verbose:
+            self._log("Line {0}: Starting extrafields body", line_number)
+
+    def _end_extrafields_body(self, line_number):
+        self.current_service['Users'][self.user_id]['ExtraFields'] = "\n".join(self.current_extrafields)
+        self.current_extrafields = None
+        if self.verbose:
+            self._log("Line {0}: Ending extrafields body", line_number)
+
+    def _extrafields_body_line(self, line_number, text):
+        self.current_extrafields.append(text)
+        if self.verbose:
+            self._log("Line {0}: Adding to extrafields body: {1}", line_number, text)
+
+    def _start_bio_body(self, line_number):
+        self.current_bio = []
+        if self.verbose:
+            self._log("Line {0}: Starting bio body", line_number)
+
+    def _end_bio_body(self, line_number):
+        self.current_service['Users'][self.user_id]['Bio'] = "\n".join(self.current_bio)
+        self.current_bio = None
+        if self.verbose:
+            self._log("Line {0}: Ending bio body", line_number)
+
+    def _bio_body_line(self, line_number, text):
+        self.current_bio.append(text)
+        if self.verbose:
+            self._log("Line {0}: Adding to bio body: {1}", line_number, text)
+
+    def _start_signature_body(self, line_number):
+        self.current_signature = []
+        if self.verbose:
+            self._log("Line {0}: Starting signature body", line_number)
+
+    def _end_signature_body(self, line_number):
+        self.current_service['Users'][self.user_id]['Signature'] = "\n".join(self.current_signature)
+        self.current_signature = None
+        if self.verbose:
+            self._log("Line {0}: Ending signature body", line_number)
+
+    def _signature_body_line(self, line_number, text):
+        self.current_signature.append(text)
+        if self.verbose:
+            self._log("Line {0}: Adding to signature body: {1}", line_number, text)
+
+    # Message list, threads and posts
+
+    def _start_message_list(self, line_number):
+        if self.verbose:
+            self._log("Line {0}: --- Start Message List --- (Starting message list)", line_number)
+
+    def _end_message_list(self, line_number):
+        if self.verbose:
+            self._log("Line {0}: --- End Message List --- (Ending message list)", line_number)
+
+    def _start_message_thread(self, line_number):
+        self.current_thread = self._thread_record(Title='', Messages=[])
+        self.thread_post_ids = []
+        self.thread_post_id_set = set()
+        if self.verbose:
+            self._log("Line {0}: --- Start Message Thread --- (Starting message thread)", line_number)
+
+    def _end_message_thread(self, line_number):
+        self._add_thread(self.current_service, self.current_thread)
+        self.current_thread = None
+        if self.verbose:
+            self._log("Line {0}: --- End Message Thread --- (Ending message thread)", line_number)
+
+    def _set_thread_id(self, line_number, key, value):
+        self.current_thread['Thread'] = validate_non_negative_integer(value, "Thread", line_number)
+        if self.verbose:
+            self._log("Line {0}: Thread ID set to {1}", line_number, value)
+
+    def _set_thread_list(self, line_number, key, value):
+        self.current_thread[key] = [item.strip() for item in value.split(",")]
+        if self.verbose:
+            self._log("Line {0}: {1} set to {2}", line_number, key, self.current_thread[key])
+
+    def _set_thread_field(self, line_number, key, value):
+        self.current_thread[key] = value
+        if self.verbose:
+            self._log("Line {0}: {1} set to {2}", line_number, key, value)
+
+    def _start_message_post(self, line_number):
+        self.current_message = self._post_record()
+        if self.verbose:
+            self._log("Line {0}: --- Start Message Post --- (Starting message post)", line_number)
+
+    def _end_message_post(self, line_number):
+        if self.current_message:
+            self._add_post(self.current_service, self.current_thread, self.current_message)
+        self.current_message = None
+        if self.verbose:
+            self._log("Line {0}: --- End Message Post --- (Ending message post)", line_number)
+
+    def _set_post_field(self, line_number, key, value):
+        self.current_message[key] = value
+        if self.verbose:
+            self._log("Line {0}: {1} set to {2}", line_number, _VERBOSE_LABELS.get(key, key), value)
+
+    def _set_post_integer(self, line_number, key, value):
+        self.current_message[key] = validate_non_negative_integer(value, key, line_number)
+        if self.verbose:
+            self._log("Line {0}: {1} set to {2}", line_number, _VERBOSE_LABELS.get(key, key), value)
+
+    def _set_interned_post_integer(self, line_number, key, value):
+        self._set_post_integer(line_number, key, value)
+        self.current_message[key] = self.interner.intern(self.current_message[key])
+
+    def _set_interned_thread_list(self, line_number, key, value):
+        self.current_thread[key] = self.interner.intern_items(value)
+        if self.verbose:
+            self._log("Line {0}: {1} set to {2}", line_number, key, self.current_thread[key])
+
+    def interning_stats(self):
+        """ (distinct values, hits, saved bytes) of the interner during this parse. """
+        hits, saved_bytes = self._interned_from
+        return len(self.interner.values), self.interner.hits - hits, self.interner.saved_bytes - saved_bytes
+
+    def _set_post_id(self, line_number, key, value):
+        post_value = validate_non_negative_integer(value, "Post", line_number)
+        self.current_message['Post'] = post_value
+        if post_value not in self.thread_post_id_set:
+            self.thread_post_id_set.add(post_value)
+            self.thread_post_ids.append(post_value)
+        if self.verbose:
+            self._log("Line {0}: Post ID set to {1}", line_number, post_value)
+
+    def _set_post_nested(self, line_number, key, value):
+        nested_value = validate_non_negative_integer(value, "Nested", line_number)
+        if nested_value != 0 and nested_value not in self.thread_post_id_set:
+            raise ValueError(
+                "Nested value '{0}' on line {1} does not match any existing Post values in the current thread. Existing Post IDs: {2}".format(
+                    nested_value, line_number, list(self.thread_post_ids))
+            )
+        self.current_message['Nested'] = nested_value
+        if self.verbose:
+            self._log("Line {0}: Nested set to {1}", line_number, nested_value)
+
+    def _start_message_body(self, line_number):
+        self.current_message['Message'] = []
+        if self.verbose:
+            self._log("Line {0}: Starting message body", line_number)
+
+    def _end_message_body(self, line_number):
+        self.current_message['Message'] = "\n".join(self.current_message['Message'])
+        if self.verbose:
+            self._log("Line {0}: Ending message body", line_number)
+
+    def _message_body_line(self, line_number, text):
+        self.current_message['Message'].append(text)
+        if self.verbose:
+            self._log("Line {0}: Adding to message body: {1}", line_number, text)
+
+
+def _bind_section_handlers(cls):
+    """ Resolve the event handlers of cls per section so each event is one dict lookup. """
+    def handlers(name_format, sections):
+        return dict((section, getattr(cls, name_format.format(section))) for section in sections)
+    cls._start_handlers = handlers('_start_{0}', ('archive_service',) + _SECTION_NAMES)
+    cls._end_handlers = handlers('_end_{0}', ('archive_service',) + _SECTION_NAMES)
+    cls._body_handlers = handlers('_{0}_line', (
+        'include_service', 'include_users', 'include_messages', 'include_categories', 'comment_section',
+        'info_body', 'description_body', 'extrafields_body', 'bio_body', 'signature_body', 'message_body'))
+
+_bind_section_handlers(ServicesTextParser)
+# Field handlers per record; a plain function handles every key of its record.
+ServicesTextParser._field_handlers = {
+    'archive_service': {
+        'Entry': ServicesTextParser._set_service_entry,
+        'Service': ServicesTextParser._set_service_field,
+        'ServiceType': ServicesTextParser._set_service_field,
+        'ServiceLocation': ServicesTextParser._set_service_field,
+        'TimeZone': ServicesTextParser._set_service_field,
+    },
+    'categorization_list': ServicesTextParser._set_categorization_field,
+    'message_list': ServicesTextParser._set_service_list,
+    'category_list': {
+        'Kind': ServicesTextParser._set_category_field,
+        'ID': ServicesTextParser._set_category_integer,
+        'InSub': ServicesTextParser._set_category_integer,
+        'Headline': ServicesTextParser._set_category_field,
+        'Description': ServicesTextParser._set_category_field,
+    },
+    'poll_body': ServicesTextParser._set_poll_field,
+    'user_info': dict(
+        [(key, ServicesTextParser._set_user_field) for key in (
+            'Name', 'Handle', 'Email', 'Phone', 'Location', 'Website', 'Avatar', 'Banner', 'Joined', 'Birthday', 'HashTags')] +
+        [('User', ServicesTextParser._set_user_id), ('PinnedMessage', ServicesTextParser._set_pinned_message)]),
+    'message_thread': dict(
+        [(key, ServicesTextParser._set_thread_field) for key in ('Title', 'Type', 'State', 'Keywords')] +
+        [('Thread', ServicesTextParser._set_thread_id), ('Category', ServicesTextParser._set_thread_list),
+         ('Forum', ServicesTextParser._set_thread_list)]),
+    'message_post': dict(
+        [(key, ServicesTextParser._set_post_field) for key in (
+            'Author', 'Time', 'Date', 'EditTime', 'EditDate', 'EditAuthor', 'SubType', 'SubTitle', 'Tags')] +
+        [(key, ServicesTextParser._set_post_integer) for key in ('AuthorID', 'EditAuthorID', 'PinnedID')] +
+        [('Post', ServicesTextParser._set_post_id), ('Nested', ServicesTextParser._set_post_nested)]),
+}
+
+# Fields whose values repeat across records, shared when interning.
+_INTERNED_FIELDS = {
+    'archive_service': ('ServiceType', 'TimeZone'),
+    'category_list': ('Kind',),
+    'message_thread': ('Type', 'State'),
+    'message_post': ('Author', 'Time', 'Date', 'EditTime', 'EditDate', 'EditAuthor', 'SubType', 'SubTitle', 'Tags'),
+}
+
+
+def _interning_handler(handler):
+    def set_interned(self, line_number, key, value):
+        handler(self, line_number, key, self.interner.intern(value))
+    return set_interned
+
+
+def _interning_field_handlers(cls):
+    """ cls._field_handlers with the repetitive fields interned, built once per class. """
+    handlers = cls.__dict__.get('_interned_handlers')
+    if handlers is None:
+        handlers = dict(cls._field_handlers)
+        for section, keys in _INTERNED_FIELDS.items():
+            handlers[section] = dict(handlers[section])
+            for key in keys:
+                handlers[section][key] = _interning_handler(handlers[section][key])
+        for key in ('Category', 'Forum'):
+            handlers['message_thread'][key] = cls._set_interned_thread_list
+        for key in ('AuthorID', 'EditAuthorID', 'PinnedID'):
+            handlers['message_post'][key] = cls._set_interned_post_integer
+        cls._interned_handlers = handlers
+    return handlers
+
+
+class _Discarded(object):
+    """
+    What ValidatingTextParser builds in place of records, record lists and
+    bodies: assignments and appends are dropped and lookups return the
+    placeholder itself.  Like the dict it stands in for, it is only true
+    once something was assigned to it.
+    """
+
+    __slots__ = ('assigned',)
+
+    def __init__(self, **fields):
+        self.assigned = bool(fields)
+
+    def __setitem__(self, key, value):
+        self.assigned = True
+
+    def __getitem__(self, key):
+        return self
+
+    def __iter__(self):
+        return iter(())
+
+    def __bool__(self):
+        return self.assigned
+
+    __nonzero__ = __bool__
+
+    def append(self, item):
+        pass
+
+    def extend(self, items):
+        pass
+
+_DISCARDED = _Discarded()
+
+
+def _discarded_record(**fields):
+    return _DISCARDED
+
+
+class ValidatingTextParser(ServicesTextParser):
+    """
+    ServicesTextParser for validate_only parses.  It runs the same checks
+    (section grammar, integer fields, Nested and InSub references, category
+    types) and fails on the same lines, but keeps no records and no body
+    text: users, threads, posts and polls are _Discarded placeholders and
+    body lines are dropped as they arrive.  What stays is the user IDs of the
+    open service, the post IDs of the open thread and the category IDs, so
+    memory follows the number of IDs rather than the size of the archive.
+    """
+
+    def __init__(self, verbose=False, hooks=None):
+        ServicesTextParser.__init__(self, True, verbose, hooks=hooks)
+        self._user_record = self._thread_record = self._poll_record = _discarded_record
+        self._post_record = _Discarded
+        self.current_polls = _DISCARDED
+        # feed_bytes hands these over as undecoded chunks; they are never read.
+        self.reader.raw_bodies = frozenset((
+            'comment_section', 'info_body', 'description_body', 'extrafields_body', 'bio_body', 'signature_body'))
+
+    def _add_service(self, service):
+        pass
+
+    def _start_archive_service(self, line_number):
+        self.current_service = {'Users': {}, 'MessageThreads': _DISCARDED, 'Categories': _DISCARDED, 'Categorization': {}}
+        if self.verbose:
+            self._log("Line {0}: --- Start Archive Service --- (Starting new archive service)", line_number)
+
+    def _start_poll_list(self, line_number):
+        self.current_polls = _DISCARDED
+        if self.verbose:
+            self._log("Line {0}: --- Start Poll List --- (Starting poll list)", line_number)
+
+    def _description_body_line(self, line_number, text):
+        pass
+
+    def _info_body_line(self, line_number, text):
+        pass
+
+    def _extrafields_body_line(self, line_number, text):
+        pass
+
+    def _bio_body_line(self, line_number, text):
+        pass
+
+    def _signature_body_line(self, line_number, text):
+        pass
+
+    def _message_body_line(self, line_number, text):
+        pass
+
+_bind_section_handlers(ValidatingTextParser)
+
+
+# Lines and line terminators with universal newlines, as io.open() in text
+# mode splits them.
+_LINE_BYTES = re.compile(br'[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+')
+_LONE_CR_BYTES = re.compile(br'\r(?!\n)')
+_NEWLINE_TEXT = re.compile(r'\r\n|\r|\n')
+
+
+class MappedText(object):
+    """
+    A message body that still lives in a memory-mapped archive, kept as
+    memoryview slices of the map and decoded each time it is used.  str()
+    gives the body text and str methods (strip, splitlines, ...) work on it
+    directly, so most code can treat it as a string.
+    """
+
+    __slots__ = ('runs',)
+
+    def __init__(self, runs):
+        self.runs = runs
+
+    def _read(self):
+        return [run.tobytes() for run in self.runs]
+
+    def text(self):
+        """ Decode the body; every line is stripped and joined with '\\n' like parse_lines does. """
+        lines = []
+        for run in self._read():
+            text = run.decode('utf-8')
+            run_lines = _NEWLINE_TEXT.split(text)
+            if text[-1:] in ("\n", "\r"):
+                # Runs end with the terminator of their last line.
+                run_lines.pop()
+            lines.extend(line.strip() for line in run_lines)
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.text()
+
+    def __getattr__(self, name):
+        return getattr(self.text(), name)
+
+    def __eq__(self, other):
+        if isinstance(other, MappedText):
+            other = other.text()
+        return self.text() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.text())
+
+    def __len__(self):
+        return len(self.text())
+
+    def __contains__(self, item):
+        return item in self.text()
+
+    def __getitem__(self, index):
+        return self.text()[index]
+
+    def __iter__(self):
+        return iter(self.text())
+
+    def __add__(self, other):
+        if isinstance(other, MappedText):
+            other = other.text()
+        return self.text() + other
+
+    def __radd__(self, other):
+        return other + self.text()
+
+    def __lt__(self, other):
+        if isinstance(other, MappedText):
+            other = other.text()
+        return self.text() < other
+
+    def __repr__(self):
+        return "{0}({1!r})".format(type(self).__name__, self.text())
+
+    def __reduce__(self):
+        # Pickle and copy as the plain text; the map does not travel.
+        return (unicode_type, (self.text(),))
+
+
+class MappedServicesTextParser(ServicesTextParser):
+    """
+    ServicesTextParser for ArchiveEventReader.feed_bytes over a memory map.
+    Message body chunks arrive as (start, end) offsets of the whole line in
+    source; consecutive lines are merged into one run and the finished body
+    becomes a MappedText over those runs.
+    """
+
+    def __init__(self, source, validate_only=False, verbose=False, emit=None, hooks=None, records=False,
+                 interner=None):
+        ServicesTextParser.__init__(self, validate_only, verbose, emit, hooks, records, interner)
+        self.view = memoryview(source)
+
+    def _mapped_text(self, runs):
+        return MappedText(tuple(self.view[start:end] for start, end in runs))
+
+    def _end_message_post(self, line_number):
+        runs = self.current_message.get('Message') if self.current_message else None
+        if isinstance(runs, list):
+            # A body without its end marker stays a list of lines, as parse_lines leaves it.
+            self.current_message['Message'] = self._mapped_text(runs).text().split("\n") if runs else []
+        ServicesTextParser._end_message_post(self, line_number)
+
+    def _end_message_body(self, line_number):
+        runs = self.current_message['Message']
+        if isinstance(runs, list):
+            self.current_message['Message'] = self._mapped_text(runs)
+        else:
+            # A repeated end marker joins the finished body again, as parse_lines does.
+            self.current_message['Message'] = "\n".join(unicode_type(runs))
+        if self.verbose:
+            self._log("Line {0}: Ending message body", line_number)
+
+    def _chunk_text(self, chunk):
+        return self.view[chunk[0]:chunk[1]].tobytes().decode('utf-8').strip()
+
+    def _message_body_line(self, line_number, chunk):
+        _add_run(self.current_message['Message'], chunk)
+        if self.verbose:
+            self._log("Line {0}: Adding to message body: {1}", line_number, self._chunk_text(chunk))
+
+_bind_section_handlers(MappedServicesTextParser)
+
+
+def _add_run(runs, chunk):
+    # Extend the last [start, end] run when chunk follows it directly.
+    start, end = chunk
+    if runs and runs[-1][1] == start:
+        runs[-1][1] = end
+    else:
+        runs.append([start, end])
+
+
+class _TextCache(object):
+    """ A small LRU of decoded LazyText bodies. """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        text = self.entries.pop(key, None)
+        if text is not None:
+            self.entries[key] = text
+        return text
+
+    def put(self, key, text):
+        self.entries[key] = text
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class LazyText(MappedText):
+    """
+    A body that is read from its archive file only when used.  It records
+    the file and the (start, end) byte offsets of its lines; text() reads
+    and decodes them, going through a shared LRU cache when the parse was
+    given one.  Reading fails with ValueError if the file has changed since
+    it was parsed.
+    """
+
+    __slots__ = ('filename', 'stamp', 'cache')
+
+    def __init__(self, filename, runs, stamp, cache=None):
+        MappedText.__init__(self, runs)
+        self.filename = filename
+        self.stamp = stamp
+        self.cache = cache
+
+    def _read(self):
+        with io.open(self.filename, 'rb') as file:
+            status = os.fstat(file.fileno())
+            if (status.st_size, status.st_mtime) != self.stamp:
+                raise ValueError("'{0}' has changed since it was parsed.".format(self.filename))
+            chunks = []
+            for start, end in self.runs:
+                file.seek(start)
+                chunks.append(file.read(end - start))
+        return chunks
+
+    def text(self):
+        if self.cache is None:
+            return MappedText.text(self)
+        key = (self.filename, self.runs)
+        text = self.cache.get(key)
+        if text is None:
+            text = MappedText.text(self)
+            self.cache.put(key, text)
+        return text
+
+
+class LazyServicesTextParser(MappedServicesTextParser):
+    """
+    MappedServicesTextParser that turns message, extrafields, bio,
+    signature and info bodies into LazyText offsets into filename, so the
+    parse never decodes or keeps their text.
+    """
+
+    def __init__(self, source, filename, validate_only=False, verbose=False, emit=None, hooks=None, cache_size=128,
+                 records=False, interner=None):
+        MappedServicesTextParser.__init__(self, source, validate_only, verbose, emit, hooks, records, interner)
+        self.reader.raw_bodies = frozenset(('extrafields_body', 'bio_body', 'signature_body', 'info_body'))
+        self.filename = filename
+        status = os.stat(filename)
+        self.stamp = (status.st_size, status.st_mtime)
+        self.cache = _TextCache(cache_size) if cache_size else None
+
+    def _mapped_text(self, runs):
+        return LazyText(self.filename, tuple((start, end) for start, end in runs), self.stamp, self.cache)
+
+    def _lazy_text(self, runs):
+        return self._mapped_text(runs) if runs else ""
+
+    def _end_extrafields_body(self, line_number):
+        self.current_service['Users'][self.user_id]['ExtraFields'] = self._lazy_text(self.current_extrafields)
+        self.current_extrafields = None
+        if self.verbose:
+            self._log("Line {0}: Ending extrafields body", line_number)
+
+    def _extrafields_body_line(self, line_number, chunk):
+        _add_run(self.current_extrafields, chunk)
+        if self.verbose:
+            self._log("Line {0}: Adding to extrafields body: {1}", line_number, self._chunk_text(chunk))
+
+    def _end_bio_body(self, line_number):
+        self.current_service['Users'][self.user_id]['Bio'] = self._lazy_text(self.current_bio)
+        self.current_bio = None
+        if self.verbose:
+            self._log("Line {0}: Ending bio body", line_number)
+
+    def _bio_body_line(self, line_number, chunk):
+        _add_run(self.current_bio, chunk)
+        if self.verbose:
+            self._log("Line {0}: Adding to bio body: {1}", line_number, self._chunk_text(chunk))
+
+    def _end_signature_body(self, line_number):
+        self.current_service['Users'][self.user_id]['Signature'] = self._lazy_text(self.current_signature)
+        self.current_signature = None
+        if self.verbose:
+            self._log("Line {0}: Ending signature body", line_number)
+
+    def _signature_body_line(self, line_number, chunk):
+        _add_run(self.current_signature, chunk)
+        if self.verbose:
+            self._log("Line {0}: Adding to signature body: {1}", line_number, self._chunk_text(chunk))
+
+    def _end_info_body(self, line_number):
+        if self.current_service and self.current_info is not None:
+            self.current_service['Info'] = self._lazy_text(self.current_info)
+            self.current_info = None
+            if self.verbose:
+                self._log("Line {0}: --- End Info Body --- (Ending info body)", line_number)
+
+    def _info_body_line(self, line_number, chunk):
+        if self.current_service and self.current_info is not None:
+            _add_run(self.current_info, chunk)
+        if self.verbose:
+            self._log("Line {0}: {1}", line_number, self._chunk_text(chunk))
+
+_bind_section_handlers(LazyServicesTextParser)
+
+
+def parse_file_mmap(filename, validate_only=False, verbose=False, hooks=None, records=False, interner=None):
+    """
+    Parse an uncompressed UTF-8 archive through a read-only memory map.  Lines
+    are matched as bytes, so marker lines are never decoded, and message
+    bodies are returned as MappedText slices of the map that are only decoded
+    when used.  Returns the same services as parse_file.
+    """
+    return _parse_mapped(filename, validate_only, verbose, hooks, lambda source: MappedServicesTextParser(
+        source, validate_only, verbose, hooks=hooks, records=records, interner=interner))
+
+
+def parse_file_lazy(filename, validate_only=False, verbose=False, hooks=None, cache_size=128, records=False,
+                    interner=None):
+    """
+    Parse an uncompressed UTF-8 archive without reading its bodies into
+    strings: message, extrafields, bio, signature and info bodies come back
+    as LazyText objects that read their text from the file on first use.
+    Up to cache_size decoded bodies are kept (0 disables the cache).
+    Listing threads, indexing or validating then skips decoding and holding
+    the bulk of the archive.  The file must stay in place while the bodies
+    are in use.  UTF-16 and UTF-32 archives have no UTF-8 offsets to point
+    at and are parsed by parse_file_mmap instead.
+    """
+    if _bom_codec(filename) is not None:
+        return parse_file_mmap(filename, validate_only, verbose, hooks, records, interner)
+    return _parse_mapped(filename, validate_only, verbose, hooks, lambda source: LazyServicesTextParser(
+        source, filename, validate_only, verbose, hooks=hooks, cache_size=cache_size, records=records,
+        interner=interner))
+
+
+def _parse_mapped(filename, validate_only, verbose, hooks, make_parser):
+    if _bom_codec(filename) is not None:
+        # UTF-16 and UTF-32 archives are parsed from a re-encoded copy.
+        source = read_archive_bytes(filename)
+    else:
+        with io.open(filename, 'rb') as file:
+            try:
+                source = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped.
+                return parse_lines([], validate_only, verbose, hooks)
+    if isinstance(source, mmap.mmap) and _LONE_CR_BYTES.search(source) is None:
+        lines = iter(source.readline, b'')
+    else:
+        # mmap.readline() only splits on '\n' and bytes have no readline().
+        lines = (match.group() for match in _LINE_BYTES.finditer(source))
+    parser = make_parser(source)
+    feed_bytes = parser.reader.feed_bytes
+    position = 0
+    line_number = 0
+    line = b''
+    if hooks is not None:
+        hooks.begin_phase('parse')
+    try:
+        for line_number, line in enumerate(lines, 1):
+            start = position
+            position += len(line)
+            feed_bytes(line_number, line, (start, position))
+
+        if validate_only:
+            return True, "", ""
+
+        return parser.services
+
+    except Exception as e:
+        if validate_only:
+            return False, "Error: {0}".format(str(e)), _NEWLINE_TEXT.sub("\n", line.decode('utf-8', 'replace'))
+        else:
+            raise
+
+    finally:
+        if hooks is not None:
+            hooks.end_phase('parse')
+            hooks.add_input(line_number, position)
+            if parser.interner is not None:
+                hooks.add_interned(*parser.interning_stats())
+
+
+def validate_file(filename, hooks=None):
+    """
+    Validate an archive without building its services.  Returns
+    (is_valid, error_message, error_line) like parse_file(validate_only=True)
+    but streams the file through ValidatingTextParser: uncompressed archives
+    are read through a memory map without decoding their bodies, compressed
+    ones line by line.  An archive that is not valid UTF-8 raises
+    UnicodeDecodeError, as it does for parse_file.
+    """
+    if not filename.endswith(_COMPRESSED_SUFFIXES):
+        return _parse_mapped(filename, True, False, hooks, lambda source: _validating_parser(source, hooks))
+    with open_compressed_file(filename) as file:
+        # ZlibFile and LzopFile only offer read()
+        lines = file if hasattr(file, '__iter__') else StringIO(file.read())
+        parser = ValidatingTextParser(hooks=hooks)
+        feed = parser.reader.feed
+        line_number = size = 0
+        line = ""
+        if hooks is not None:
+            hooks.begin_phase('parse')
+        try:
+            for line_number, line in enumerate(lines, 1):
+                if hooks is not None:
+                    size += len(line.encode('utf-8'))
+                feed(line_number, line)
+            return True, "", ""
+        except UnicodeDecodeError:
+            raise
+        except Exception as e:
+            return False, "Error: {0}".format(str(e)), line
+        finally:
+            if hooks is not None:
+                hooks.end_phase('parse')
+                hooks.add_input(line_number, size)
+
+
+def _validating_parser(source, hooks):
+    # The mapped reader never decodes body lines, so check the encoding up front.
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for start in range(0, len(source), _UTF8_CHECK_BLOCK):
+        decoder.decode(source[start:start + _UTF8_CHECK_BLOCK])
+    decoder.decode(b'', True)
+    return ValidatingTextParser(hooks=hooks)
+
+_UTF8_CHECK_BLOCK = 1 << 20
+
+
+class ParseCheckpoint(object):
+    """
+    Where parse_file_incremental can resume an append-only archive: the byte
+    offset and line number just past the last service that left the parser
+    idle, a digest of the bytes before the offset, and the state later
+    services are checked against (categorization values, category IDs, the
+    post IDs of the last thread and the last poll list).  No parsed
+    services are kept.  restarted tells whether the call that returned the
+    checkpoint parsed the archive from its start.  save() writes it to a
+    sidecar file (a pickle) and load() reads one back.
+    """
+
+    SIDECAR_VERSION = 3
+
+    def __init__(self, offset=0, line_number=0, digest=None, tail=None, carried=None, returned=0,
+                 restarted=True):
+        self.offset = offset
+        self.line_number = line_number
+        self.digest = digest or hashlib.sha1().hexdigest()
+        # None, 'line' when the last line had no line break yet, or 'cr' when
+        # it ended in '\r' that a '\n' may still follow.
+        self.tail = tail
+        self.carried = carried
+        # Services finished past offset that were already returned, because
+        # the parser was not idle after them; they are dropped on resume.
+        self.returned = returned
+        self.restarted = restarted
+
+    @staticmethod
+    def _copy_carried(values):
+        # Copies of the carried attributes in values, as parsers append to them.
+        return {'categorization_values': dict(values['categorization_values']),
+                'category_ids': dict((kind, list(ids)) for kind, ids in values['category_ids'].items()),
+                'thread_post_ids': list(values['thread_post_ids']),
+                'current_polls': list(values['current_polls'])}
+
+    def _parser(self, verbose, hooks, records, interner):
+        # A fresh parser in the state the checkpointed services left behind.
+        parser = ServicesTextParser(verbose=verbose, emit='service', hooks=hooks, records=records, interner=interner)
+        if self.carried is not None:
+            for name, value in self._copy_carried(self.carried).items():
+                setattr(parser, name, value)
+            parser.thread_post_id_set = set(parser.thread_post_ids)
+        return parser
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['version'] = self.SIDECAR_VERSION
+        return state
+
+    def __setstate__(self, state):
+        if state.get('version') != self.SIDECAR_VERSION:
+            raise ValueError("Unsupported checkpoint version {0!r}.".format(state.get('version')))
+        state = dict(state)
+        del state['version']
+        self.__init__(**state)
+
+    def save(self, filename):
+        """ Write the checkpoint to a sidecar file, replacing it atomically. """
+        temporary = filename + '.tmp'
+        with io.open(temporary, 'wb') as file:
+            pickle.dump(self, file, pickle.HIGHEST_PROTOCOL)
+        _replace_file(temporary, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """ Read a checkpoint written by save(). """
+        with io.open(filename, 'rb') as file:
+            checkpoint = pickle.load(file)
+        if not isinstance(checkpoint, cls):
+            raise ValueError("'{0}' does not hold a parse checkpoint.".format(filename))
+        return checkpoint
+
+
+def _same_prefix(file, checkpoint, digest):
+    # Hash the first checkpoint.offset bytes of file into digest and compare.
+    remaining = checkpoint.offset
+    while remaining:
+        block = file.read(min(remaining, _UTF8_CHECK_BLOCK))
+        if not block:
+            return False
+        digest.update(block)
+        remaining -= len(block)
+    return digest.hexdigest() == checkpoint.digest
+
+
+def parse_file_incremental(filename, checkpoint=None, verbose=False, hooks=None, records=False, interner=None):
+    """
+    Parse an append-only archive, resuming where an earlier call stopped.
+    Returns (services, checkpoint): the services finished since the given
+    checkpoint, and a new ParseCheckpoint to pass to the next call.  Only
+    the bytes after the checkpoint are read, and a service still being
+    written is parsed again from its start on the next call.  checkpoint
+    may also be the name of a sidecar file, which is loaded if it exists
+    and rewritten afterwards.  The given checkpoint is never changed, so
+    after an error it can simply be passed again.
+
+    The whole archive is parsed again when there is no checkpoint, the
+    bytes before it changed or a final line that had no line break yet was
+    continued.  The returned checkpoint.restarted is then set and services
+    holds every finished service, replacing what earlier calls returned.
+    Compressed, UTF-16 and UTF-32 archives cannot be resumed, nor can
+    archives with include sections, whose files may change on their own
+    (as for ParseCache); they are parsed in full with a None checkpoint.
+    """
+    if filename.endswith(_COMPRESSED_SUFFIXES) or _bom_codec(filename) is not None:
+        return parse_file(filename, verbose=verbose, hooks=hooks, records=records, interner=interner), None
+    sidecar = None
+    if isinstance(checkpoint, basestring):
+        sidecar = checkpoint
+        checkpoint = ParseCheckpoint.load(sidecar) if os.path.exists(sidecar) else None
+    resumed = []
+    services = list(_iter_resumed_services(filename, _read_past_checkpoint(filename, checkpoint), resumed,
+                                           verbose, hooks, records, interner))
+    checkpoint = resumed[0]
+    if sidecar is not None:
+        if checkpoint is not None:
+            checkpoint.save(sidecar)
+        elif os.path.exists(sidecar):
+            os.remove(sidecar)
+    return services, checkpoint
+
+def _read_past_checkpoint(filename, checkpoint):
+    """
+    Read an uncompressed UTF-8 archive from checkpoint on.  Returns
+    (checkpoint, data, digest, restarted): the checkpoint to resume from (a
+    fresh one, with restarted set, when the given one is None or no longer
+    fits the archive), the bytes after it and a SHA-1 of the bytes before
+    it.  checkpoint is None when the bytes read have include sections.
+    """
+    with io.open(filename, 'rb') as file:
+        digest = hashlib.sha1()
+        restarted = False
+        if checkpoint is not None and not _same_prefix(file, checkpoint, digest):
+            checkpoint = None
+        data = file.read()
+        if checkpoint is not None and checkpoint.tail == 'line' and data[:1] not in (b'', b'\r', b'\n'):
+            checkpoint = None
+        if checkpoint is None:
+            file.seek(0)
+            digest = hashlib.sha1()
+            data = file.read()
+            checkpoint = ParseCheckpoint()
+            restarted = True
+    if b'--- Include ' in data:
+        checkpoint = None
+    return checkpoint, data, digest, restarted
+
+def _iter_resumed_services(filename, source, resumed, verbose=False, hooks=None, records=False, interner=None):
+    """
+    The parse behind parse_file_incremental, as a generator: yields the
+    services finished in the data of source (from _read_past_checkpoint)
+    one at a time, and once done appends the new ParseCheckpoint to the
+    list resumed.  Archives with include sections are parsed in full by
+    parse_file instead, and None is appended.
+    """
+    checkpoint, data, digest, restarted = source
+    if checkpoint is None:
+        for service in parse_file(filename, verbose=verbose, hooks=hooks, records=records, interner=interner):
+            yield service
+        resumed.append(None)
+        return
+    parser = checkpoint._parser(verbose, hooks, records, interner)
+    pending = parser.pending
+
+    # The line break of a line fed on the last call is not a line of its own.
+    tail = checkpoint.tail
+    skip = 0
+    if tail == 'line' and data:
+        skip = 2 if data[:2] == b'\r\n' else 1
+        tail = 'cr' if skip == 1 and data[:1] == b'\r' else None
+    if tail == 'cr' and len(data) > skip:
+        if data[skip:skip + 1] == b'\n':
+            skip += 1
+        tail = None
+    first_line = line_number = checkpoint.line_number
+    # Where the next call resumes: after the last service that left the parser
+    # idle, with the number of services finished past it.
+    resume = (skip, line_number, tail, checkpoint.carried)
+    drop = checkpoint.returned
+    returned = 0
+    consumed = skip
+    feed = parser.reader.feed
+    if hooks is not None:
+        hooks.begin_phase('parse')
+    try:
+        for match in _LINE_BYTES.finditer(data, skip):
+            raw = match.group()
+            terminated = raw[-1:] in (b'\r', b'\n')
+            try:
+                line = raw.decode('utf-8')
+            except UnicodeDecodeError:
+                if terminated:
+                    raise
+                # A line still being written; leave it for the next call.
+                break
+            line_number += 1
+            feed(line_number, line)
+            consumed = match.end()
+            if pending:
+                finished = list(pending)
+                del pending[:]
+                returned += len(finished)
+                if parser.is_clean():
+                    tail = None if raw[-1:] == b'\n' else ('cr' if terminated else 'line')
+                    resume = (consumed, line_number, tail, ParseCheckpoint._copy_carried(vars(parser)))
+                    returned = 0
+                for service in finished:
+                    # Finished past the old resume point, and returned by then.
+                    if drop:
+                        drop -= 1
+                    else:
+                        yield service
+    finally:
+        if hooks is not None:
+            hooks.end_phase('parse')
+            hooks.add_input(line_number - first_line, consumed)
+            if parser.interner is not None:
+                hooks.add_interned(*parser.interning_stats())
+    offset, line_number, tail, carried = resume
+    digest.update(memoryview(data)[:offset])
+    resumed.append(ParseCheckpoint(checkpoint.offset + offset, line_number, digest.hexdigest(), tail, carried,
+                                   returned, restarted))
+
+
+_SERVICE_START_BYTES = b'--- Start Archive Service ---'
+
+
+def scan_service_offsets(filename):
+    """
+    Quick pre-scan of an uncompressed archive for its service blocks.
+    Returns (byte offset, line number) of every '--- Start Archive Service ---'
+    line, without parsing anything else.
+    """
+    with io.open(filename, 'rb') as file:
+        try:
+            source = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return []
+    starts = []
+    line_number, counted = 1, 0
+    for match in re.finditer(re.escape(_SERVICE_START_BYTES), source):
+        line_start = max(source.rfind(b'\n', 0, match.start()), source.rfind(b'\r', 0, match.start())) + 1
+        line_end = min(end for end in (source.find(b'\n', match.end()), source.find(b'\r', match.end()), len(source))
+                       if end >= 0)
+        if source[line_start:line_end].strip() != _SERVICE_START_BYTES or line_start < counted:
+            continue
+        # Universal newlines: every '\n' plus every '\r' not followed by '\n'.
+        skipped = source[counted:line_start]
+        line_number += skipped.count(b'\n') + skipped.count(b'\r') - skipped.count(b'\r\n')
+        counted = line_start
+        starts.append((line_start, line_number))
+    source.close()
+    return starts
+
+
+class _InheritedValues(object):
+    """
+    Stands in for categorization values or category IDs that a run of
+    services inherits from the runs before it.  Membership tests pass and
+    are recorded in wanted, to be checked once the earlier runs are merged.
+    """
+
+    def __init__(self, kind, wanted, values=()):
+        self.kind = kind
+        self.wanted = wanted
+        self.values = list(values)
+
+    def __contains__(self, key):
+        if key in self.values:
+            return True
+        self.wanted.append((self.kind, key))
+        return True
+
+    def append(self, value):
+        self.values.append(value)
+
+    def keys(self):
+        return []
+
+
+class _ServiceChunkParser(ServicesTextParser):
+    """
+    Parses one run of services for parse_file_parallel.  Runs after the
+    first start without the categorization values and category IDs left by
+    earlier services; the lookups made against them are collected in wanted.
+    inherits is set when the run relied on other carried-over state (post
+    IDs, poll and include lists).
+    """
+
+    def __init__(self, validate_only=False, first=True, records=False, interner=None):
+        ServicesTextParser.__init__(self, validate_only, records=records, interner=interner)
+        self.inherits = False
+        self.wanted = []
+        self._started = set()
+        if not first:
+            self.categorization_values = _InheritedValues(None, self.wanted)
+            self.category_ids = dict((kind, _InheritedValues(kind, self.wanted)) for kind in self.category_ids)
+
+    def start_section(self, section, line_number):
+        self._started.add(section)
+        ServicesTextParser.start_section(self, section, line_number)
+
+    def end_section(self, section, line_number):
+        if section in ('poll_list', 'include_service', 'include_users', 'include_messages', 'include_categories'):
+            if section not in self._started:
+                self.inherits = True
+        ServicesTextParser.end_section(self, section, line_number)
+
+    def _set_post_nested(self, line_number, key, value):
+        if 'message_thread' not in self._started:
+            self.inherits = True
+        ServicesTextParser._set_post_nested(self, line_number, key, value)
+
+    def category_state(self):
+        """ The categorization keys (None if inherited) and new category IDs this run leaves behind. """
+        values = self.categorization_values
+        keys = None if isinstance(values, _InheritedValues) else set(values)
+        ids = dict((kind, list(getattr(values, 'values', values))) for kind, values in self.category_ids.items())
+        return keys, ids
+
+_bind_section_handlers(_ServiceChunkParser)
+_ServiceChunkParser._field_handlers = dict(ServicesTextParser._field_handlers)
+_ServiceChunkParser._field_handlers['message_post'] = dict(
+    ServicesTextParser._field_handlers['message_post'], Nested=_ServiceChunkParser._set_post_nested)
+
+
+def _parse_service_chunk(job):
+    """ Pool worker: parse the byte range [start, end) of an archive, numbering lines from first_line. """
+    filename, start, end, first_line, validate_only, records, interner = job
+    with io.open(filename, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    lines = StringIO(data.decode('utf-8'), newline=None).readlines()
+    parser = _ServiceChunkParser(validate_only, start == 0, records, interner)
+    feed = parser.reader.feed
+    error = error_line = None
+    line_number = first_line
+    try:
+        for line_number, line in enumerate(lines, first_line):
+            feed(line_number, line)
+    except Exception as e:
+        error, error_line = e, lines[line_number - first_line]
+    services = [] if validate_only else parser.services
+    return (services, error, error_line, len(lines), parser.inherits or not parser.is_clean(),
+            parser.wanted, parser.category_state())
+
+def parse_file_parallel(filename, validate_only=False, verbose=False, processes=None, hooks=None, records=False,
+                        interner=None):
+    """
+    Parse an uncompressed archive holding several services on a process
+    pool.  A pre-scan finds the service boundaries, runs of whole services
+    are parsed by separate processes, and the results are merged in order;
+    error messages keep the line numbers of the file.  Categorization values
+    and category IDs carried over from earlier services are checked while
+    merging.  Whenever a run depends on other state left by earlier services,
+    or did not end where a service ends, the file is parsed sequentially
+    instead, so the result is always the one parse_file gives.  Verbose
+    parses also stay sequential, to keep the log in order.  hooks gets the
+    'scan' and 'parse' phases and the input size, plus the phases of the
+    sequential parse when the file falls back to one.  Each process interns
+    values on its own when an interner is given.
+    """
+    if verbose or filename.endswith(_COMPRESSED_SUFFIXES) or processes == 1:
+        return parse_file(filename, validate_only, verbose, hooks=hooks, records=records, interner=interner)
+    if hooks is not None:
+        hooks.begin_phase('scan')
+    starts = scan_service_offsets(filename)
+    size = os.path.getsize(filename)
+    if hooks is not None:
+        hooks.end_phase('scan')
+    if len(starts) < 2:
+        return parse_file(filename, validate_only, verbose, hooks=hooks, records=records, interner=interner)
+    processes = processes or multiprocessing.cpu_count()
+    interning = True if interner is not None else None
+
+    # Group services into a few runs per process, split by size.
+    target = size // (processes * 4) + 1
+    jobs = []
+    run_start, run_line = 0, 1
+    for offset, line_number in starts[1:]:
+        if offset - run_start >= target:
+            jobs.append((filename, run_start, offset, run_line, validate_only, records, interning))
+            run_start, run_line = offset, line_number
+    jobs.append((filename, run_start, size, run_line, validate_only, records, interning))
+
+    if hooks is not None:
+        hooks.begin_phase('parse')
+    pool = multiprocessing.Pool(min(processes, len(jobs)))
+    try:
+        results = pool.map(_parse_service_chunk, jobs, 1)
+    finally:
+        pool.close()
+        pool.join()
+    if hooks is not None:
+        hooks.end_phase('parse')
+
+    def count_input():
+        # A sequential fallback counts the input for hooks itself.
+        if hooks is not None:
+            hooks.add_input(sum(result[3] for result in results), size)
+
+    services = []
+    categorization = category_ids = None
+    for index, (run_services, error, error_line, _, unclean, wanted, (keys, ids)) in enumerate(results):
+        if index:
+            if unclean or results[index - 1][4]:
+                return parse_file(filename, validate_only, hooks=hooks, records=records, interner=interner)
+            for kind, key in wanted:
+                if key not in (categorization if kind is None else category_ids[kind]):
+                    return parse_file(filename, validate_only, hooks=hooks, records=records, interner=interner)
+        if error is not None:
+            count_input()
+            if validate_only:
+                return False, "Error: {0}".format(str(error)), error_line
+            raise error
+        services.extend(run_services)
+        if keys is not None:
+            categorization = keys
+        if category_ids is None:
+            category_ids = dict((kind, set(values)) for kind, values in ids.items())
+        else:
+            for kind, values in ids.items():
+                category_ids[kind].update(values)
+    count_input()
+    if validate_only:
+        return True, "", ""
+    return services
+
+
+def parse_lines(lines, validate_only=False, verbose=False, hooks=None, records=False, interner=None):
+    if validate_only and not verbose:
+        parser = ValidatingTextParser(hooks=hooks)
+    else:
+        parser = ServicesTextParser(validate_only, verbose, hooks=hooks, records=records, interner=interner)
+    feed = parser.reader.feed
+    line_number = 0
+    if hooks is not None:
+        hooks.begin_phase('parse')
+    try:
+        for line_number, line in enumerate(lines, 1):
+            feed(line_number, line)
+
+        if validate_only:
+            return True, "", ""
+
+        return parser.services
+
+    except Exception as e:
+        if validate_only:
+            return False, "Error: {0}".format(str(e)), lines[line_number - 1]
+        else:
+            raise
+
+    finally:
+        if hooks is not None:
+            hooks.end_phase('parse')
+            hooks.add_input(line_number, sum(len(line.encode('utf-8')) for line in lines[:line_number]))
+            if parser.interner is not None:
+                hooks.add_interned(*parser.interning_stats())
+
+
+class ThreadIndex(object):
+    """
+    Post index and reply tree of one message thread, built in one pass over
+    its posts: posts by ID, the replies of every post (from Nested, with the
+    top level posts as the replies of None, since 0 is a valid post ID), and
+    the parent and depth of every post.  A reply whose parent is not indexed
+    before it, or that names itself, is indexed as a top level post, so the
+    tree never has cycles.
+    """
+
+    def __init__(self, posts=()):
+        self.posts = {}
+        self.parents = {}
+        self.depths = {}
+        self.replies = {None: []}
+        for post in posts:
+            self.add_post(post)
+
+    def add_post(self, post):
+        """ Index one post; posts must be added in thread order. """
+        post_id = post.get('Post')
+        parent_id = post.get('Nested') or None
+        if parent_id not in self.depths or parent_id == post_id:
+            parent_id = None
+        self.replies[parent_id].append(post)
+        if post_id is None or post_id in self.posts:
+            # Unnumbered and repeated posts only appear as replies.
+            return
+        self.posts[post_id] = post
+        self.parents[post_id] = parent_id
+        self.depths[post_id] = 0 if parent_id is None else self.depths[parent_id] + 1
+        self.replies[post_id] = []
+
+    def __len__(self):
+        return len(self.posts)
+
+    def __contains__(self, post_id):
+        return post_id in self.posts
+
+    def post(self, post_id):
+        """ Return the post with this ID, or None. """
+        return self.posts.get(post_id)
+
+    def replies_to(self, post_id=None):
+        """ Return the direct replies of a post; None gives the top level posts. """
+        return self.replies.get(post_id, [])
+
+    def parent(self, post_id):
+        """ Return the post this one replies to, or None for top level posts. """
+        return self.posts.get(self.parents.get(post_id))
+
+    def depth(self, post_id):
+        """ Return the reply depth of a post (0 for top level posts), or None. """
+        return self.depths.get(post_id)
+
+    def walk(self, post_id=None):
+        """
+        Yield (depth, post) for the replies below post_id, None meaning the whole
+        thread, in reply tree order: every post is followed by its replies.
+        """
+        base = self.depths.get(post_id, -1) + 1
+        stack = [(base, post) for post in reversed(self.replies_to(post_id))]
+        while stack:
+            depth, post = stack.pop()
+            yield depth, post
+            reply_id = post.get('Post')
+            if self.posts.get(reply_id) is post:
+                stack.extend((depth + 1, reply) for reply in reversed(self.replies[reply_id]))
+
+def thread_index(thread):
+    """ Build the ThreadIndex of a message thread. """
+    return ThreadIndex(thread.get('Messages', []))
+
+
+def display_services(services):
+    for service in services:
+        print("Service Entry: {0}".format(service['Entry']))
+        print("Service: {0}".format(service['Service']))
+        print("Service Type: {0}".format(service['ServiceType']))
+        print("Service Location: {0}".format(service['ServiceLocation']))
+        print("TimeZone: {0}".format(service['TimeZone']))
+        
+        if 'Info' in service and service['Info']:
+            print("Info: {0}".format(service['Info'].strip()))
+        
+        print("Interactions: {0}".format(', '.join(service['Interactions'])))
+        print("Status: {0}".format(', '.join(service.get('Status', []))))
+        
+        if 'Categorization' in service and service['Categorization']:
+            for category_type, category_levels in service['Categorization'].items():
+                print("{0}: {0}".format(category_type, ', '.join(category_levels)))
+        
+        print("Category List:")
+        for category in service['Categories']:
+            print("  Type: {0}, Level: {1}".format(category.get('Type', ''), category.get('Level', '')))
+            print("  ID: {0}".format(category['ID']))
+            print("  In SubID: {0}".format(category['InSub']))
+            print("  Headline: {0}".format(category['Headline']))
+            print("  Description: {0}".format(category['Description'].strip()))
+            print("")
+        
+        print("User List:")
+        for user_id, user_info in service['Users'].items():
+            print("  User ID: {0}".format(user_id))
+            print("    Name: {0}".format(user_info['Name']))
+            print("    Handle: {0}".format(user_info['Handle']))
+            print("    Email: {0}".format(user_info.get('Email', '')))
+            print("    Phone: {0}".format(user_info.get('Phone', '')))
+            print("    Location: {0}".format(user_info.get('Location', '')))
+            print("    Website: {0}".format(user_info.get('Website', '')))
+            print("    Avatar: {0}".format(user_info.get('Avatar', '')))
+            print("    Banner: {0}".format(user_info.get('Banner', '')))
+            print("    Joined: {0}".format(user_info.get('Joined', '')))
+            print("    Birthday: {0}".format(user_info.get('Birthday', '')))
+            print("    HashTags: {0}".format(user_info.get('HashTags', '')))
+            print("    ExtraFields:")
+            print("      {0}".format(user_info.get('ExtraFields', '').strip()))
+            print("    Bio:")
+            print("      {0}".format(user_info.get('Bio', '').strip()))
+            print("    Signature:")
+            print("      {0}".format(user_info.get('Signature', '').strip()))
+            print("")
+        
+        print("Message Threads:")
+        for idx, thread in enumerate(service['MessageThreads']):
+            print("  --- Message Thread {0} ---".format(idx + 1))
+            if thread['Title']:
+                print("    Title: {0}".format(thread['Title']))
+            if 'Category' in thread:
+                print("    Category: {0}".format(', '.join(thread['Category'])))
+            if 'Forum' in thread:
+                print("    Forum: {0}".format(', '.join(thread['Forum'])))
+            if 'Type' in thread:
+                print("    Type: {0}".format(thread['Type']))
+            if 'State' in thread:
+                print("    State: {0}".format(thread['State']))
+            if 'Keywords' in thread:
+                print("    Keywords: {0}".format(thread['Keywords']))
+            
+            for message in thread['Messages']:
+                print("    {0} ({1} on {2}): [{3}] Post ID: {4} Nested: {5}".format(
+                    message['Author'], message['Time'], message['Date'],
+                    message.get('SubType', 'Post' if message['Post'] == 1 or message['Nested'] == 0 else 'Reply'),
+                    message['Post'], message['Nested']))
+                
+                # Indent each line of the message body but keep it at the same level
+                print("      {0}".format(message['Message'].strip()))
+                
+                if 'Polls' in message and message['Polls']:
+                    print("      Polls:")
+                    for poll in message['Polls']:
+                        print("        Poll {0}:".format(poll.get('Num', '')))
+                        print("          Question: {0}".format(poll.get('Question', '')))
+                        print("          Answers: {0}".format(", ".join(poll.get('Answers', []))))
+                        print("          Results: {0}".format(", ".join(str(r) for r in poll.get('Results', []))))
+                        print("          Percentage: {0}".format(", ".join("{:.2f}".format(float(p)) for p in poll.get('Percentage', []))))
+                        print("          Votes: {0}".format(poll.get('Votes', '')))
+            print("")
+
+def display_services_from_file(filename):
+    services = parse_file(filename, False, False);
+    return display_services(services)
+
+_HTML_STYLE_RULES = (
+    'body { font-family: Arial, sans-serif; margin: 20px; background: #f9f9f9; }',
+    '.service-card { background: #fff; border: 1px solid #ddd; border-radius: 8px; padding: 16px; margin-bottom: 20px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }',
+    '.service-card h2 { margin-top: 0; color: #333; }',
+    '.thread-card { background: #fafafa; border-left: 4px solid #007BFF; padding: 12px; margin: 10px 0; }',
+    '.message-list { list-style: none; padding-left: 0; }',
+    '.message-list li { margin-bottom: 10px; }',
+    '.poll-card { background: #f0f8ff; border: 1px solid #cce; border-radius: 4px; padding: 10px; margin: 10px 0; }',
+)
+
+def _html_service_summary(svc):
+    """ The Info, Interactions, Status and Categories lines of a service card. """
+    lines = []
+    # Info
+    info = svc.get('Info', '').strip()
+    if info:
+        lines.append('  <p><strong>Info:</strong> <blockquote style="white-space: pre-wrap;">{0}</blockquote></p>'.format(
+            escape(unicode_type(info))))
+
+    # Interactions & Status
+    interactions = svc.get('Interactions', [])
+    if interactions:
+        items = ', '.join(escape(unicode_type(i)) for i in interactions)
+        lines.append('  <p><strong>Interactions:</strong> {0}</p>'.format(items))
+    status = svc.get('Status', [])
+    if status:
+        items = ', '.join(escape(unicode_type(s)) for s in status)
+        lines.append('  <p><strong>Status:</strong> {0}</p>'.format(items))
+
+    # Categories
+    cats = svc.get('Categories', [])
+    if cats:
+        lines.append('  <h3>Categories</h3>')
+        lines.append('  <ul>')
+        for cat in cats:
+            headline = cat.get('Headline', '')
+            level = cat.get('Level', '')
+            lines.append('    <li>{0} (<em>{1}</em>)</li>'.format(
+                escape(unicode_type(headline)), escape(unicode_type(level))))
+        lines.append('  </ul>')
+    return lines
+
+def _html_user(uid, u):
+    """ The list item lines of a user. """
+    uname = u.get('Name', '')
+    handle = u.get('Handle', '')
+    bio = u.get('Bio', '').strip()
+    lines = ['    <li><strong>{0}</strong>: {1} ({2})</li>'.format(
+        escape(unicode_type(uid)), escape(unicode_type(uname)), escape(unicode_type(handle)))]
+    if bio:
+        lines.append('      <blockquote style="white-space: pre-wrap;">{0}</blockquote>'.format(
+            escape(unicode_type(bio))))
+    return lines
+
+def _html_message(msg):
+    """ The list item line of a message post. """
+    author = msg.get('Author', '')
+    body = msg.get('Message', '').strip()
+    return '      <li><strong>{0}</strong>: <blockquote style="white-space: pre-wrap;">{1}</blockquote></li>'.format(
+        escape(unicode_type(author)), escape(unicode_type(body)))
+
+def services_to_html(services):
+    """
+    Render the services list as a styled HTML document string.
+
+    Args:
+        services (list of dict): Parsed services data structure.
+
+    Returns:
+        str: A complete HTML page.
+    """
+    lines = []
+    # Document head
+    lines.append('<!DOCTYPE html>')
+    lines.append('<html lang="en">')
+    lines.append('<head>')
+    lines.append('  <meta charset="UTF-8">')
+    lines.append('  <meta name="viewport" content="width=device-width, initial-scale=1.0">')
+    lines.append('  <title>Services Report</title>')
+    lines.append('  <style>')
+    lines.extend('    ' + rule for rule in _HTML_STYLE_RULES)
+    lines.append('  </style>')
+    lines.append('</head>')
+    lines.append('<body>')
+    lines.append('<div class="services-container">')
+
+    # Service cards
+    for svc in services:
+        entry = svc.get('Entry', '')
+        name = svc.get('Service', '')
+        lines.append('<div class="service-card">')
+        lines.append('  <h2>Service Entry: {0} — {1}</h2>'.format(
+            escape(unicode_type(entry)), escape(unicode_type(name))))
+
+        lines.extend(_html_service_summary(svc))
 
         # Users
         users = svc.get('Users', {})
@@ -2013,14 +4492,7 @@ def services_to_html(services):
             lines.append('  <h3>Users</h3>')
             lines.append('  <ul>')
             for uid, u in users.items():
-                uname = u.get('Name', '')
-                handle = u.get('Handle', '')
-                bio = u.get('Bio', '').strip()
-                lines.append('    <li><strong>{0}</strong>: {1} ({2})</li>'.format(
-                    escape(unicode_type(uid)), escape(unicode_type(uname)), escape(unicode_type(handle))))
-                if bio:
-                    lines.append('      <blockquote style="white-space: pre-wrap;">{0}</blockquote>'.format(
-                        escape(unicode_type(bio))))
+                lines.extend(_html_user(uid, u))
             lines.append('  </ul>')
 
         # Message Threads
@@ -2037,10 +4509,7 @@ def services_to_html(services):
                 if msgs:
                     lines.append('    <ul class="message-list">')
                     for msg in msgs:
-                        author = msg.get('Author', '')
-                        body = msg.get('Message', '').strip()
-                        lines.append('      <li><strong>{0}</strong>: <blockquote style="white-space: pre-wrap;">{1}</blockquote></li>'.format(
-                            escape(unicode_type(author)), escape(unicode_type(body))))
+                        lines.append(_html_message(msg))
                     lines.append('    </ul>')
                 lines.append('  </div>')
 
@@ -2073,9 +4542,299 @@ def save_services_to_html_file_from_file(filename, outfilename):
     services = parse_file(filename, False, False);
     return save_services_to_html_file(services, outfilename)
 
+def _html_page_name(base, page):
+    """ The file name of page (counted from 1) of a paginated page. """
+    return '{0}.html'.format(base) if page == 1 else '{0}-{1}.html'.format(base, page)
+
+def _html_pager(base, page, pages):
+    """ Links to the neighbouring pages of a paginated page, none for a single page. """
+    if pages < 2:
+        return []
+    links = []
+    if page > 1:
+        links.append('<a href="{0}">&laquo; Previous</a>'.format(_html_page_name(base, page - 1)))
+    shown = sorted(set([1, pages] + list(range(max(1, page - 5), min(pages, page + 5) + 1))))
+    last = 0
+    for number in shown:
+        if number > last + 1:
+            links.append('&hellip;')
+        if number == page:
+            links.append('<strong>{0}</strong>'.format(number))
+        else:
+            links.append('<a href="{0}">{1}</a>'.format(_html_page_name(base, number), number))
+        last = number
+    if page < pages:
+        links.append('<a href="{0}">Next &raquo;</a>'.format(_html_page_name(base, page + 1)))
+    return ['<p class="pager">{0}</p>'.format(' '.join(links))]
+
+def _write_html_page(path, title, stylesheet, body):
+    """ Stream a page whose body lines come from the iterable body to path. """
+    with _ReplacingOutput(path) as file:
+        writer = _ChunkedWriter(file)
+        for line in ('<!DOCTYPE html>', '<html lang="en">', '<head>', '  <meta charset="UTF-8">',
+                     '  <meta name="viewport" content="width=device-width, initial-scale=1.0">',
+                     '  <title>{0}</title>'.format(escape(unicode_type(title))),
+                     '  <link rel="stylesheet" href="{0}">'.format(stylesheet), '</head>', '<body>'):
+            writer.write(line + '\n')
+        for line in body:
+            writer.write(line + '\n')
+        writer.write('</body>\n</html>\n')
+        writer.flush()
+
+def _html_breadcrumb(service_title=None):
+    if service_title is None:
+        return '<p><a href="../index.html">All services</a></p>'
+    return '<p><a href="../index.html">All services</a> &rsaquo; <a href="index.html">{0}</a></p>'.format(
+        escape(unicode_type(service_title)))
+
+def _html_service_page(svc, title, threads, user_count):
+    yield _html_breadcrumb()
+    yield '<div class="service-card">'
+    yield '  <h2>Service Entry: {0} — {1}</h2>'.format(
+        escape(unicode_type(svc.get('Entry', ''))), escape(unicode_type(svc.get('Service', ''))))
+    for line in _html_service_summary(svc):
+        yield line
+    if user_count:
+        yield '  <h3><a href="users.html">Users</a> ({0})</h3>'.format(user_count)
+    if threads:
+        yield '  <h3>Message Threads</h3>'
+        yield '  <ul>'
+        for position, th in enumerate(threads, 1):
+            yield '    <li><a href="thread-{0}.html">{1}</a> ({2} posts)</li>'.format(
+                position, escape(unicode_type(th.get('Title', ''))), len(th.get('Messages', [])))
+        yield '  </ul>'
+    yield '</div>'
+
+def _html_thread_page(title, th, base, msgs, page, pages):
+    yield _html_breadcrumb(title)
+    yield '<div class="thread-card">'
+    yield '  <h2>{0}</h2>'.format(escape(unicode_type(th.get('Title', ''))))
+    if msgs:
+        yield '    <ul class="message-list">'
+        for msg in msgs:
+            yield _html_message(msg)
+        yield '    </ul>'
+    yield '</div>'
+    for line in _html_pager(base, page, pages):
+        yield line
+
+def _html_users_page(title, users, page, pages):
+    yield _html_breadcrumb(title)
+    yield '<div class="service-card">'
+    yield '  <h3>Users</h3>'
+    yield '  <ul>'
+    for uid, u in users:
+        for line in _html_user(uid, u):
+            yield line
+    yield '  </ul>'
+    yield '</div>'
+    for line in _html_pager('users', page, pages):
+        yield line
+
+# Files write_html_site keeps next to the pages for incremental rebuilds.
+_SITE_MANIFEST = '.site-manifest.json'
+_SITE_MANIFEST_VERSION = 2
+# ParseCheckpoint attributes the manifest keeps to resume the archive.
+_SITE_CHECKPOINT = ('offset', 'line_number', 'digest', 'tail', 'carried', 'returned')
+
+def _load_site_manifest(directory, posts_per_page, users_per_page):
+    """ The manifest of an earlier write_html_site into directory, None without a usable one. """
+    try:
+        with io.open(os.path.join(directory, _SITE_MANIFEST), 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (IOError, OSError, ValueError):
+        return None
+    if (manifest.get('version') != _SITE_MANIFEST_VERSION or manifest.get('posts_per_page') != posts_per_page or
+            manifest.get('users_per_page') != users_per_page):
+        return None
+    return manifest
+
+def _site_checkpoint(directory, manifest):
+    """
+    The ParseCheckpoint of the archive an earlier build read, None without
+    one or when a page of its services is missing, since they are not read
+    again.
+    """
+    if manifest is None or manifest.get('checkpoint') is None:
+        return None
+    for number, entry in enumerate(manifest['services'], 1):
+        try:
+            names = set(os.listdir(os.path.join(directory, 'service-{0}'.format(number))))
+        except OSError:
+            return None
+        if not names.issuperset(_site_pages(entry)):
+            return None
+    return ParseCheckpoint(**manifest['checkpoint'])
+
+def _site_pages(entry):
+    """ The page files of a service folder as recorded in a manifest entry. """
+    yield 'index.html'
+    for position, (digest, pages) in enumerate(entry['threads'], 1):
+        for page in range(1, pages + 1):
+            yield _html_page_name('thread-{0}'.format(position), page)
+    if entry['users'] is not None:
+        for page in range(1, entry['users'][1] + 1):
+            yield _html_page_name('users', page)
+
+# Names write_html_site gives service folders and the pages inside them.
+_SITE_FOLDER = re.compile(r'service-([0-9]+)\Z')
+_SITE_PAGE = re.compile(r'(index|users(-[0-9]+)?|thread-[0-9]+(-[0-9]+)?)\.html\Z')
+
+def _remove_site_pages(folder, keep=()):
+    """ Remove the site pages in folder other than keep, and folder itself once it is empty. """
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return
+    for name in names:
+        if name not in keep and _SITE_PAGE.match(name):
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass
+    if not keep:
+        try:
+            os.rmdir(folder)
+        except OSError:
+            pass
+
+def write_html_site(services, directory, posts_per_page=50, users_per_page=100, incremental=False):
+    """
+    Write services as a multi-page HTML site instead of the single page of
+    services_to_html: directory/index.html lists the services, and each
+    service gets a folder service-N with an index.html, a thread-M.html
+    per thread (thread-M-2.html and so on after posts_per_page posts) and
+    users.html (users-2.html ... after users_per_page users).  Pages link
+    to each other with relative links and share style.css.  Every page is
+    streamed to disk on its own, and services may be any iterable, or the
+    filename of an archive, which is then parsed one service at a time
+    through iter_services.  Returns the path of index.html.
+
+    A manifest of content hashes per service page, thread and user list is
+    kept in directory.  With incremental only the pages whose hash changed
+    since the last build (or that are missing) are written again; the index
+    is always rewritten.  Either way, pages and service folders left over
+    from an earlier build that this one no longer has are removed.
+
+    For an uncompressed UTF-8 archive the manifest also keeps the resume
+    point of parse_file_incremental.  When the archive only grew since the
+    last build, an incremental one parses just the bytes after it; the
+    services before it keep their recorded hashes and pages.
+    """
+    posts_per_page = max(1, posts_per_page)
+    users_per_page = max(1, users_per_page)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    manifest = _load_site_manifest(directory, posts_per_page, users_per_page) if incremental else None
+    previous_services = manifest['services'] if manifest is not None else []
+    # Services of the archive before the resume point, kept as they are.
+    entries = []
+    resumed = None
+    if isinstance(services, basestring):
+        if services.endswith(_COMPRESSED_SUFFIXES) or _bom_codec(services) is not None:
+            services = iter_services(services)
+        else:
+            source = _read_past_checkpoint(services, _site_checkpoint(directory, manifest))
+            if source[0] is not None and not source[3]:
+                entries = list(previous_services)
+            resumed = []
+            services = _iter_resumed_services(services, source, resumed)
+    dumps = _jsonl_dumps()
+
+    def content_hash(*inputs):
+        return hashlib.sha1(dumps(inputs).encode('utf-8')).hexdigest()
+
+    def changed(folder, name, entry, previous):
+        return entry != previous or not os.path.exists(os.path.join(directory, folder, name))
+
+    with io.open(os.path.join(directory, 'style.css'), 'w', encoding='utf-8') as file:
+        file.write('\n'.join(_HTML_STYLE_RULES + ('.pager { margin: 10px 0; }',)) + '\n')
+    summaries = [('service-{0}'.format(number),) + tuple(entry['summary'])
+                 for number, entry in enumerate(entries, 1)]
+    for number, svc in enumerate(services, len(entries) + 1):
+        folder = 'service-{0}'.format(number)
+        path = os.path.join(directory, folder)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        previous = previous_services[number - 1] if number <= len(previous_services) else None
+        title = svc.get('Service', '') or folder
+        threads = svc.get('MessageThreads', [])
+        users = list(svc.get('Users', {}).items())
+        page_hash = content_hash(
+            title, svc.get('Entry', ''), svc.get('Service', ''), svc.get('Info', ''), svc.get('Interactions', []),
+            svc.get('Status', []), svc.get('Categories', []), len(users),
+            [(th.get('Title', ''), len(th.get('Messages', []))) for th in threads])
+        entry = {'page': page_hash, 'threads': [], 'users': None,
+                 'summary': [svc.get('Entry', ''), title, len(threads), len(users)]}
+        if not incremental or changed(folder, 'index.html', page_hash, previous and previous['page']):
+            _write_html_page(os.path.join(path, 'index.html'), title, '../style.css',
+                             _html_service_page(svc, title, threads, len(users)))
+        previous_threads = previous['threads'] if previous is not None else []
+        for position, th in enumerate(threads, 1):
+            base = 'thread-{0}'.format(position)
+            msgs = th.get('Messages', [])
+            pages = max(1, -(-len(msgs) // posts_per_page))
+            previous_thread = previous_threads[position - 1] if position <= len(previous_threads) else None
+            thread_hash = content_hash(title, th)
+            entry['threads'].append([thread_hash, pages])
+            if incremental and not changed(folder, _html_page_name(base, 1), [thread_hash, pages], previous_thread):
+                continue
+            for page in range(1, pages + 1):
+                _write_html_page(os.path.join(path, _html_page_name(base, page)), th.get('Title', '') or base,
+                                 '../style.css', _html_thread_page(
+                                     title, th, base, msgs[(page - 1) * posts_per_page:page * posts_per_page],
+                                     page, pages))
+        if users:
+            pages = -(-len(users) // users_per_page)
+            previous_users = previous['users'] if previous is not None else None
+            users_hash = content_hash(title, users)
+            entry['users'] = [users_hash, pages]
+            if not incremental or changed(folder, 'users.html', entry['users'], previous_users):
+                for page in range(1, pages + 1):
+                    _write_html_page(os.path.join(path, _html_page_name('users', page)), title, '../style.css',
+                                     _html_users_page(title, users[(page - 1) * users_per_page:page * users_per_page],
+                                                      page, pages))
+        entries.append(entry)
+        summaries.append((folder,) + tuple(entry['summary']))
+        # Drop the pages of threads and users that went away
+        _remove_site_pages(path, set(_site_pages(entry)))
+
+    # and the folders of services that went away
+    for name in os.listdir(directory):
+        match = _SITE_FOLDER.match(name)
+        if match and int(match.group(1)) > len(entries):
+            _remove_site_pages(os.path.join(directory, name))
+
+    index = os.path.join(directory, 'index.html')
+    body = ['<h1>Services</h1>', '<ul>']
+    for folder, entry, title, thread_count, user_count in summaries:
+        body.append('  <li><a href="{0}/index.html">{1} — {2}</a> ({3} threads, {4} users)</li>'.format(
+            folder, escape(unicode_type(entry)), escape(unicode_type(title)), thread_count, user_count))
+    body.append('</ul>')
+    _write_html_page(index, 'Services', 'style.css', body)
+
+    checkpoint = resumed[0] if resumed else None
+    manifest_path = os.path.join(directory, _SITE_MANIFEST)
+    with io.open(manifest_path + '.tmp', 'w', encoding='utf-8') as file:
+        file.write(unicode_type(json.dumps({
+            'version': _SITE_MANIFEST_VERSION, 'posts_per_page': posts_per_page, 'users_per_page': users_per_page,
+            'services': entries,
+            'checkpoint': None if checkpoint is None else dict(
+                (name, getattr(checkpoint, name)) for name in _SITE_CHECKPOINT)}, default=_json_default)))
+    _replace_file(manifest_path + '.tmp', manifest_path)
+    return index
+
+def _json_default(value):
+    """ Serialize MappedText and LazyText bodies as their text and records as dicts. """
+    if isinstance(value, MappedText):
+        return value.text()
+    if isinstance(value, Record):
+        return dict(value.items())
+    raise TypeError("Object of type {0} is not JSON serializable".format(type(value).__name__))
+
 def to_json(services):
     """ Convert the services data structure to JSON """
-    return json.dumps(services, indent=2, ensure_ascii=False)
+    return json.dumps(services, indent=2, ensure_ascii=False, default=_json_default)
 
 def to_json_from_file(filename):
     services = parse_file(filename, False, False);
@@ -2090,20 +4849,243 @@ def load_from_json_file(json_filename):
     with open_compressed_file(json_filename) as file:
         return json.load(file)
 
-def save_to_json_file(services, json_filename):
-    """ Save the services data structure to a JSON file """
-    json_data = json.dumps(services, indent=2, ensure_ascii=False)
-    save_compressed_file(json_data, json_filename)
+def _json_indented(text, prefix):
+    # Encoded JSON has no raw line breaks inside strings, so this only
+    # shifts its layout lines.
+    return text.replace('\n', prefix) if prefix != '\n' else text
+
+def write_json(services, fileobj, indent=2, chunk_size=64 * 1024):
+    """
+    Write services as JSON to an open (text, binary or compressed) file
+    without building the whole document: the services are encoded one at a
+    time and their message threads one by one with JSONEncoder.iterencode,
+    and the text is written in chunks of about chunk_size characters.
+    services may be any iterable.  The result matches to_json for indent=2;
+    indent=None writes compact JSON without whitespace.  When orjson is
+    installed it encodes the threads instead, for indent 2 or None.
+    """
+    writer = _ChunkedWriter(fileobj, chunk_size)
+    write = writer.write
+    if indent is None:
+        encoder = json.JSONEncoder(ensure_ascii=False, default=_json_default, separators=(',', ':'))
+        step = None
+    else:
+        encoder = json.JSONEncoder(indent=indent, ensure_ascii=False, default=_json_default)
+        step = ' ' * indent if isinstance(indent, integer_types) else indent
+    fast = HAS_ORJSON and indent in (None, 2)
+    orjson_options = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0) if fast else 0
+    key_separator = ':' if indent is None else ': '
+
+    def newline(level):
+        return '' if step is None else '\n' + step * level
+
+    def write_value(value, level):
+        prefix = newline(level) or '\n'
+        if fast:
+            data = orjson.dumps(value, default=_json_default, option=orjson_options)
+            writer.write_bytes(data.replace(b'\n', prefix.encode('utf-8')) if prefix != '\n' else data)
+        else:
+            for chunk in encoder.iterencode(value):
+                write(_json_indented(chunk, prefix))
+
+    write('[')
+    first = True
+    for service in services:
+        write(newline(1) if first else ',' + newline(1))
+        first = False
+        if not isinstance(service, Mapping) or not service or not all(isinstance(key, basestring) for key in service):
+            write_value(service, 1)
+            continue
+        write('{')
+        for number, (key, value) in enumerate(service.items()):
+            write((',' if number else '') + newline(2) + encoder.encode(key) + key_separator)
+            if key == 'MessageThreads' and isinstance(value, (list, tuple)) and value:
+                write('[')
+                for position, thread in enumerate(value):
+                    write((',' if position else '') + newline(3))
+                    write_value(thread, 3)
+                write(newline(2) + ']')
+            else:
+                write_value(value, 2)
+        write(newline(1) + '}')
+    write(']' if first else newline(0) + ']')
+    writer.flush()
+
+def save_to_json_file(services, json_filename, indent=2):
+    """
+    Save the services data structure to a JSON file, streamed through
+    write_json into the (possibly compressed) file.  indent=None writes
+    compact JSON.
+    """
+    with _ReplacingOutput(json_filename) as file:
+        write_json(services, file, indent)
 
 def save_to_json_from_file(filename, outfile):
     services = parse_file(filename, False, False);
     return save_to_json(services, outfile)
 
+# Thread fields repeated on every JSON Lines post so that each line stands
+# on its own; from_jsonl drops them again.
+_JSONL_THREAD_FIELDS = ('Thread', 'Title', 'Category', 'Forum')
+
+def _jsonl_dumps():
+    if HAS_ORJSON:
+        return lambda record: orjson.dumps(
+            record, default=_json_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.JSONEncoder(ensure_ascii=False, default=_json_default, separators=(',', ':')).encode
+
+def _jsonl_records(service):
+    """ The 'service', 'thread' and 'post' JSON Lines records of one service. """
+    entry = service.get('Entry')
+    header = {'Record': 'service'}
+    for key, value in service.items():
+        header[key] = [] if key == 'MessageThreads' else value
+    yield header
+    for thread in service.get('MessageThreads', ()):
+        header = {'Record': 'thread', 'Entry': entry}
+        for key, value in thread.items():
+            header[key] = [] if key == 'Messages' else value
+        yield header
+        shared = {'Record': 'post', 'Entry': entry}
+        for key in _JSONL_THREAD_FIELDS:
+            if key in thread:
+                shared[key] = thread[key]
+        for post in thread.get('Messages', ()):
+            record = dict(shared)
+            record.update(post.items())
+            yield record
+
+def write_jsonl(services, fileobj, chunk_size=64 * 1024):
+    """
+    Write services to an open (text, binary or compressed) file as JSON
+    Lines, see to_jsonl.
+    """
+    writer = _ChunkedWriter(fileobj, chunk_size)
+    write = writer.write
+    dumps = _jsonl_dumps()
+    for service in services:
+        for record in _jsonl_records(service):
+            write(dumps(record))
+            write('\n')
+    writer.flush()
+
+def to_jsonl(services, jsonl_filename):
+    """
+    Save services as JSON Lines, one object per line, to a file compressed by
+    extension like save_compressed_file.  Every post gets its own line
+    ("Record": "post") carrying the service Entry and the Thread, Title,
+    Category and Forum of its thread next to the post fields, so each line
+    can be analysed on its own.  Each service and each thread is preceded by
+    a "service" or "thread" line with its other fields (and an empty
+    MessageThreads or Messages) for from_jsonl to rebuild the tree from.
+    services may be any iterable, or the filename of an archive, which is
+    then streamed service by service through iter_services.
+    """
+    if isinstance(services, basestring):
+        services = iter_services(services)
+    with _ReplacingOutput(jsonl_filename) as file:
+        write_jsonl(services, file)
+
+def jsonl_ranges(jsonl_filename, parts):
+    """
+    Split an uncompressed JSON Lines file into parts (start, end) byte
+    ranges for iter_jsonl or from_jsonl, for instance one per worker process.
+    Ranges need not fall on line boundaries.
+    """
+    size = os.path.getsize(jsonl_filename)
+    parts = max(1, parts)
+    return [(size * part // parts, size * (part + 1) // parts) for part in range(parts)]
+
+def iter_jsonl(jsonl_filename, start=0, end=None):
+    """
+    Yield the records of a JSON Lines file as dicts.  With start and end only
+    the lines that begin in that byte range are read, so workers given
+    adjacent ranges (see jsonl_ranges) together read every line exactly
+    once.  Byte ranges need an uncompressed file.
+    """
+    loads = orjson.loads if HAS_ORJSON else json.loads
+    if jsonl_filename.endswith(_COMPRESSED_SUFFIXES):
+        if start or end is not None:
+            raise ValueError("Byte ranges need an uncompressed JSON Lines file: {0}".format(jsonl_filename))
+        for line in iter_file_lines(jsonl_filename):
+            if line.strip():
+                yield loads(line)
+        return
+    with io.open(jsonl_filename, 'rb') as file:
+        if start > 0:
+            # Skip the line in progress at start, it belongs to the range before.
+            file.seek(start - 1)
+            file.readline()
+        position = file.tell()
+        while end is None or position < end:
+            line = file.readline()
+            if not line:
+                break
+            position += len(line)
+            if line.strip():
+                yield loads(line)
+
+def from_jsonl(jsonl_filename, start=0, end=None):
+    """
+    Rebuild the services data structure from a to_jsonl file in one pass.
+    For a byte range (see iter_jsonl) whose first posts belong to a service
+    or thread that started in an earlier range, that service and thread are
+    rebuilt from the fields repeated on the posts.
+    """
+    services = []
+    service = thread = None
+    for record in iter_jsonl(jsonl_filename, start, end):
+        kind = record.pop('Record', None)
+        if kind == 'service':
+            service = record
+            service['MessageThreads'] = []
+            services.append(service)
+            thread = None
+            continue
+        entry = record.pop('Entry', None)
+        if service is None or service.get('Entry') != entry:
+            service = {'Entry': entry, 'MessageThreads': []}
+            services.append(service)
+            thread = None
+        if kind == 'thread':
+            thread = record
+            thread['Messages'] = []
+            service.setdefault('MessageThreads', []).append(thread)
+        elif kind == 'post':
+            shared = dict((key, record.pop(key)) for key in _JSONL_THREAD_FIELDS if key in record)
+            if thread is None or thread.get('Thread') != shared.get('Thread'):
+                thread = shared
+                thread['Messages'] = []
+                service.setdefault('MessageThreads', []).append(thread)
+            thread['Messages'].append(record)
+        else:
+            raise ValueError("Unknown JSON Lines record: {0!r}".format(kind))
+    return services
+
+if HAS_YAML:
+    class _ServicesDumper(yaml.SafeDumper):
+        """
+        SafeDumper that writes interned (shared) Category and Forum tuples as
+        plain lists, without anchors, and mapped or lazy text and Records as
+        plain strings and mappings.  PyYAML's own SafeDumper is left as is.
+        """
+
+        def ignore_aliases(self, data):
+            return isinstance(data, tuple) or yaml.SafeDumper.ignore_aliases(self, data)
+
+    _ServicesDumper.add_representer(tuple, _ServicesDumper.represent_list)
+    _ServicesDumper.add_representer(
+        MappedText, lambda dumper, value: dumper.represent_str(value.text()))
+    _ServicesDumper.add_representer(
+        LazyText, lambda dumper, value: dumper.represent_str(value.text()))
+    _ServicesDumper.add_multi_representer(
+        Record, lambda dumper, value: dumper.represent_dict(dict(value.items())))
+
 def to_yaml(data):
     """Convert data to a YAML string, if possible."""
     if not HAS_YAML:
         return False
-    return yaml.safe_dump(data, default_flow_style=False, allow_unicode=True)
+    return yaml.dump(data, Dumper=_ServicesDumper, default_flow_style=False, allow_unicode=True)
 
 def to_yaml_from_file(filename):
     services = parse_file(filename, False, False);
@@ -2126,7 +5108,7 @@ def save_to_yaml_file(data, filename):
     """Save data as YAML to a file."""
     if not HAS_YAML:
         return False
-    yaml_data = yaml.safe_dump(data, default_flow_style=False, allow_unicode=True)
+    yaml_data = yaml.dump(data, Dumper=_ServicesDumper, default_flow_style=False, allow_unicode=True)
     save_compressed_file(yaml_data + "\n", filename)
     return True
 
@@ -2134,9 +5116,21 @@ def save_to_yaml_from_file(filename, outfile):
     services = parse_file(filename, False, False);
     return save_to_yaml(services, outfile)
 
+def _plain_value(value):
+    """ A copy of value with MappedText and LazyText bodies as text and records as dicts, for marshal. """
+    if isinstance(value, MappedText):
+        return value.text()
+    if isinstance(value, Mapping):
+        return dict((key, _plain_value(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [_plain_value(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_plain_value(item) for item in value)
+    return value
+
 def to_marshal(services):
     """Convert the services data structure to a marshaled byte string"""
-    return marshal.dumps(services)
+    return marshal.dumps(_plain_value(services))
 
 def to_marshal_from_file(filename):
     services = parse_file(filename, False, False);
@@ -2153,7 +5147,7 @@ def load_from_marshal_file(marshal_filename):
 
 def save_to_marshal_file(services, marshal_filename):
     """Save the services data structure to a marshal file"""
-    marshal_data = marshal.dumps(services)
+    marshal_data = marshal.dumps(_plain_value(services))
     save_compressed_file(marshal_data, marshal_filename, mode='wb')
 
 def save_to_marshal_from_file(filename, outfile):
@@ -2186,6 +5180,234 @@ def save_to_pickle_from_file(filename, outfile):
     services = parse_file(filename, False, False);
     return save_to_pickle(services, outfile)
 
+# Columns of the SQLite tables, in the order the parser gives the keys.
+# Absent keys are stored as NULL; the list and dict valued fields in
+# _SQLITE_JSON_FIELDS as JSON, and keys without a column go into a JSON
+# 'extra' column.
+_SQLITE_SERVICE_FIELDS = ('Interactions', 'Categorization', 'Info', 'Entry', 'Service', 'ServiceType',
+                          'ServiceLocation', 'TimeZone', 'PinnedMessage', 'Status')
+_SQLITE_USER_FIELDS = UserRecord._fields
+_SQLITE_CATEGORY_FIELDS = CategoryRecord._fields
+_SQLITE_THREAD_FIELDS = tuple(field for field in ThreadRecord._fields if field != 'Messages')
+_SQLITE_POST_FIELDS = tuple(field for field in PostRecord._fields if field != 'Polls')
+_SQLITE_POLL_FIELDS = PollRecord._fields
+_SQLITE_JSON_FIELDS = frozenset(('Interactions', 'Status', 'Categorization', 'Category', 'Forum',
+                                 'Answers', 'Results', 'Percentage'))
+_SQLITE_SCALARS = (basestring, float) + integer_types
+
+_SQLITE_TABLES = (
+    ('services', ('id INTEGER PRIMARY KEY',), _SQLITE_SERVICE_FIELDS),
+    ('users', ('service_id', 'UserID'), _SQLITE_USER_FIELDS),
+    ('categories', ('service_id', 'position'), _SQLITE_CATEGORY_FIELDS),
+    ('threads', ('id INTEGER PRIMARY KEY', 'service_id', 'position'), _SQLITE_THREAD_FIELDS),
+    ('thread_categories', ('thread_id', 'Kind', 'Name'), ()),
+    # Polls is the number of polls of a post, NULL when it has no Polls key.
+    ('posts', ('id INTEGER PRIMARY KEY', 'service_id', 'thread_id', 'position', 'Polls'), _SQLITE_POST_FIELDS),
+    ('polls', ('post_id', 'position'), _SQLITE_POLL_FIELDS),
+)
+
+_SQLITE_INDEXES = (
+    'CREATE INDEX users_service ON users (service_id)',
+    'CREATE INDEX categories_service ON categories (service_id, position)',
+    'CREATE INDEX threads_service ON threads (service_id, position)',
+    'CREATE INDEX threads_thread ON threads (Thread)',
+    'CREATE INDEX thread_categories_name ON thread_categories (Kind, Name, thread_id)',
+    'CREATE INDEX posts_thread ON posts (thread_id, position)',
+    'CREATE INDEX posts_author_id ON posts (AuthorID)',
+    'CREATE INDEX posts_author ON posts (Author)',
+    'CREATE INDEX posts_date ON posts (Date)',
+    'CREATE INDEX polls_post ON polls (post_id, position)',
+)
+
+def _sqlite_columns(table):
+    for name, keys, fields in _SQLITE_TABLES:
+        if name == table:
+            return [key.split()[0] for key in keys] + ['"{0}"'.format(field) for field in fields] + (['extra'] if fields else [])
+
+def _sqlite_row(keys, record, fields, skip=()):
+    """ keys followed by the columns of record's fields and its 'extra' JSON. """
+    row = list(keys)
+    extra = {}
+    for field in fields:
+        value = record.get(field)
+        if value is None:
+            if field in record:
+                extra[field] = None
+        elif field in _SQLITE_JSON_FIELDS:
+            value = json.dumps(value, ensure_ascii=False, default=_json_default)
+        elif isinstance(value, MappedText):
+            value = value.text()
+        elif not isinstance(value, _SQLITE_SCALARS) or isinstance(value, bool):
+            extra[field] = value
+            value = None
+        row.append(value)
+    for key in record:
+        if key not in fields and key not in skip:
+            extra[key] = record[key]
+    row.append(json.dumps(extra, ensure_ascii=False, default=_json_default) if extra else None)
+    return row
+
+def _sqlite_record(record, fields, row):
+    """ Add the fields of a row built by _sqlite_row to record. """
+    for field, value in zip(fields, row):
+        if value is not None:
+            record[field] = json.loads(value) if field in _SQLITE_JSON_FIELDS else value
+    if row[len(fields)] is not None:
+        record.update(json.loads(row[len(fields)]))
+    return record
+
+def _insert_sqlite_rows(connection, rows):
+    for table, table_rows in rows.items():
+        if table_rows:
+            columns = _sqlite_columns(table)
+            connection.executemany('INSERT INTO {0} ({1}) VALUES ({2})'.format(
+                table, ', '.join(columns), ', '.join('?' * len(columns))), table_rows)
+            del table_rows[:]
+
+def save_to_sqlite(services, path, batch_size=10000):
+    """
+    Save services to the SQLite database at path, replacing the tables of an
+    earlier save.  Services, users, categories, threads, posts and polls get
+    a table each, thread_categories lists the Category and Forum names of
+    every thread, posts are indexed on AuthorID, Author, Date and thread and
+    posts_fts is an FTS5 index of the message bodies (when SQLite has FTS5).
+    Rows are inserted with executemany in batches of about batch_size posts,
+    all in one transaction, so a failed save (a parse error in a streamed
+    archive, say) leaves the database as it was.  services may be any
+    iterable, or the filename of an archive, which is then streamed service
+    by service through iter_services.
+    """
+    if not HAS_SQLITE:
+        raise ImportError("sqlite3 module is not available")
+    if isinstance(services, basestring):
+        services = iter_services(services)
+    # Transactions are managed here: BEGIN before the old tables are dropped.
+    connection = sqlite3.connect(path, isolation_level=None)
+    try:
+        connection.execute('BEGIN')
+        for table, keys, fields in reversed(_SQLITE_TABLES):
+            connection.execute('DROP TABLE IF EXISTS {0}'.format(table))
+        connection.execute('DROP TABLE IF EXISTS posts_fts')
+        for table, keys, fields in _SQLITE_TABLES:
+            connection.execute('CREATE TABLE {0} ({1})'.format(
+                table, ', '.join(keys + tuple('"{0}"'.format(field) for field in fields) + (('extra',) if fields else ()))))
+        rows = OrderedDict((table, []) for table, _, _ in _SQLITE_TABLES)
+        thread_id = post_id = 0
+        for service_id, service in enumerate(services, 1):
+            rows['services'].append(_sqlite_row((service_id,), service, _SQLITE_SERVICE_FIELDS,
+                                                ('Users', 'Categories', 'MessageThreads')))
+            for user_id, user in service.get('Users', {}).items():
+                rows['users'].append(_sqlite_row((service_id, user_id), user, _SQLITE_USER_FIELDS))
+            for position, category in enumerate(service.get('Categories', ())):
+                rows['categories'].append(_sqlite_row((service_id, position), category, _SQLITE_CATEGORY_FIELDS))
+            for position, thread in enumerate(service.get('MessageThreads', ())):
+                thread_id += 1
+                rows['threads'].append(_sqlite_row((thread_id, service_id, position), thread,
+                                                   _SQLITE_THREAD_FIELDS, ('Messages',)))
+                for kind in ('Category', 'Forum'):
+                    for name in thread.get(kind) or ():
+                        rows['thread_categories'].append((thread_id, kind, unicode_type(name)))
+                for post_position, post in enumerate(thread.get('Messages', ())):
+                    post_id += 1
+                    polls = post.get('Polls')
+                    rows['posts'].append(_sqlite_row(
+                        (post_id, service_id, thread_id, post_position, None if polls is None else len(polls)),
+                        post, _SQLITE_POST_FIELDS, ('Polls',)))
+                    for poll_position, poll in enumerate(polls or ()):
+                        rows['polls'].append(_sqlite_row((post_id, poll_position), poll, _SQLITE_POLL_FIELDS))
+                if len(rows['posts']) >= batch_size:
+                    _insert_sqlite_rows(connection, rows)
+        _insert_sqlite_rows(connection, rows)
+        for statement in _SQLITE_INDEXES:
+            connection.execute(statement)
+        try:
+            connection.execute("CREATE VIRTUAL TABLE posts_fts USING fts5(Message, content='posts', content_rowid='id')")
+            connection.execute("INSERT INTO posts_fts (posts_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError:
+            pass  # SQLite built without FTS5
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    finally:
+        connection.close()
+
+def _select_sqlite(connection, table, order):
+    return connection.execute('SELECT {0} FROM {1} ORDER BY {2}'.format(', '.join(_sqlite_columns(table)), table, order))
+
+def load_from_sqlite(path):
+    """ Load the services data structure from a database written by save_to_sqlite. """
+    if not HAS_SQLITE:
+        raise ImportError("sqlite3 module is not available")
+    connection = sqlite3.connect(path)
+    try:
+        services = OrderedDict()
+        for row in _select_sqlite(connection, 'services', 'id'):
+            service = {'Users': {}, 'MessageThreads': [], 'Categories': []}
+            services[row[0]] = _sqlite_record(service, _SQLITE_SERVICE_FIELDS, row[1:])
+        for row in _select_sqlite(connection, 'users', 'rowid'):
+            services[row[0]]['Users'][row[1]] = _sqlite_record({}, _SQLITE_USER_FIELDS, row[2:])
+        for row in _select_sqlite(connection, 'categories', 'service_id, position'):
+            services[row[0]]['Categories'].append(_sqlite_record({}, _SQLITE_CATEGORY_FIELDS, row[2:]))
+        threads = {}
+        for row in _select_sqlite(connection, 'threads', 'id'):
+            thread = threads[row[0]] = {'Messages': []}
+            services[row[1]]['MessageThreads'].append(_sqlite_record(thread, _SQLITE_THREAD_FIELDS, row[3:]))
+        posts = {}
+        for row in _select_sqlite(connection, 'posts', 'id'):
+            post = _sqlite_record({}, _SQLITE_POST_FIELDS, row[5:])
+            if row[4] is not None:
+                post['Polls'] = posts[row[0]] = []
+            threads[row[2]]['Messages'].append(post)
+        for row in _select_sqlite(connection, 'polls', 'post_id, position'):
+            posts[row[0]].append(_sqlite_record({}, _SQLITE_POLL_FIELDS, row[2:]))
+        return list(services.values())
+    finally:
+        connection.close()
+
+def find_posts_in_sqlite(path, author_id=None, author=None, category=None, forum=None, text=None, limit=None):
+    """
+    Posts of a save_to_sqlite database matching every given condition: an
+    AuthorID, an Author, a thread Category or Forum name, or an FTS5 query
+    over the message bodies.  Each post comes back as a dict with the Entry,
+    Thread and Title of its service and thread before its own fields.
+    """
+    if not HAS_SQLITE:
+        raise ImportError("sqlite3 module is not available")
+    conditions = []
+    parameters = []
+    # AuthorID is stored as an integer; a string would match nothing.
+    if author_id is not None:
+        author_id = int(author_id)
+    for column, value in (('posts.AuthorID', author_id), ('posts.Author', author)):
+        if value is not None:
+            conditions.append('{0} = ?'.format(column))
+            parameters.append(value)
+    for kind, value in (('Category', category), ('Forum', forum)):
+        if value is not None:
+            conditions.append('posts.thread_id IN (SELECT thread_id FROM thread_categories WHERE Kind = ? AND Name = ?)')
+            parameters.extend((kind, value))
+    if text is not None:
+        conditions.append('posts.id IN (SELECT rowid FROM posts_fts WHERE posts_fts MATCH ?)')
+        parameters.append(text)
+    query = ('SELECT services.Entry, threads.Thread, threads.Title, {0} FROM posts'
+             ' JOIN threads ON threads.id = posts.thread_id JOIN services ON services.id = posts.service_id'.format(
+                 ', '.join('posts.' + column for column in _sqlite_columns('posts')[5:])))
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY posts.id'
+    if limit is not None:
+        query += ' LIMIT {0:d}'.format(limit)
+    connection = sqlite3.connect(path)
+    try:
+        found = []
+        for row in connection.execute(query, parameters):
+            post = OrderedDict((key, value) for key, value in zip(('Entry', 'Thread', 'Title'), row[:3]) if value is not None)
+            found.append(dict(_sqlite_record(post, _SQLITE_POST_FIELDS, row[3:])))
+        return found
+    finally:
+        connection.close()
+
 def to_array(data):
     """Convert data to a string (like a Python literal)."""
     return str(data)
@@ -2212,169 +5434,168 @@ def save_to_array_from_file(filename, outfile):
     services = parse_file(filename, False, False);
     return save_to_array(services, outfile)
 
+def _service_lines(service):
+    """ Yield the lines of one service in the archive text format, without line breaks. """
+    # Service wrapper
+    yield '--- Start Archive Service ---'
+    yield 'Entry: {0}'.format(service.get('Entry', ''))
+    yield 'Service: {0}'.format(service.get('Service', ''))
+    yield 'ServiceType: {0}'.format(service.get('ServiceType', ''))
+    yield 'ServiceLocation: {0}'.format(service.get('ServiceLocation', ''))
+    yield 'TimeZone: {0}'.format(service.get('TimeZone', 'UTC'))
+
+    # Info section
+    if 'Info' in service:
+        yield 'Info:'
+        yield '--- Start Info Body ---'
+        for line in service['Info'].splitlines():
+            yield line
+        yield '--- End Info Body ---'
+        yield ''
+
+    # User list
+    users = service.get('Users', {})
+    if users:
+        yield '--- Start User List ---'
+        for uid, user in users.items():
+            yield '--- Start User Info ---'
+            yield 'User: {0}'.format(uid)
+            yield 'Name: {0}'.format(user.get('Name', ''))
+            yield 'Handle: {0}'.format(user.get('Handle', ''))
+            yield 'Email: {0}'.format(user.get('Email', ''))
+            yield 'Phone: {0}'.format(user.get('Phone', ''))
+            yield 'Location: {0}'.format(user.get('Location', ''))
+            yield 'Website: {0}'.format(user.get('Website', ''))
+            yield 'Avatar: {0}'.format(user.get('Avatar', ''))
+            yield 'Banner: {0}'.format(user.get('Banner', ''))
+            yield 'Joined: {0}'.format(user.get('Joined', ''))
+            yield 'Birthday: {0}'.format(user.get('Birthday', ''))
+            yield 'HashTags: {0}'.format(user.get('HashTags', ''))
+            yield 'PinnedMessage: {0}'.format(user.get('PinnedMessage', '0'))
+            # ExtraFields body
+            yield 'ExtraFields:'
+            yield '--- Start ExtraFields Body ---'
+            for line in user.get('ExtraFields', '').splitlines():
+                yield line
+            yield '--- End ExtraFields Body ---'
+            # Bio body
+            yield 'Bio:'
+            yield '--- Start Bio Body ---'
+            for line in user.get('Bio', '').splitlines():
+                yield line
+            yield '--- End Bio Body ---'
+            # Signature body
+            yield 'Signature:'
+            yield '--- Start Signature Body ---'
+            for line in user.get('Signature', '').splitlines():
+                yield line
+            yield '--- End Signature Body ---'
+            yield '--- End User Info ---'
+            yield ''
+        yield '--- End User List ---'
+        yield ''
+
+    # Categorization list
+    if service.get('Categorization'):
+        cat = service['Categorization']
+        yield '--- Start Categorization List ---'
+        yield 'Categories: {0}'.format(', '.join(cat.get('Categories', [])))
+        yield 'Forums: {0}'.format(', '.join(cat.get('Forums', [])))
+        yield '--- End Categorization List ---'
+        yield ''
+
+    # Detailed categories
+    for cat in service.get('Categories', []):
+        yield '--- Start Category List ---'
+        yield 'Kind: {0}, {1}'.format(cat.get('Type', ''), cat.get('Level', ''))
+        yield 'ID: {0}'.format(cat.get('ID', '0'))
+        yield 'InSub: {0}'.format(cat.get('InSub', '0'))
+        yield 'Headline: {0}'.format(cat.get('Headline', ''))
+        yield 'Description:'
+        yield '--- Start Description Body ---'
+        for line in cat.get('Description', '').splitlines():
+            yield line
+        yield '--- End Description Body ---'
+        yield '--- End Category List ---'
+        yield ''
+
+    # Message list
+    threads = service.get('MessageThreads', [])
+    if threads:
+        yield '--- Start Message List ---'
+        if service.get('Interactions'):
+            yield 'Interactions: {0}'.format(', '.join(service['Interactions']))
+        if service.get('Status'):
+            yield 'Status: {0}'.format(', '.join(service['Status']))
+        yield ''
+
+        for thread in threads:
+            yield '--- Start Message Thread ---'
+            yield 'Thread: {0}'.format(thread.get('Thread', '0'))
+            yield 'Title: {0}'.format(thread.get('Title', ''))
+            yield 'Type: {0}'.format(thread.get('Type', ''))
+            yield 'State: {0}'.format(thread.get('State', ''))
+            yield 'Keywords: {0}'.format(thread.get('Keywords', ''))
+            yield 'Category: {0}'.format(', '.join(thread.get('Category', [])))
+            yield 'Forum: {0}'.format(', '.join(thread.get('Forum', [])))
+            yield ''
+
+            for msg in thread.get('Messages', []):
+                yield '--- Start Message Post ---'
+                yield 'Author: {0}'.format(msg.get('Author', ''))
+                yield 'Author ID: {0}'.format(msg.get('AuthorID', '0'))
+                yield 'Time: {0}'.format(msg.get('Time', ''))
+                yield 'Date: {0}'.format(msg.get('Date', ''))
+                yield 'EditTime: {0}'.format(msg.get('EditTime', ''))
+                yield 'EditDate: {0}'.format(msg.get('EditDate', ''))
+                yield 'EditAuthor: {0}'.format(msg.get('EditAuthor', ''))
+                yield 'EditAuthorID: {0}'.format(msg.get('EditAuthorID', '0'))
+                yield 'SubType: {0}'.format(msg.get('SubType', ''))
+                yield 'SubTitle: {0}'.format(msg.get('SubTitle', ''))
+                yield 'Tags: {0}'.format(msg.get('Tags', ''))
+                yield 'Post: {0}'.format(msg.get('Post', '0'))
+                yield 'PinnedID: {0}'.format(msg.get('PinnedID', '0'))
+                yield 'Nested: {0}'.format(msg.get('Nested', '0'))
+                # Message body
+                yield 'Message:'
+                yield '--- Start Message Body ---'
+                for line in msg.get('Message', '').splitlines():
+                    yield line
+                yield '--- End Message Body ---'
+
+                # Polls
+                if 'Polls' in msg and msg['Polls']:
+                    yield 'Polls:'
+                    yield '--- Start Poll List ---'
+                    for poll in msg['Polls']:
+                        yield '--- Start Poll Body ---'
+                        yield 'Num: {0}'.format(poll.get('Num', '0'))
+                        yield 'Question: {0}'.format(poll.get('Question', ''))
+                        yield 'Answers: {0}'.format(', '.join(poll.get('Answers', [])))
+                        yield 'Results: {0}'.format(', '.join(str(r) for r in poll.get('Results', [])))
+                        yield 'Percentage: {0}'.format(', '.join('{:.1f}'.format(float(p)) for p in poll.get('Percentage', [])))
+                        yield 'Votes: {0}'.format(poll.get('Votes', '0'))
+                        yield '--- End Poll Body ---'
+                    yield '--- End Poll List ---'
+                yield '--- End Message Post ---'
+                yield ''
+
+            yield '--- End Message Thread ---'
+            yield ''
+
+        yield '--- End Message List ---'
+        yield ''
+
+    # Close service
+    yield '--- End Archive Service ---'
+    yield ''
+
 def services_to_string(services, line_ending='lf'):
     """
     Serialize services into the archive text format, preserving all markers and multi-line bodies.
     Supports both LF and CRLF line endings.
     """
-    output = []
-
-    for service in services:
-        # Service wrapper
-        output.append('--- Start Archive Service ---')
-        output.append('Entry: {0}'.format(service.get('Entry', '')))
-        output.append('Service: {0}'.format(service.get('Service', '')))
-        output.append('ServiceType: {0}'.format(service.get('ServiceType', '')))
-        output.append('ServiceLocation: {0}'.format(service.get('ServiceLocation', '')))
-        output.append('TimeZone: {0}'.format(service.get('TimeZone', 'UTC')))
-
-        # Info section
-        if 'Info' in service:
-            output.append('Info:')
-            output.append('--- Start Info Body ---')
-            for line in service['Info'].splitlines():
-                output.append(line)
-            output.append('--- End Info Body ---')
-            output.append('')
-
-        # User list
-        users = service.get('Users', {})
-        if users:
-            output.append('--- Start User List ---')
-            for uid, user in users.items():
-                output.append('--- Start User Info ---')
-                output.append('User: {0}'.format(uid))
-                output.append('Name: {0}'.format(user.get('Name', '')))
-                output.append('Handle: {0}'.format(user.get('Handle', '')))
-                output.append('Email: {0}'.format(user.get('Email', '')))
-                output.append('Phone: {0}'.format(user.get('Phone', '')))
-                output.append('Location: {0}'.format(user.get('Location', '')))
-                output.append('Website: {0}'.format(user.get('Website', '')))
-                output.append('Avatar: {0}'.format(user.get('Avatar', '')))
-                output.append('Banner: {0}'.format(user.get('Banner', '')))
-                output.append('Joined: {0}'.format(user.get('Joined', '')))
-                output.append('Birthday: {0}'.format(user.get('Birthday', '')))
-                output.append('HashTags: {0}'.format(user.get('HashTags', '')))
-                output.append('PinnedMessage: {0}'.format(user.get('PinnedMessage', '0')))
-                # ExtraFields body
-                output.append('ExtraFields:')
-                output.append('--- Start ExtraFields Body ---')
-                for line in user.get('ExtraFields', '').splitlines():
-                    output.append(line)
-                output.append('--- End ExtraFields Body ---')
-                # Bio body
-                output.append('Bio:')
-                output.append('--- Start Bio Body ---')
-                for line in user.get('Bio', '').splitlines():
-                    output.append(line)
-                output.append('--- End Bio Body ---')
-                # Signature body
-                output.append('Signature:')
-                output.append('--- Start Signature Body ---')
-                for line in user.get('Signature', '').splitlines():
-                    output.append(line)
-                output.append('--- End Signature Body ---')
-                output.append('--- End User Info ---')
-                output.append('')
-            output.append('--- End User List ---')
-            output.append('')
-
-        # Categorization list
-        if service.get('Categorization'):
-            cat = service['Categorization']
-            output.append('--- Start Categorization List ---')
-            output.append('Categories: {0}'.format(', '.join(cat.get('Categories', []))))
-            output.append('Forums: {0}'.format(', '.join(cat.get('Forums', []))))
-            output.append('--- End Categorization List ---')
-            output.append('')
-
-        # Detailed categories
-        for cat in service.get('Categories', []):
-            output.append('--- Start Category List ---')
-            output.append('Kind: {0}, {1}'.format(cat.get('Type', ''), cat.get('Level', '')))
-            output.append('ID: {0}'.format(cat.get('ID', '0')))
-            output.append('InSub: {0}'.format(cat.get('InSub', '0')))
-            output.append('Headline: {0}'.format(cat.get('Headline', '')))
-            output.append('Description:')
-            output.append('--- Start Description Body ---')
-            for line in cat.get('Description', '').splitlines():
-                output.append(line)
-            output.append('--- End Description Body ---')
-            output.append('--- End Category List ---')
-            output.append('')
-
-        # Message list
-        threads = service.get('MessageThreads', [])
-        if threads:
-            output.append('--- Start Message List ---')
-            if service.get('Interactions'):
-                output.append('Interactions: {0}'.format(', '.join(service['Interactions'])))
-            if service.get('Status'):
-                output.append('Status: {0}'.format(', '.join(service['Status'])))
-            output.append('')
-
-            for thread in threads:
-                output.append('--- Start Message Thread ---')
-                output.append('Thread: {0}'.format(thread.get('Thread', '0')))
-                output.append('Title: {0}'.format(thread.get('Title', '')))
-                output.append('Type: {0}'.format(thread.get('Type', '')))
-                output.append('State: {0}'.format(thread.get('State', '')))
-                output.append('Keywords: {0}'.format(thread.get('Keywords', '')))
-                output.append('Category: {0}'.format(', '.join(thread.get('Category', []))))
-                output.append('Forum: {0}'.format(', '.join(thread.get('Forum', []))))
-                output.append('')
-
-                for msg in thread.get('Messages', []):
-                    output.append('--- Start Message Post ---')
-                    output.append('Author: {0}'.format(msg.get('Author', '')))
-                    output.append('Author ID: {0}'.format(msg.get('AuthorID', '0')))
-                    output.append('Time: {0}'.format(msg.get('Time', '')))
-                    output.append('Date: {0}'.format(msg.get('Date', '')))
-                    output.append('EditTime: {0}'.format(msg.get('EditTime', '')))
-                    output.append('EditDate: {0}'.format(msg.get('EditDate', '')))
-                    output.append('EditAuthor: {0}'.format(msg.get('EditAuthor', '')))
-                    output.append('EditAuthorID: {0}'.format(msg.get('EditAuthorID', '0')))
-                    output.append('SubType: {0}'.format(msg.get('SubType', '')))
-                    output.append('SubTitle: {0}'.format(msg.get('SubTitle', '')))
-                    output.append('Tags: {0}'.format(msg.get('Tags', '')))
-                    output.append('Post: {0}'.format(msg.get('Post', '0')))
-                    output.append('PinnedID: {0}'.format(msg.get('PinnedID', '0')))
-                    output.append('Nested: {0}'.format(msg.get('Nested', '0')))
-                    # Message body
-                    output.append('Message:')
-                    output.append('--- Start Message Body ---')
-                    for line in msg.get('Message', '').splitlines():
-                        output.append(line)
-                    output.append('--- End Message Body ---')
-
-                    # Polls
-                    if 'Polls' in msg and msg['Polls']:
-                        output.append('Polls:')
-                        output.append('--- Start Poll List ---')
-                        for poll in msg['Polls']:
-                            output.append('--- Start Poll Body ---')
-                            output.append('Num: {0}'.format(poll.get('Num', '0')))
-                            output.append('Question: {0}'.format(poll.get('Question', '')))
-                            output.append('Answers: {0}'.format(', '.join(poll.get('Answers', []))))
-                            output.append('Results: {0}'.format(', '.join(str(r) for r in poll.get('Results', []))))
-                            output.append('Percentage: {0}'.format(', '.join('{:.1f}'.format(float(p)) for p in poll.get('Percentage', []))))
-                            output.append('Votes: {0}'.format(poll.get('Votes', '0')))
-                            output.append('--- End Poll Body ---')
-                        output.append('--- End Poll List ---')
-                    output.append('--- End Message Post ---')
-                    output.append('')
-
-                output.append('--- End Message Thread ---')
-                output.append('')
-
-            output.append('--- End Message List ---')
-            output.append('')
-
-        # Close service
-        output.append('--- End Archive Service ---')
-        output.append('')
-
-    data = '\n'.join(output)
+    data = '\n'.join(line for service in services for line in _service_lines(service))
     if line_ending.lower() == 'crlf':
         data = data.replace('\n', '\r\n')
     elif line_ending.lower() == 'cr':
@@ -2385,12 +5606,73 @@ def services_to_string_from_file(filename, line_ending='lf'):
     services = parse_file(filename, False, False);
     return services_to_string(services, line_ending)
 
+_LINE_ENDINGS = {'lf': '\n', 'crlf': '\r\n', 'cr': '\r'}
+
+class _ChunkedWriter(object):
+    """
+    Gathers text for an open file and writes it in chunks of about
+    chunk_size characters.  Text files get str; binary ones (plain or
+    compressed) UTF-8 bytes.
+    """
+
+    def __init__(self, fileobj, chunk_size=64 * 1024):
+        self.fileobj = fileobj
+        self.binary = not (isinstance(fileobj, io.TextIOBase) or getattr(fileobj, '_text_mode', False))
+        self.chunk_size = chunk_size
+        self.chunk = []
+        self.size = 0
+
+    def write(self, text):
+        self.chunk.append(text)
+        self.size += len(text)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def write_bytes(self, data):
+        """ Write UTF-8 encoded text, such as orjson output. """
+        if self.binary:
+            self.flush()
+            self.fileobj.write(data)
+        else:
+            self.write(data.decode('utf-8'))
+
+    def flush(self):
+        if self.chunk:
+            data = ''.join(self.chunk)
+            self.fileobj.write(data.encode('utf-8') if self.binary else data)
+            self.chunk = []
+            self.size = 0
+
+def write_services(services, fileobj, line_ending='lf', chunk_size=64 * 1024):
+    """
+    Write services in the archive text format to an open file, producing
+    the same text as services_to_string without ever holding all of it:
+    lines are gathered into chunks of about chunk_size characters and
+    written as they fill.  services may be any iterable, such as
+    iter_services(), so archives can be rewritten one service at a time.
+    Text files get str; binary ones (plain or compressed) UTF-8 bytes.
+    """
+    newline = _LINE_ENDINGS.get(line_ending.lower(), '\n')
+    writer = _ChunkedWriter(fileobj, chunk_size)
+    write = writer.write
+    separator = ''
+    for service in services:
+        for line in _service_lines(service):
+            if newline != '\n':
+                line = line.replace('\n', newline)
+            write(separator)
+            write(line)
+            separator = newline
+    writer.flush()
+
 def save_services_to_file(services, filename, line_ending='lf'):
     """
     Save services to a file, inferring compression by extension (Python 2/3 compatible).
+    The archive is streamed through write_services, so services may also be
+    an iterator.
     """
-    data = services_to_string(services, line_ending)
-    save_compressed_file(data, filename)
+    with _ReplacingOutput(filename) as file:
+        write_services(services, file, line_ending)
 
 def save_services_to_file_from_file(filename, outfilename, line_ending='lf'):
     services = parse_file(filename, False, False);
@@ -2399,19 +5681,19 @@ def save_services_to_file_from_file(filename, outfilename, line_ending='lf'):
 def build_xml_element(parent, key, value):
     singular = key[:-1] if key.endswith('s') else 'Item'
 
-    if isinstance(value, list):
+    if isinstance(value, (list, tuple)):
         container = ET.SubElement(parent, unicode_type(key))
         for item in value:
             item_elem = ET.SubElement(container, unicode_type(singular))
-            if isinstance(item, dict):
+            if isinstance(item, Mapping):
                 for subk, subv in item.items():
                     build_xml_element(item_elem, subk, subv)
             else:
                 item_elem.text = unicode_type(item)
 
-    elif isinstance(value, dict):
+    elif isinstance(value, Mapping):
         # Detect dicts that look like ID-keyed records
-        if all(isinstance(k, (int, str)) and isinstance(v, dict) for k, v in value.items()):
+        if all(isinstance(k, (int, str)) and isinstance(v, Mapping) for k, v in value.items()):
             container = ET.SubElement(parent, unicode_type(key))
             for k, v in value.items():
                 item_elem = ET.SubElement(container, unicode_type(singular))
@@ -2428,50 +5710,143 @@ def build_xml_element(parent, key, value):
             elem.text = unicode_type(value)
 
 
-def to_xml(services):
-    root = ET.Element("Services")
-    for service in services:
-        service_elem = ET.SubElement(root, "Service")
-        for key, value in service.items():
-            build_xml_element(service_elem, key, value)
-
-    xml_bytes = ET.tostring(root, encoding='utf-8')
-    xml_str = xml_bytes.decode('utf-8', errors='replace')
+# Characters XML 1.0 does not allow in text, even as character references.
+_XML_INVALID_CHARS = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+def _xml_text(value):
+    """ Escape the text of an element as toprettyxml did for to_xml. """
+    text = unicode_type(value)
+    if '\r' in text:
+        # XML parsers read every line break as '\n'
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    if _XML_INVALID_CHARS.search(text):
+        raise ValueError("Text not allowed in XML: {0!r}".format(text[:80]))
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('"', '&quot;').replace('>', '&gt;')
+
+def _xml_leaf(pad, tag, value):
+    text = _xml_text(value) if value is not None else ''
+    if text:
+        return '{0}<{1}>{2}</{1}>\n'.format(pad, tag, text)
+    return '{0}<{1}/>\n'.format(pad, tag)
+
+def _xml_fields(pad, fields):
+    for key, value in fields:
+        for line in _xml_lines(pad, key, value):
+            yield line
+
+def _xml_container(pad, tag, children):
+    """ An element holding the lines of children, or an empty one when there are none. """
+    first = True
+    for line in children:
+        if first:
+            yield '{0}<{1}>\n'.format(pad, tag)
+            first = False
+        yield line
+    yield '{0}<{1}/>\n'.format(pad, tag) if first else '{0}</{1}>\n'.format(pad, tag)
+
+def _xml_lines(pad, key, value):
+    """ The indented lines of the element build_xml_element makes for key and value. """
+    tag = unicode_type(key)
+    singular = key[:-1] if key.endswith('s') else 'Item'
+    inner = pad + '  '
+    if isinstance(value, (list, tuple)):
+        return _xml_container(pad, tag, _xml_list_items(inner, singular, value))
+    elif isinstance(value, Mapping):
+        if all(isinstance(k, (int, str)) and isinstance(v, Mapping) for k, v in value.items()):
+            return _xml_container(pad, tag, _xml_id_items(inner, singular, value))
+        return _xml_container(pad, tag, _xml_fields(inner, value.items()))
+    return iter((_xml_leaf(pad, tag, value),))
+
+def _xml_list_items(pad, singular, items):
+    for item in items:
+        if isinstance(item, Mapping):
+            for line in _xml_container(pad, singular, _xml_fields(pad + '  ', item.items())):
+                yield line
+        else:
+            yield _xml_leaf(pad, singular, unicode_type(item))
+
+def _xml_id_items(pad, singular, records):
+    inner = pad + '  '
+    for k, v in records.items():
+        yield '{0}<{1}>\n'.format(pad, singular)
+        yield _xml_leaf(inner, 'ID', k)
+        for line in _xml_fields(inner, v.items()):
+            yield line
+        yield '{0}</{1}>\n'.format(pad, singular)
+
+def write_xml(services, fileobj, chunk_size=64 * 1024):
+    """
+    Write services as indented XML to an open (text, binary or compressed)
+    file, one element per line as they are generated, in the layout
+    build_xml_element gives.  services may be any iterable.
+    """
+    writer = _ChunkedWriter(fileobj, chunk_size)
+    write = writer.write
+    write('<?xml version="1.0" ?>\n')
+    services_lines = (line for service in services
+                      for line in _xml_container('  ', 'Service', _xml_fields('    ', service.items())))
+    for line in _xml_container('', 'Services', services_lines):
+        write(line)
+    writer.flush()
 
-    try:
-        return minidom.parseString(xml_str).toprettyxml(indent="  ")
-    except Exception as e:
-        print("❌ XML formatting failed. Here's raw XML before pretty-printing:")
-        print(xml_str[:500])
-        raise e
+def to_xml(services):
+    """ Convert services to an indented XML string, see write_xml. """
+    output = StringIO()
+    write_xml(services, output)
+    return output.getvalue()
+
+def _service_from_xml(service_elem):
+    """ Convert one <Service> element back to a service dict. """
+    service = {}
+    for child in service_elem:
+        if list(child):
+            values = []
+            for sub in child:
+                entry = {}
+                for field in sub:
+                    entry[field.tag] = field.text
+                if "ID" in entry:
+                    values.append((entry.pop("ID"), entry))
+                else:
+                    values.append(entry)
+            # Store as dict if we had IDs
+            if all(isinstance(v, tuple) for v in values):
+                service[child.tag] = {int(k): v for k, v in values}
+            else:
+                service[child.tag] = values
+        else:
+            service[child.tag] = child.text
+    return service
 
 def from_xml(xml_str):
-    services = []
     root = ET.fromstring(xml_str)
+    return [_service_from_xml(service_elem) for service_elem in root.findall('Service')]
 
-    for service_elem in root.findall('Service'):
-        service = {}
-        for child in service_elem:
-            if list(child):
-                values = []
-                for sub in child:
-                    entry = {}
-                    for field in sub:
-                        entry[field.tag] = field.text
-                    if "ID" in entry:
-                        values.append((entry.pop("ID"), entry))
-                    else:
-                        values.append(entry)
-                # Store as dict if we had IDs
-                if all(isinstance(v, tuple) for v in values):
-                    service[child.tag] = {int(k): v for k, v in values}
-                else:
-                    service[child.tag] = values
-            else:
-                service[child.tag] = child.text
-        services.append(service)
-
-    return services
+def iter_services_from_xml(source):
+    """
+    Yield the services of an XML export one at a time, as from_xml would
+    return them.  source is a (possibly compressed) filename or an open file.
+    The document is read with ET.iterparse and every <Service> element is
+    cleared once converted, so memory stays proportional to one service.
+    """
+    if isinstance(source, basestring):
+        with open_archive_input(source) as file:
+            for service in iter_services_from_xml(file):
+                yield service
+        return
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 1:
+                root = elem
+            continue
+        depth -= 1
+        if depth == 1 and elem.tag == 'Service':
+            yield _service_from_xml(elem)
+            # Drop the converted service, and anything before it, from the root
+            root.clear()
 
 def parse_xml_element(element):
     """ Helper function to parse XML elements into a dictionary """
@@ -2484,26 +5859,30 @@ def parse_xml_element(element):
     return result
 
 def load_from_xml_file(xml_filename):
-    """ Load the services data structure from an XML file """
-    with open_compressed_file(xml_filename) as file:
-        xml_str = file.read()
-    return from_xml(xml_str)
+    """
+    Load the services data structure from an XML file, converting it one
+    service at a time with iter_services_from_xml.
+    """
+    return list(iter_services_from_xml(xml_filename))
 
 def save_to_xml_file(services, xml_filename):
-    """ Save the services data structure to an XML file """
-    xml_str = to_xml(services)
-    save_compressed_file(xml_str, xml_filename)
+    """
+    Save the services data structure to an XML file, streamed through
+    write_xml into the (possibly compressed) file.
+    """
+    with _ReplacingOutput(xml_filename) as file:
+        write_xml(services, file)
 
 def build_sgml_lines(key, value, indent=2):
     lines = []
     pad = ' ' * indent
     singular = key[:-1] if key.endswith('s') else key
 
-    if isinstance(value, list):
+    if isinstance(value, (list, tuple)):
         lines.append('{0}<{1}>'.format(pad, key))
         for item in value:
             lines.append('{0}  <{1}>'.format(pad, singular))
-            if isinstance(item, dict):
+            if isinstance(item, Mapping):
                 for k, v in item.items():
                     lines.extend(build_sgml_lines(k, v, indent + 4))
             else:
@@ -2511,9 +5890,9 @@ def build_sgml_lines(key, value, indent=2):
             lines.append('{0}  </{1}>'.format(pad, singular))
         lines.append('{0}</{1}>'.format(pad, key))
 
-    elif isinstance(value, dict):
+    elif isinstance(value, Mapping):
         # ID-keyed record map
-        if all(isinstance(k, (int, str)) and isinstance(v, dict) for k, v in value.items()):
+        if all(isinstance(k, (int, str)) and isinstance(v, Mapping) for k, v in value.items()):
             lines.append('{0}<{1}>'.format(pad, key))
             for k, v in value.items():
                 lines.append('{0}  <{1}>'.format(pad, singular))
@@ -2547,14 +5926,25 @@ def to_sgml(services):
 
 class SGMLNode(object):
     """In-memory SGML node for parsing back to dicts."""
+    __slots__ = ('tag', 'children', 'parts')
+
     def __init__(self, tag):
         self.tag = tag
         self.children = []
-        self.text = ''
+        self.parts = []
+
+    @property
+    def text(self):
+        return ''.join(self.parts)
 
 
 class ServicesSGMLParser(HTMLParser):
-    """Parse SGML into SGMLNode tree."""
+    """
+    Parse SGML into SGMLNode trees, one service at a time.  Tags keep the
+    case they are written in, text is gathered in a list of chunks per node,
+    and every <Service> directly under <Services> is converted to a dict as
+    soon as it closes and moved to services, instead of staying in the tree.
+    """
     def __init__(self):
         if PY2:
             HTMLParser.__init__(self)
@@ -2562,6 +5952,7 @@ class ServicesSGMLParser(HTMLParser):
             super(ServicesSGMLParser, self).__init__()
         self.root = None
         self.stack = []
+        self.services = []
 
     def handle_decl(self, decl):
         pass
@@ -2571,20 +5962,24 @@ class ServicesSGMLParser(HTMLParser):
             super(ServicesSGMLParser, self).handle_pi(data)
 
     def handle_starttag(self, tag, attrs):
-        node = SGMLNode(tag)
+        # HTMLParser lowercases tag names, take them from the source instead
+        written = self.get_starttag_text()[1:len(tag) + 1]
+        node = SGMLNode(written if written.lower() == tag else tag)
         if not self.stack:
             self.root = node
-        else:
+        elif len(self.stack) > 1 or node.tag != 'Service':
             self.stack[-1].children.append(node)
         self.stack.append(node)
 
     def handle_endtag(self, tag):
         if self.stack:
-            self.stack.pop()
+            node = self.stack.pop()
+            if len(self.stack) == 1 and node.tag == 'Service' and self.root.tag == 'Services':
+                self.services.append(sgml_service(node))
 
     def handle_data(self, data):
         if self.stack:
-            self.stack[-1].text += data
+            self.stack[-1].parts.append(data)
 
 
 def parse_sgml_element(node):
@@ -2612,44 +6007,59 @@ def parse_sgml_element(node):
     return result
 
 
-def from_sgml(sgml_str):
+def sgml_service(svc_node):
+    """Convert the SGMLNode of a <Service> into a service dict."""
+    service = {}
+    for child in svc_node.children:
+        if child.children:
+            parsed_list = []
+            for item in child.children:
+                parsed = parse_sgml_element(item)
+                parsed_list.append(parsed)
+            # Check for ID and convert to dict
+            if all("ID" in x for x in parsed_list):
+                service[child.tag] = {int(x.pop("ID")): x for x in parsed_list}
+            else:
+                service[child.tag] = parsed_list
+        else:
+            service[child.tag] = child.text.strip()
+    return service
+
+
+def iter_services_from_sgml(fileobj, chunk_size=64 * 1024):
+    """
+    Yield the services of an SGML export one at a time, each as soon as its
+    </Service> is read.  fileobj is an open text or binary (UTF-8) file, or
+    the name of a (possibly compressed) SGML file.
+    """
+    if isinstance(fileobj, basestring):
+        with open_archive_input(fileobj) as file:
+            for service in iter_services_from_sgml(file, chunk_size):
+                yield service
+        return
     parser = ServicesSGMLParser()
-    parser.feed(sgml_str)
-    parser.close()
+    pending = parser.services
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        chunk = fileobj.read(chunk_size)
+        data = decoder.decode(chunk, not chunk) if isinstance(chunk, bytes) else chunk
+        if data:
+            parser.feed(data)
+        if not chunk:
+            parser.close()
+        for service in pending:
+            yield service
+        del pending[:]
+        if not chunk:
+            break
 
-    services = []
-    root = parser.root
-    if not root or root.tag != 'Services':
-        return services
 
-    for svc_node in root.children:
-        if svc_node.tag != 'Service':
-            continue
-        service = {}
-        for child in svc_node.children:
-            if child.children:
-                parsed_list = []
-                for item in child.children:
-                    parsed = parse_sgml_element(item)
-                    parsed_list.append(parsed)
-                # Check for ID and convert to dict
-                if all("ID" in x for x in parsed_list):
-                    service[child.tag] = {int(x.pop("ID")): x for x in parsed_list}
-                else:
-                    service[child.tag] = parsed_list
-            else:
-                service[child.tag] = child.text.strip()
-        services.append(service)
-    return services
+def from_sgml(sgml_str):
+    return list(iter_services_from_sgml(StringIO(sgml_str)))
 
 def load_from_sgml_file(sgml_filename):
     """Load the services data structure from a (possibly compressed) SGML file."""
-    with open_compressed_file(sgml_filename) as f:
-        sgml_str = f.read()
-    # if bytes, decode
-    if isinstance(sgml_str, bytes):
-        sgml_str = sgml_str.decode('utf-8')
-    return from_sgml(sgml_str)
+    return list(iter_services_from_sgml(sgml_filename))
 
 
 def save_to_sgml_file(services, sgml_filename):
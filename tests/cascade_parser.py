@@ -0,0 +1,665 @@
+# -*- coding: utf-8 -*-
+"""
+The if/elif cascade parse_lines that pytextarchive shipped before the table
+driven ArchiveEventReader, kept verbatim (with the helpers it calls) as the
+reference the new parser is compared with by test_table_parser.py and timed
+against by benchmark_parse.py.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals, generators, with_statement, nested_scopes
+import io
+
+
+def without_post_ids(services):
+    """ Drop the 'post_ids' bookkeeping this parser leaked into every thread. """
+    if isinstance(services, list):
+        for service in services:
+            for thread in service.get('MessageThreads', []):
+                thread.pop('post_ids', None)
+    return services
+
+
+def parse_line(line):
+    """ Parse a line in the format 'var: value' and return the key and value. """
+    parts = line.split(":", 1)
+    if len(parts) == 2:
+        return parts[0].strip(), parts[1].strip()
+    return None, None
+
+def validate_non_negative_integer(value, key, line_number):
+    """ Utility to validate that a given value is a non-negative integer """
+    try:
+        int_value = int(value)
+        if int_value < 0:
+            raise ValueError("Negative value '{0}' for key '{1}' on line {2}".format(value, key, line_number))
+        return int_value
+    except ValueError as e:
+        raise ValueError("Invalid integer '{0}' for key '{1}' on line {2}".format(value, key, line_number))
+
+
+def parse_file(filename, validate_only=False, verbose=False):
+    with io.open(filename, encoding='utf-8') as file:
+        lines = file.readlines()
+    return parse_lines(lines, validate_only, verbose)
+
+
+def parse_lines(lines, validate_only=False, verbose=False):
+    services = []
+    current_service = None
+    in_section = {
+        'user_list': False,
+        'message_list': False,
+        'message_thread': False,
+        'user_info': False,
+        'message_post': False,
+        'extrafields_body': False,
+        'bio_body': False,
+        'signature_body': False,
+        'message_body': False,
+        'comment_section': False,
+        'include_service': False,
+        'include_users': False,
+        'include_messages': False,
+        'category_list': False,
+        'description_body': False,
+        'include_categories': False,
+        'categorization_list': False,
+        'info_body': False,
+        'poll_list': False,
+        'poll_body': False,
+    }
+    include_files = []
+    user_id = None
+    current_bio = None
+    current_message = None
+    current_thread = None
+    current_category = None
+    current_info = None
+    current_poll = None
+    current_polls = []
+    categorization_values = {'Categories': [], 'Forums': []}
+    category_ids = {'Categories': [], 'Forums': []}
+    post_id = 1
+
+    def parse_include_files(file_list):
+        included_services = []
+        for include_file in file_list:
+            included_services.extend(parse_file(include_file, validate_only, verbose))
+        return included_services
+
+    def parse_include_users(file_list):
+        users = {}
+        for include_file in file_list:
+            included_users = parse_file(include_file, validate_only, verbose)
+            for service in included_users:
+                users.update(service['Users'])
+        return users
+
+    def parse_include_messages(file_list):
+        messages = []
+        for include_file in file_list:
+            included_messages = parse_file(include_file, validate_only, verbose)
+            for service in included_messages:
+                messages.extend(service['MessageThreads'])
+        return messages
+
+    def parse_include_categories(file_list):
+        categories = []
+        for include_file in file_list:
+            included_categories = parse_file(include_file, validate_only, verbose)
+            for service in included_categories:
+                categories.extend(service['Categories'])
+        return categories
+
+    try:
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if line == "--- Include Service Start ---":
+                in_section['include_service'] = True
+                include_files = []
+                if verbose:
+                    print("Line {0}: {1} (Starting include service section)".format(line_number, line))
+                continue
+            elif line == "--- Include Service End ---":
+                in_section['include_service'] = False
+                if verbose:
+                    print("Line {0}: {1} (Ending include service section)".format(line_number, line))
+                services.extend(parse_include_files(include_files))
+                continue
+            elif in_section['include_service']:
+                include_files.append(line)
+                if verbose:
+                    print("Line {0}: {1} (Including file for service)".format(line_number, line))
+                continue
+            elif line == "--- Include Users Start ---":
+                in_section['include_users'] = True
+                include_files = []
+                if verbose:
+                    print("Line {0}: {1} (Starting include users section)".format(line_number, line))
+                continue
+            elif line == "--- Include Users End ---":
+                in_section['include_users'] = False
+                if verbose:
+                    print("Line {0}: {1} (Ending include users section)".format(line_number, line))
+                if current_service:
+                    current_service['Users'].update(parse_include_users(include_files))
+                continue
+            elif in_section['include_users']:
+                include_files.append(line)
+                if verbose:
+                    print("Line {0}: {1} (Including file for users)".format(line_number, line))
+                continue
+            elif line == "--- Include Messages Start ---":
+                in_section['include_messages'] = True
+                include_files = []
+                if verbose:
+                    print("Line {0}: {1} (Starting include messages section)".format(line_number, line))
+                continue
+            elif line == "--- Include Messages End ---":
+                in_section['include_messages'] = False
+                if verbose:
+                    print("Line {0}: {1} (Ending include messages section)".format(line_number, line))
+                if current_service:
+                    current_service['MessageThreads'].extend(parse_include_messages(include_files))
+                continue
+            elif in_section['include_messages']:
+                include_files.append(line)
+                if verbose:
+                    print("Line {0}: {1} (Including file for messages)".format(line_number, line))
+                continue
+            elif line == "--- Include Categories Start ---":
+                in_section['include_categories'] = True
+                include_files = []
+                if verbose:
+                    print("Line {0}: {1} (Starting include categories section)".format(line_number, line))
+                continue
+            elif line == "--- Include Categories End ---":
+                in_section['include_categories'] = False
+                if verbose:
+                    print("Line {0}: {1} (Ending include categories section)".format(line_number, line))
+                if current_service:
+                    current_service['Categories'].extend(parse_include_categories(include_files))
+                    for category in current_service['Categories']:
+                        kind_split = category.get('Kind', '').split(",")
+                        category['Type'] = kind_split[0].strip() if len(kind_split) > 0 else ""
+                        category['Level'] = kind_split[1].strip() if len(kind_split) > 1 else ""
+                        category_ids[category['Type']].append(category['ID'])
+                continue
+            elif in_section['include_categories']:
+                include_files.append(line)
+                if verbose:
+                    print("Line {0}: {1} (Including file for categories)".format(line_number, line))
+                continue
+            elif line == "--- Start Archive Service ---":
+                current_service = {'Users': {}, 'MessageThreads': [], 'Categories': [], 'Interactions': [], 'Categorization': {}, 'Info': ''}
+                if verbose:
+                    print("Line {0}: {1} (Starting new archive service)".format(line_number, line))
+                continue
+            elif line == "--- End Archive Service ---":
+                services.append(current_service)
+                current_service = None
+                if verbose:
+                    print("Line {0}: {1} (Ending archive service)".format(line_number, line))
+                continue
+            elif line == "--- Start Comment Section ---":
+                in_section['comment_section'] = True
+                if verbose:
+                    print("Line {0}: {1} (Starting comment section)".format(line_number, line))
+                continue
+            elif line == "--- End Comment Section ---":
+                in_section['comment_section'] = False
+                if verbose:
+                    print("Line {0}: {1} (Ending comment section)".format(line_number, line))
+                continue
+            elif in_section['comment_section']:
+                if verbose:
+                    print("Line {0}: {1} (Comment)".format(line_number, line))
+                continue
+            elif line == "--- Start Category List ---":
+                in_section['category_list'] = True
+                current_category = {}
+                if verbose:
+                    print("Line {0}: {1} (Starting category list)".format(line_number, line))
+                continue
+            elif line == "--- End Category List ---":
+                in_section['category_list'] = False
+                if current_category:
+                    kind_split = current_category.get('Kind', '').split(",")
+                    current_category['Type'] = kind_split[0].strip() if len(kind_split) > 0 else ""
+                    current_category['Level'] = kind_split[1].strip() if len(kind_split) > 1 else ""
+                    if current_category['Type'] not in categorization_values:
+                        raise ValueError("Invalid 'Type' value '{0}' on line {1}. Expected one of {2}.".format(current_category['Type'], line_number, categorization_values.keys()))
+                    if current_category['InSub'] != 0 and current_category['InSub'] not in category_ids[current_category['Type']]:
+                        raise ValueError("InSub value '{0}' on line {1} does not match any existing ID values.".format(current_category['InSub'], line_number))
+                    current_service['Categories'].append(current_category)
+                    category_ids[current_category['Type']].append(current_category['ID'])
+                current_category = None
+                if verbose:
+                    print("Line {0}: {1} (Ending category list)".format(line_number, line))
+                continue
+            elif line == "--- Start Categorization List ---":
+                in_section['categorization_list'] = True
+                current_service['Categorization'] = {}
+                if verbose:
+                    print("Line {0}: {1} (Starting categorization list)".format(line_number, line))
+                continue
+            elif line == "--- End Categorization List ---":
+                in_section['categorization_list'] = False
+                if verbose:
+                    print("Line {0}: {1} (Ending categorization list)".format(line_number, line))
+                categorization_values = current_service['Categorization']
+                continue
+            elif line == "--- Start Info Body ---":
+                in_section['info_body'] = True
+                if current_service:
+                    current_info = []
+                    if verbose:
+                        print("Line {0}: {1} (Starting info body)".format(line_number, line))
+                continue
+            elif line == "--- End Info Body ---":
+                in_section['info_body'] = False
+                if current_service and current_info is not None:
+                    current_service['Info'] = "\n".join(current_info)
+                    current_info = None
+                    if verbose:
+                        print("Line {0}: {1} (Ending info body)".format(line_number, line))
+                continue
+            elif in_section['info_body']:
+                if current_service and current_info is not None:
+                    current_info.append(line)
+                if verbose:
+                    print("Line {0}: {1}".format(line_number, line))
+                continue
+            elif line == "--- Start Poll List ---":
+                in_section['poll_list'] = True
+                current_polls = []
+                if verbose:
+                    print("Line {0}: {1} (Starting poll list)".format(line_number, line))
+                continue
+            elif line == "--- End Poll List ---":
+                in_section['poll_list'] = False
+                if current_message:
+                    current_message['Polls'] = current_polls
+                if verbose:
+                    print("Line {0}: {1} (Ending poll list)".format(line_number, line))
+                continue
+            elif in_section['poll_list'] and line == "--- Start Poll Body ---":
+                in_section['poll_body'] = True
+                current_poll = {}
+                if verbose:
+                    print("Line {0}: {1} (Starting poll body)".format(line_number, line))
+                continue
+            elif in_section['poll_body'] and line == "--- End Poll Body ---":
+                in_section['poll_body'] = False
+                if current_poll is not None:
+                    current_polls.append(current_poll)
+                    current_poll = None
+                if verbose:
+                    print("Line {0}: {1} (Ending poll body)".format(line_number, line))
+                continue
+            elif in_section['poll_body']:
+                key, value = parse_line(line)
+                if key and current_poll is not None:
+                    if key in ['Answers', 'Results', 'Percentage']:
+                        current_poll[key] = [item.strip() for item in value.split(',')]
+                    else:
+                        current_poll[key] = value
+                continue
+            elif current_service is not None:
+                key, value = parse_line(line)
+                if key == "Entry":
+                    current_service['Entry'] = validate_non_negative_integer(value, "Entry", line_number)
+                elif key == "Service":
+                    current_service['Service'] = value
+                elif key == "ServiceType":
+                    current_service['ServiceType'] = value
+                elif key == "ServiceLocation":
+                    current_service['ServiceLocation'] = value
+                elif key == "TimeZone":
+                    current_service['TimeZone'] = value
+                elif key == "Categories":
+                    current_service['Categorization']['Categories'] = [category.strip() for category in value.split(",")]
+                    if verbose:
+                        print("Line {0}: Categories set to {1}".format(line_number, current_service['Categorization']['Categories']))
+                elif key == "Forums":
+                    current_service['Categorization']['Forums'] = [forum.strip() for forum in value.split(",")]
+                    if verbose:
+                        print("Line {0}: Forums set to {1}".format(line_number, current_service['Categorization']['Forums']))
+                elif line == "--- Start Description Body ---" and in_section['category_list']:
+                    # Begin capturing multi-line category Description
+                    in_section['description_body'] = True
+                    _desc_lines = []
+                    continue
+                elif line == "--- End Description Body ---" and in_section['category_list']:
+                    # Finish the multi-line description
+                    in_section['description_body'] = False
+                    # Join and store
+                    current_category['Description'] = "\n".join(_desc_lines)
+                    del _desc_lines
+                    continue
+                elif in_section['description_body'] and in_section['category_list']:
+                    # Accumulate each body‑line
+                    _desc_lines.append(line)
+                    continue
+                elif in_section['category_list']:
+                    if key == "Kind":
+                        current_category['Kind'] = value
+                    elif key == "ID":
+                        current_category['ID'] = validate_non_negative_integer(value, "ID", line_number)
+                    elif key == "InSub":
+                        current_category['InSub'] = validate_non_negative_integer(value, "InSub", line_number)
+                    elif key == "Headline":
+                        current_category['Headline'] = value
+                    elif key == "Description":
+                        current_category['Description'] = value
+                elif line == "--- Start User List ---":
+                    in_section['user_list'] = True
+                    if verbose:
+                        print("Line {0}: {1} (Starting user list)".format(line_number, line))
+                    continue
+                elif line == "--- End User List ---":
+                    in_section['user_list'] = False
+                    if verbose:
+                        print("Line {0}: {1} (Ending user list)".format(line_number, line))
+                    continue
+                elif line == "--- Start User Info ---":
+                    in_section['user_info'] = True
+                    if verbose:
+                        print("Line {0}: {1} (Starting user info)".format(line_number, line))
+                    continue
+                elif line == "--- End User Info ---":
+                    in_section['user_info'] = False
+                    user_id = None
+                    if verbose:
+                        print("Line {0}: {1} (Ending user info)".format(line_number, line))
+                    continue
+                elif line == "--- Start Message List ---":
+                    in_section['message_list'] = True
+                    if verbose:
+                        print("Line {0}: {1} (Starting message list)".format(line_number, line))
+                    continue
+                elif line == "--- End Message List ---":
+                    in_section['message_list'] = False
+                    if verbose:
+                        print("Line {0}: {1} (Ending message list)".format(line_number, line))
+                    continue
+                elif line == "--- Start Message Thread ---":
+                    in_section['message_thread'] = True
+                    current_thread = {'Title': '', 'Messages': []}
+                    post_id = 1
+                    if verbose:
+                        print("Line {0}: {1} (Starting message thread)".format(line_number, line))
+                    continue
+                elif line == "--- End Message Thread ---":
+                    in_section['message_thread'] = False
+                    current_service['MessageThreads'].append(current_thread)
+                    current_thread = None
+                    if verbose:
+                        print("Line {0}: {1} (Ending message thread)".format(line_number, line))
+                    continue
+                elif line == "--- Start Message Post ---":
+                    in_section['message_post'] = True
+                    current_message = {}
+                    if verbose:
+                        print("Line {0}: {1} (Starting message post)".format(line_number, line))
+                    continue
+                elif line == "--- End Message Post ---":
+                    in_section['message_post'] = False
+                    if current_message:
+                        current_thread['Messages'].append(current_message)
+                    current_message = None
+                    if verbose:
+                        print("Line {0}: {1} (Ending message post)".format(line_number, line))
+                    continue
+                elif in_section['message_list'] and key == "Interactions":
+                    current_service['Interactions'] = [interaction.strip() for interaction in value.split(",")]
+                    if verbose:
+                        print("Line {0}: Interactions set to {1}".format(line_number, current_service['Interactions']))
+                elif in_section['message_list'] and key == "Status":
+                    current_service['Status'] = [status.strip() for status in value.split(",")]
+                    if verbose:
+                        print("Line {0}: Status set to {1}".format(line_number, current_service['Status']))
+                elif key == "Info":
+                    current_info = []
+                    in_section['info_body'] = True
+                    if verbose:
+                        print("Line {0}: {1} (Starting info body)".format(line_number, line))
+                elif in_section['user_list'] and in_section['user_info']:
+                    if key == "User":
+                        user_id = validate_non_negative_integer(value, "User", line_number)
+                        current_service['Users'][user_id] = {'ExtraFields': "", 'Bio': "", 'Signature': ""}
+                        if verbose:
+                            print("Line {0}: User ID set to {1}".format(line_number, user_id))
+                    elif key == "Name":
+                        if user_id is not None:
+                            current_service['Users'][user_id]['Name'] = value
+                            if verbose:
+                                print("Line {0}: Name set to {1}".format(line_number, value))
+                    elif key == "Handle":
+                        if user_id is not None:
+                            current_service['Users'][user_id]['Handle'] = value
+                            if verbose:
+                                print("Line {0}: Handle set to {1}".format(line_number, value))
+                    elif key == "Email":
+                        if user_id is not None:
+                            current_service['Users'][user_id]['Email'] = value
+                            if verbose:
+                                print("Line {0}: Email set to {1}".format(line_number, value))
+                    elif key == "Phone":
+                        if user_id is not None:
+                            current_service['Users'][user_id]['Phone'] = value
+                            if verbose:
+                                print("Line {0}: Phone set to {1}".format(line_number, value))
+                    elif key == "Location":
+                        if user_id is not None:
+                            current_service['Users'][user_id]['Location'] = value
+                            if verbose:
+                                print("Line {0}: Location set to {1}".format(line_number, value))
+                    elif key == "Website":
+                        if user_id is not None:
+                            current_service['Users'][user_id]['Website'] = value
+                            if verbose:
+                                print("Line {0}: Website set to {1}".format(line_number, value))
+                    elif key == "Avatar":
+                        if user_id is not None:
+                            current_service['Users'][user_id]['Avatar'] = value
+                            if verbose:
+                                print("Line {0}: Avatar set to {1}".format(line_number, value))
+                    elif key == "Banner":
+                        if user_id is not None:
+                            current_service['Users'][user_id]['Banner'] = value
+                            if verbose:
+                                print("Line {0}: Banner set to {1}".format(line_number, value))
+                    elif key == "Joined":
+                        if user_id is not None:
+                            current_service['Users'][user_id]['Joined'] = value
+                            if verbose:
+                                print("Line {0}: Joined date set to {1}".format(line_number, value))
+                    elif key == "Birthday":
+                        if user_id is not None:
+                            current_service['Users'][user_id]['Birthday'] = value
+                            if verbose:
+                                print("Line {0}: Birthday set to {1}".format(line_number, value))
+                    elif key == "HashTags":
+                        if user_id is not None:
+                            current_service['Users'][user_id]['HashTags'] = value
+                            if verbose:
+                                print("Line {0}: HashTags set to {1}".format(line_number, value))
+                    elif key == "PinnedMessage":
+                        current_service['PinnedMessage'] = validate_non_negative_integer(value, "PinnedMessage", line_number)
+                        if verbose:
+                            print("Line {0}: Pinned Message set to {1}".format(line_number, value))
+                    elif line == "--- Start ExtraFields Body ---":
+                        if user_id is not None:
+                            current_extrafields = []
+                            in_section['extrafields_body'] = True
+                            if verbose:
+                                print("Line {0}: Starting extrafields body".format(line_number))
+                    elif line == "--- End ExtraFields Body ---":
+                        if user_id is not None and current_extrafields is not None:
+                            current_service['Users'][user_id]['ExtraFields'] = "\n".join(current_extrafields)
+                            current_extrafields = None
+                            in_section['extrafields_body'] = False
+                            if verbose:
+                                print("Line {0}: Ending extrafields body".format(line_number))
+                    elif in_section['extrafields_body'] and current_extrafields is not None:
+                        current_extrafields.append(line)
+                        if verbose:
+                            print("Line {0}: Adding to extrafields body: {1}".format(line_number, line))
+                    elif line == "--- Start Bio Body ---":
+                        if user_id is not None:
+                            current_bio = []
+                            in_section['bio_body'] = True
+                            if verbose:
+                                print("Line {0}: Starting bio body".format(line_number))
+                    elif line == "--- End Bio Body ---":
+                        if user_id is not None and current_bio is not None:
+                            current_service['Users'][user_id]['Bio'] = "\n".join(current_bio)
+                            current_bio = None
+                            in_section['bio_body'] = False
+                            if verbose:
+                                print("Line {0}: Ending bio body".format(line_number))
+                    elif in_section['bio_body'] and current_bio is not None:
+                        current_bio.append(line)
+                        if verbose:
+                            print("Line {0}: Adding to bio body: {1}".format(line_number, line))
+                    elif line == "--- Start Signature Body ---":
+                        if user_id is not None:
+                            current_signature = []
+                            in_section['signature_body'] = True
+                            if verbose:
+                                print("Line {0}: Starting signature body".format(line_number))
+                    elif line == "--- End Signature Body ---":
+                        if user_id is not None and current_signature is not None:
+                            current_service['Users'][user_id]['Signature'] = "\n".join(current_signature)
+                            current_signature = None
+                            in_section['signature_body'] = False
+                            if verbose:
+                                print("Line {0}: Ending signature body".format(line_number))
+                    elif in_section['signature_body'] and current_signature is not None:
+                        current_signature.append(line)
+                        if verbose:
+                            print("Line {0}: Adding to signature body: {1}".format(line_number, line))
+                elif in_section['message_list'] and in_section['message_thread']:
+                    if key == "Thread":
+                        current_thread['Thread'] = validate_non_negative_integer(value, "Thread", line_number)
+                        if verbose:
+                            print("Line {0}: Thread ID set to {1}".format(line_number, value))
+                    elif key == "Category":
+                        current_thread['Category'] = [category.strip() for category in value.split(",")]
+                        if verbose:
+                            print("Line {0}: Category set to {1}".format(line_number, current_thread['Category']))
+                    elif key == "Forum":
+                        current_thread['Forum'] = [forum.strip() for forum in value.split(",")]
+                        if verbose:
+                            print("Line {0}: Forum set to {1}".format(line_number, current_thread['Forum']))
+                    elif key == "Title":
+                        current_thread['Title'] = value
+                        if verbose:
+                            print("Line {0}: Title set to {1}".format(line_number, value))
+                    elif key == "Type":
+                        current_thread['Type'] = value
+                        if verbose:
+                            print("Line {0}: Type set to {1}".format(line_number, value))
+                    elif key == "State":
+                        current_thread['State'] = value
+                        if verbose:
+                            print("Line {0}: State set to {1}".format(line_number, value))
+                    elif key == "Keywords":
+                        current_thread['Keywords'] = value
+                        if verbose:
+                            print("Line {0}: Keywords set to {1}".format(line_number, value))
+                    elif key == "Author":
+                        current_message['Author'] = value
+                        if verbose:
+                            print("Line {0}: Author set to {1}".format(line_number, value))
+                    elif key == "AuthorID":
+                        current_message['AuthorID'] = validate_non_negative_integer(value, "AuthorID", line_number)
+                        if verbose:
+                            print("Line {0}: Author ID set to {1}".format(line_number, value))
+                    elif key == "Time":
+                        current_message['Time'] = value
+                        if verbose:
+                            print("Line {0}: Time set to {1}".format(line_number, value))
+                    elif key == "Date":
+                        current_message['Date'] = value
+                        if verbose:
+                            print("Line {0}: Date set to {1}".format(line_number, value))
+                    elif key == "EditTime":
+                        current_message['EditTime'] = value
+                        if verbose:
+                            print("Line {0}: Edit Time set to {1}".format(line_number, value))
+                    elif key == "EditDate":
+                        current_message['EditDate'] = value
+                        if verbose:
+                            print("Line {0}: Edit Date set to {1}".format(line_number, value))
+                    elif key == "EditAuthor":
+                        current_message['EditAuthor'] = value
+                        if verbose:
+                            print("Line {0}: Edit Author set to {1}".format(line_number, value))
+                    elif key == "EditAuthorID":
+                        current_message['EditAuthorID'] = validate_non_negative_integer(value, "EditAuthorID", line_number)
+                        if verbose:
+                            print("Line {0}: Edit Author ID set to {1}".format(line_number, value))
+                    elif key == "SubType":
+                        current_message['SubType'] = value
+                        if verbose:
+                            print("Line {0}: SubType set to {1}".format(line_number, value))
+                    elif key == "SubTitle":
+                        current_message['SubTitle'] = value
+                        if verbose:
+                            print("Line {0}: SubTitle set to {1}".format(line_number, value))
+                    elif key == "Tags":
+                        current_message['Tags'] = value
+                        if verbose:
+                            print("Line {0}: Tags set to {1}".format(line_number, value))
+                    elif key == "Post":
+                        post_value = validate_non_negative_integer(value, "Post", line_number)
+                        current_message['Post'] = post_value
+                        if 'post_ids' not in current_thread:
+                            current_thread['post_ids'] = []
+                        if post_value not in current_thread['post_ids']:
+                            current_thread['post_ids'].append(post_value)
+                        if verbose:
+                            print("Line {0}: Post ID set to {1}".format(line_number, post_value))
+                    elif key == "PinnedID":
+                        current_message['PinnedID'] = validate_non_negative_integer(value, "PinnedID", line_number)
+                        if verbose:
+                            print("Line {0}: Pinned ID set to {1}".format(line_number, value))
+                    elif key == "Nested":
+                        nested_value = validate_non_negative_integer(value, "Nested", line_number)
+                        if nested_value != 0 and nested_value not in current_thread.get('post_ids', []):
+                            raise ValueError(
+                                "Nested value '{0}' on line {1} does not match any existing Post values in the current thread. Existing Post IDs: {2}".format(
+                                    nested_value, line_number, list(current_thread.get('post_ids', [])))
+                            )
+                        current_message['Nested'] = nested_value
+                        if verbose:
+                            print("Line {0}: Nested set to {1}".format(line_number, nested_value))
+                    elif line == "--- Start Message Body ---":
+                        if current_message is not None:
+                            current_message['Message'] = []
+                            in_section['message_body'] = True
+                            if verbose:
+                                print("Line {0}: Starting message body".format(line_number))
+                    elif line == "--- End Message Body ---":
+                        if current_message is not None and 'Message' in current_message:
+                            current_message['Message'] = "\n".join(current_message['Message'])
+                            in_section['message_body'] = False
+                            if verbose:
+                                print("Line {0}: Ending message body".format(line_number))
+                    elif in_section['message_body'] and current_message is not None and 'Message' in current_message:
+                        current_message['Message'].append(line)
+                        if verbose:
+                            print("Line {0}: Adding to message body: {1}".format(line_number, line))
+
+        if validate_only:
+            return True, "", ""
+
+        return services
+
+    except Exception as e:
+        if validate_only:
+            return False, "Error: {0}".format(str(e)), lines[line_number - 1]
+        else:
+            raise
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Import pytextarchive from this checkout rather than an installed copy.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,54 @@
+import io
+import os
+
+import pytest
+
+from pytextarchive import archive_parser, mini_parser
+from pytextarchive import parse_message_file as pmf
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+@pytest.fixture(params=['utf-16', 'utf-32', 'utf-16-be'])
+def archive(request, tmp_path):
+    with io.open(os.path.join(DATA, 'archive_msgboard_multi_crlf.txt'), encoding='utf-8', newline='') as file:
+        text = file.read()
+    if request.param == 'utf-16-be':
+        data = b'\xfe\xff' + text.encode('utf-16-be')
+    else:
+        data = text.encode(request.param)
+    path = tmp_path / 'archive.txt'
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_streaming_readers_decode_by_bom(archive):
+    services = pmf.parse_file(archive)
+    assert services == pmf.parse_file(os.path.join(DATA, 'archive_msgboard_multi_crlf.txt'))
+    assert list(pmf.iter_services(archive)) == services
+    assert list(pmf.iter_archive_events_from_file(archive))
+
+
+def test_jsonl_from_archive_filename(archive, tmp_path):
+    jsonl = str(tmp_path / 'archive.jsonl')
+    pmf.to_jsonl(archive, jsonl)
+    assert pmf.from_jsonl(jsonl) == pmf.from_json(pmf.to_json(pmf.parse_file(archive)))
+
+
+def test_mini_parsers_decode_by_bom(archive):
+    assert mini_parser.parse_file(archive) == mini_parser.parse_file(os.path.join(DATA, 'archive_msgboard_multi_crlf.txt'))
+    assert archive_parser.parse_txt_archive(archive) == archive_parser.parse_txt_archive(
+        os.path.join(DATA, 'archive_msgboard_multi_crlf.txt'))
+
+
+@pytest.mark.parametrize('suffix', ['.gz', '.bz2', '.xz', '.zz'])
+def test_parsers_share_one_compressed_reader(tmp_path, suffix):
+    plain = os.path.join(DATA, 'archive_msgboard_multi_lf.txt')
+    with io.open(plain, encoding='utf-8') as file:
+        text = file.read()
+    path = str(tmp_path / ('archive.txt' + suffix))
+    pmf.save_compressed_file(text, path)
+    assert pmf.read_archive_bytes(path) == text.encode('utf-8')
+    assert pmf.parse_file(path) == list(pmf.iter_services(path)) == pmf.parse_file(plain)
+    assert mini_parser.parse_file(path) == mini_parser.parse_file(plain)
+    assert archive_parser.parse_txt_archive(path) == archive_parser.parse_txt_archive(plain)
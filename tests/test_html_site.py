@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from pytextarchive import parse_message_file as pmf
+
+ARCHIVE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data',
+                       'archive_msgboard_multi_lf.txt')
+
+
+def _pages(directory):
+    pages = set()
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith('.html'):
+                pages.add(os.path.relpath(os.path.join(root, name), directory))
+    return pages
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_rebuild_removes_stale_pages(tmp_path, incremental):
+    services = pmf.parse_file(ARCHIVE)
+    assert len(services) > 1
+    site, fresh = str(tmp_path / 'site'), str(tmp_path / 'fresh')
+    pmf.write_html_site(services, site, posts_per_page=1, incremental=incremental)
+    smaller = [dict(services[0], MessageThreads=services[0]['MessageThreads'][:1])]
+    pmf.write_html_site(smaller, site, posts_per_page=2, incremental=incremental)
+    pmf.write_html_site(smaller, fresh, posts_per_page=2)
+    assert _pages(site) == _pages(fresh)
+    assert not os.path.exists(os.path.join(site, 'service-2'))
+
+
+def test_incremental_rebuild_from_archive(tmp_path):
+    site, fresh = str(tmp_path / 'site'), str(tmp_path / 'fresh')
+    pmf.write_html_site(ARCHIVE, site, incremental=True)
+    pmf.write_html_site(ARCHIVE, site, incremental=True)
+    pmf.write_html_site(ARCHIVE, fresh)
+    assert _pages(site) == _pages(fresh)
+    for page in _pages(fresh):
+        with open(os.path.join(site, page), 'rb') as built, open(os.path.join(fresh, page), 'rb') as wanted:
+            assert built.read() == wanted.read()
+
+
+def test_incremental_rebuild_parses_only_appended_services(tmp_path, monkeypatch):
+    with open(ARCHIVE, 'rb') as file:
+        data = file.read()
+    cut = data.index(b'--- Start Archive Service ---', data.index(b'--- End Archive Service ---'))
+    archive, site, fresh = str(tmp_path / 'live.txt'), str(tmp_path / 'site'), str(tmp_path / 'fresh')
+    with open(archive, 'wb') as file:
+        file.write(data[:cut])
+    pmf.write_html_site(archive, site, incremental=True)
+    with open(archive, 'wb') as file:
+        file.write(data)
+    parsed = []
+    resume = pmf._iter_resumed_services
+
+    def counting(*args, **kwargs):
+        for service in resume(*args, **kwargs):
+            parsed.append(service)
+            yield service
+
+    monkeypatch.setattr(pmf, '_iter_resumed_services', counting)
+    pmf.write_html_site(archive, site, incremental=True)
+    assert parsed == pmf.parse_file(archive)[1:]
+    pmf.write_html_site(archive, fresh)
+    assert _pages(site) == _pages(fresh)
+    for page in _pages(fresh):
+        with open(os.path.join(site, page), 'rb') as built, open(os.path.join(fresh, page), 'rb') as wanted:
+            assert built.read() == wanted.read()
+    # A missing page of a service before the resume point means parsing it again.
+    os.remove(os.path.join(site, 'service-1', 'index.html'))
+    del parsed[:]
+    pmf.write_html_site(archive, site, incremental=True)
+    assert parsed == pmf.parse_file(archive)
+    assert os.path.exists(os.path.join(site, 'service-1', 'index.html'))
@@ -0,0 +1,85 @@
+import io
+import os
+import threading
+
+import pytest
+
+from pytextarchive import parse_message_file as pmf
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def _write(path, text):
+    with io.open(str(path), 'w', encoding='utf-8') as file:
+        file.write(text)
+
+
+def _include(path):
+    return '--- Include Service Start ---\n{0}\n--- Include Service End ---\n'.format(path)
+
+
+def _copy(name, path, mtime):
+    with io.open(os.path.join(DATA, name), encoding='utf-8') as file:
+        _write(path, file.read())
+    os.utime(str(path), (mtime, mtime))
+
+
+@pytest.fixture
+def resolver():
+    resolver = pmf.get_include_resolver()
+    cache_bytes = resolver.cache_bytes
+    resolver.clear_cache()
+    yield resolver
+    pmf.set_include_cache_size(cache_bytes)
+    resolver.clear_cache()
+
+
+def test_changed_nested_include_is_parsed_again(tmp_path, resolver):
+    leaf, middle, top = tmp_path / 'leaf.txt', tmp_path / 'middle.txt', tmp_path / 'top.txt'
+    _copy('archive_msgboard_lf.txt', leaf, 1000000000)
+    _write(middle, _include(leaf))
+    _write(top, _include(middle))
+    before = pmf.parse_file(str(top))
+    assert before == pmf.parse_file(str(leaf))
+    _copy('archive_xtwitter_lf.txt', leaf, 1000000100)
+    assert pmf.parse_file(str(top)) == pmf.parse_file(str(leaf)) != before
+
+
+def test_threads_share_the_resolver(tmp_path, resolver):
+    leaf, top = tmp_path / 'leaf.txt', tmp_path / 'top.txt'
+    _copy('archive_msgboard_multi_lf.txt', leaf, 1000000000)
+    _write(top, _include(leaf) * 3)
+    pmf.set_include_cache_size(0)
+    expected = pmf.parse_file(str(top))
+    errors = []
+
+    def parse():
+        try:
+            for _ in range(20):
+                assert pmf.parse_file(str(top)) == expected
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=parse) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_include_cycle(tmp_path, resolver):
+    first, second = tmp_path / 'first.txt', tmp_path / 'second.txt'
+    _write(first, _include(second))
+    _write(second, _include(first))
+    with pytest.raises(ValueError, match='Include cycle'):
+        pmf.parse_file(str(first))
+
+
+def test_includes_are_parsed_inline_by_default(tmp_path):
+    resolver = pmf.IncludeResolver()
+    leaf = tmp_path / 'leaf.txt'
+    _copy('archive_msgboard_lf.txt', leaf, 1000000000)
+    assert resolver.parse_all([str(leaf)]) == [pmf.parse_file(str(leaf))]
+    assert resolver.max_workers == 1
+    assert resolver._pool is None
@@ -0,0 +1,94 @@
+import io
+import os
+import pickle
+
+import pytest
+
+from pytextarchive import parse_message_file as pmf
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def _services(name='archive_msgboard_multi_lf.txt'):
+    with io.open(os.path.join(DATA, name), 'rb') as file:
+        data = file.read()
+    ends = []
+    start = 0
+    while True:
+        end = data.find(b'--- End Archive Service ---\n', start)
+        if end < 0:
+            return data, ends
+        start = end + len(b'--- End Archive Service ---\n')
+        ends.append(start)
+
+
+def _write(path, data):
+    with io.open(str(path), 'wb') as file:
+        file.write(data)
+
+
+def test_only_appended_services_are_returned(tmp_path):
+    data, ends = _services()
+    archive = str(tmp_path / 'live.txt')
+    expected = pmf.parse_file(os.path.join(DATA, 'archive_msgboard_multi_lf.txt'))
+    # Half of the second service first: it is parsed again once finished.
+    _write(archive, data[:(ends[0] + ends[1]) // 2])
+    services, checkpoint = pmf.parse_file_incremental(archive)
+    assert services == expected[:1] and checkpoint.restarted
+    assert checkpoint.offset == ends[0]
+    _write(archive, data)
+    services, checkpoint = pmf.parse_file_incremental(archive, checkpoint)
+    assert services == expected[1:] and not checkpoint.restarted
+    assert checkpoint.offset == len(data)
+    # Nothing parsed is kept in the checkpoint.
+    assert len(pickle.dumps(checkpoint)) < 1024
+    assert pmf.parse_file_incremental(archive, checkpoint)[0] == []
+
+
+def test_changed_prefix_restarts(tmp_path):
+    data, ends = _services()
+    archive = str(tmp_path / 'live.txt')
+    _write(archive, data)
+    checkpoint = pmf.parse_file_incremental(archive)[1]
+    _write(archive, data.replace(b'Post:', b'Post: ', 1))
+    services, checkpoint = pmf.parse_file_incremental(archive, checkpoint)
+    assert checkpoint.restarted and services == pmf.parse_file(archive)
+
+
+def test_failed_call_keeps_the_checkpoint(tmp_path):
+    data, ends = _services()
+    archive = str(tmp_path / 'live.txt')
+    _write(archive, data[:ends[0]])
+    checkpoint = pmf.parse_file_incremental(archive)[1]
+    broken = data[ends[0]:ends[1]].replace(b'Entry: ', b'Entry: -', 1)
+    _write(archive, data[:ends[0]] + broken)
+    with pytest.raises(ValueError):
+        pmf.parse_file_incremental(archive, checkpoint)
+    assert checkpoint.offset == ends[0]
+    _write(archive, data)
+    services = pmf.parse_file_incremental(archive, checkpoint)[0]
+    assert services == pmf.parse_file(archive)[1:]
+
+
+def test_sidecar_round_trip(tmp_path):
+    data, ends = _services()
+    archive, sidecar = str(tmp_path / 'live.txt'), str(tmp_path / 'live.txt.ckpt')
+    _write(archive, data[:ends[1]])
+    first = pmf.parse_file_incremental(archive, sidecar)[0]
+    _write(archive, data)
+    second, checkpoint = pmf.parse_file_incremental(archive, sidecar)
+    assert first + second == pmf.parse_file(archive)
+    assert pmf.ParseCheckpoint.load(sidecar).offset == checkpoint.offset == len(data)
+
+
+def test_includes_are_parsed_in_full(tmp_path):
+    data, ends = _services()
+    archive, sidecar = str(tmp_path / 'live.txt'), str(tmp_path / 'live.txt.ckpt')
+    _write(archive, data[:ends[0]])
+    pmf.parse_file_incremental(archive, sidecar)
+    leaf = os.path.join(DATA, 'archive_xtwitter_lf.txt')
+    include = '--- Include Service Start ---\n{0}\n--- Include Service End ---\n'.format(leaf)
+    _write(archive, data[:ends[0]] + include.encode('utf-8'))
+    services, checkpoint = pmf.parse_file_incremental(archive, sidecar)
+    assert checkpoint is None and not os.path.exists(sidecar)
+    assert services == pmf.parse_file(archive)
@@ -0,0 +1,43 @@
+import os
+import shutil
+
+import pytest
+
+from pytextarchive import parse_message_file as pmf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARCHIVE = os.path.join(ROOT, 'data', 'archive_msgboard_multi_lf.txt')
+
+
+def test_save_over_lazy_archive_keeps_data(tmp_path):
+    target = str(tmp_path / 'archive.txt')
+    shutil.copy(ARCHIVE, target)
+    services = pmf.parse_file(target, lazy_bodies=True)
+    pmf.save_services_to_file(services, target)
+    reference = str(tmp_path / 'reference.txt')
+    pmf.save_services_to_file(pmf.parse_file(ARCHIVE), reference)
+    with open(target, 'rb') as saved, open(reference, 'rb') as wanted:
+        assert saved.read() == wanted.read()
+
+
+def test_failed_lazy_save_keeps_archive(tmp_path):
+    target = str(tmp_path / 'archive.txt')
+    shutil.copy(ARCHIVE, target)
+    services = pmf.parse_file(target, lazy_bodies=True)
+    with open(target, 'ab') as file:
+        file.write(b'\n')
+    with pytest.raises(ValueError):
+        pmf.save_services_to_file(services, target)
+    with open(target, 'rb') as saved, open(ARCHIVE, 'rb') as original:
+        assert saved.read() == original.read() + b'\n'
+
+
+def test_lazy_results_validate():
+    schema = pmf.load_schema(os.path.join(ROOT, 'format_schema.json'))
+    services = pmf.parse_file(ARCHIVE, lazy_bodies=True)
+    assert pmf.validate_services(services, schema) == (True, "OK")
+
+
+def test_lazy_results_marshal():
+    services = pmf.parse_file(ARCHIVE, lazy_bodies=True)
+    assert pmf.from_marshal(pmf.to_marshal(services)) == pmf.parse_file(ARCHIVE)
@@ -0,0 +1,40 @@
+import os
+import shutil
+
+from pytextarchive import parse_message_file as pmf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARCHIVE = os.path.join(ROOT, 'data', 'archive_msgboard_multi_lf.txt')
+
+
+def test_save_over_mapped_archive(tmp_path):
+    target = str(tmp_path / 'archive.txt')
+    shutil.copy(ARCHIVE, target)
+    services = pmf.parse_file(target, use_mmap=True)
+    expected = pmf.parse_file(ARCHIVE)
+    pmf.save_services_to_file(services, target)
+    reference = str(tmp_path / 'reference.txt')
+    pmf.save_services_to_file(expected, reference)
+    with open(target, 'rb') as saved, open(reference, 'rb') as wanted:
+        assert saved.read() == wanted.read()
+
+
+def test_mapped_results_validate():
+    schema = pmf.load_schema(os.path.join(ROOT, 'format_schema.json'))
+    services = pmf.parse_file(ARCHIVE, use_mmap=True)
+    assert pmf.validate_services(services, schema) == (True, "OK")
+
+
+def test_mapped_results_marshal():
+    services = pmf.parse_file(ARCHIVE, use_mmap=True)
+    assert pmf.from_marshal(pmf.to_marshal(services)) == pmf.parse_file(ARCHIVE)
+
+
+def test_mapped_text_concatenates_like_str():
+    services = pmf.parse_file(ARCHIVE, use_mmap=True)
+    body = services[0]['MessageThreads'][0]['Messages'][0]['Message']
+    assert isinstance(body, pmf.MappedText)
+    text = str(body)
+    assert body + "!" == text + "!"
+    assert "> " + body == "> " + text
+    assert body[:5] == text[:5]
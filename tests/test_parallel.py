@@ -0,0 +1,35 @@
+import io
+import os
+
+from pytextarchive import parse_message_file as pmf
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+class SectionCounter(pmf.ParseStats):
+    def __init__(self):
+        pmf.ParseStats.__init__(self)
+        self.opened = 0
+
+    def start_section(self, section, line_number):
+        pmf.ParseStats.start_section(self, section, line_number)
+        self.opened += 1
+
+
+def _read(name):
+    with io.open(os.path.join(DATA, name), encoding='utf-8') as file:
+        return file.read()
+
+
+def test_sequential_fallback_keeps_hooks(tmp_path):
+    # The first service never ends, so its run is not clean and the merge
+    # falls back to a sequential parse.
+    service = _read('archive_xtwitter_lf.txt')
+    archive = tmp_path / 'archive.txt'
+    with io.open(str(archive), 'w', encoding='utf-8') as file:
+        file.write(service.replace('--- End Archive Service ---', '') + service * 3)
+    hooks = SectionCounter()
+    services = pmf.parse_file_parallel(str(archive), processes=2, hooks=hooks)
+    assert services == pmf.parse_file(str(archive))
+    assert hooks.opened > 0
+    assert hooks.bytes == os.path.getsize(str(archive))
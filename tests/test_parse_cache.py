@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from pytextarchive import parse_message_file as pmf
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+ARCHIVE = os.path.join(DATA, 'archive_msgboard_multi_lf.txt')
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = pmf.enable_parse_cache(str(tmp_path / 'cache'))
+    yield cache
+    pmf.disable_parse_cache()
+
+
+def test_plain_parses_use_the_snapshot(cache, monkeypatch):
+    services = pmf.parse_file(ARCHIVE)
+    monkeypatch.setattr(pmf, '_parse_file', None)
+    assert pmf.parse_file(ARCHIVE) == services
+
+
+@pytest.mark.parametrize('options', [{'use_mmap': True}, {'processes': 2}, {'hooks': True}])
+def test_other_parse_modes_skip_the_cache(cache, monkeypatch, options):
+    services = pmf.parse_file(ARCHIVE)
+    monkeypatch.setattr(cache, 'load', None)
+    if options.get('hooks'):
+        options = {'hooks': pmf.ParseStats()}
+    assert pmf.parse_file(ARCHIVE, **options) == services
+    if 'hooks' in options:
+        assert options['hooks'].lines
+
+
+def test_shared_interner_gets_interned_values(cache):
+    # A snapshot exists, but would hand back values the interner never saw.
+    pmf.parse_file(ARCHIVE)
+    interner = pmf.ValueInterner()
+    first = pmf.parse_file(ARCHIVE, interner=interner)
+    second = pmf.parse_file(ARCHIVE, interner=interner)
+    assert first == second and interner.hits
+    # Both parses share the interned values.
+    assert first[0]['Categories'][0]['Kind'] is second[0]['Categories'][0]['Kind']
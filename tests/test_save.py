@@ -0,0 +1,31 @@
+import io
+import os
+
+import pytest
+
+from pytextarchive import parse_message_file as pmf
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def test_failed_save_keeps_existing_file(tmp_path):
+    services = pmf.parse_file(os.path.join(DATA, 'archive_msgboard_lf.txt'))
+    target = str(tmp_path / 'archive.txt')
+    with io.open(target, 'w', encoding='utf-8') as file:
+        file.write('keep')
+    with pytest.raises(Exception):
+        pmf.save_services_to_file([services[0], object()], target)
+    with io.open(target, encoding='utf-8') as file:
+        assert file.read() == 'keep'
+    assert os.listdir(str(tmp_path)) == ['archive.txt']
+
+
+@pytest.mark.parametrize('name', ['archive.txt.gz', 'archive.txt.bz2'])
+def test_save_compressed_by_final_name(tmp_path, name):
+    services = pmf.parse_file(os.path.join(DATA, 'archive_msgboard_multi_lf.txt'))
+    plain = str(tmp_path / 'archive.txt')
+    target = str(tmp_path / name)
+    pmf.save_services_to_file(services, plain)
+    pmf.save_services_to_file(services, target)
+    assert pmf.read_archive_bytes(target) == pmf.read_archive_bytes(plain)
+    assert sorted(os.listdir(str(tmp_path))) == sorted(['archive.txt', name])
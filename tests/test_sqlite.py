@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+from pytextarchive import parse_message_file as pmf
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+ARCHIVE = os.path.join(DATA, 'archive_msgboard_multi_lf.txt')
+
+pytestmark = pytest.mark.skipif(not pmf.HAS_SQLITE, reason="sqlite3 is not available")
+
+
+def test_failed_save_keeps_the_old_database(tmp_path):
+    path = str(tmp_path / 'archive.db')
+    services = pmf.parse_file(ARCHIVE)
+    pmf.save_to_sqlite(services, path)
+    saved = pmf.load_from_sqlite(path)
+
+    def broken():
+        # Enough for several batches before the error.
+        for service in services:
+            yield service
+        raise ValueError("truncated archive")
+
+    with pytest.raises(ValueError):
+        pmf.save_to_sqlite(broken(), path, batch_size=1)
+    assert pmf.load_from_sqlite(path) == saved
+
+
+def test_author_id_may_be_given_as_text(tmp_path):
+    path = str(tmp_path / 'archive.db')
+    pmf.save_to_sqlite(ARCHIVE, path)
+    found = pmf.find_posts_in_sqlite(path, author_id='1')
+    assert found and found == pmf.find_posts_in_sqlite(path, author_id=1)
+    assert all(post['AuthorID'] == 1 for post in found)
@@ -0,0 +1,19 @@
+import glob
+import io
+import os
+
+import pytest
+
+import cascade_parser
+from pytextarchive import parse_message_file as pmf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARCHIVES = sorted(glob.glob(os.path.join(ROOT, 'data', '*.txt')) + glob.glob(os.path.join(ROOT, 'redata', '*.txt')))
+
+
+@pytest.mark.parametrize('archive', ARCHIVES, ids=os.path.basename)
+def test_table_parser_matches_cascade(archive):
+    with io.open(archive, encoding='utf-8', newline='') as file:
+        lines = file.readlines()
+    assert pmf.parse_lines(lines) == cascade_parser.without_post_ids(cascade_parser.parse_lines(lines))
+    assert pmf.parse_lines(lines, validate_only=True) == cascade_parser.parse_lines(lines, validate_only=True)
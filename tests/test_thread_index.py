@@ -0,0 +1,11 @@
+from pytextarchive import parse_message_file as pmf
+
+
+def test_post_zero_is_not_the_root():
+    posts = [{'Post': 1, 'Nested': 0}, {'Post': 0, 'Nested': 0}, {'Post': 2, 'Nested': 1}]
+    index = pmf.ThreadIndex(posts)
+    assert index.replies_to() == [posts[0], posts[1]]
+    assert index.replies_to(0) == []
+    assert [(depth, post['Post']) for depth, post in index.walk()] == [(0, 1), (1, 2), (0, 0)]
+    assert index.parent(2) is posts[0]
+    assert index.parent(0) is None
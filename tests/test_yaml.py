@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+from pytextarchive import parse_message_file as pmf
+
+yaml = pytest.importorskip('yaml')
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def test_global_safe_dumper_is_untouched():
+    for kind in (pmf.MappedText, pmf.LazyText):
+        assert kind not in yaml.SafeDumper.yaml_representers
+    assert pmf.Record not in yaml.SafeDumper.yaml_multi_representers
+
+
+def test_records_and_shared_lists_dump_as_plain_yaml():
+    filename = os.path.join(DATA, 'archive_msgboard_multi_lf.txt')
+    plain = pmf.parse_file(filename)
+    compact = pmf.parse_file(filename, records=True, interner=True)
+    assert yaml.safe_load(pmf.to_yaml(compact)) == yaml.safe_load(pmf.to_yaml(plain))
+    assert '&id' not in pmf.to_yaml(compact)